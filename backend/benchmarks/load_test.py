@@ -0,0 +1,441 @@
+# load_test.py - Drive /post-audio/ at several concurrency levels against local mock Groq/ElevenLabs servers
+#
+# cd backend
+# python benchmarks/load_test.py --concurrency 1 4 8 --requests 40
+# python benchmarks/load_test.py --no-stream --json results.json
+# python benchmarks/load_test.py --baseline results.json --tolerance 0.2
+#
+# The server under test is started as a subprocess (uvicorn main:app) pointed
+# at the mocks, so no network access or API keys are needed. The environment
+# is passed through, e.g. STT_WORKERS=2 python benchmarks/load_test.py
+
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import httpx
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.mock_upstreams import add_mock_arguments, mock_arguments
+from benchmarks.stt_backends import AUDIO_EXTENSIONS, FIXTURES_DIR
+from functions.audio_io import SAMPLE_RATE
+
+PERCENTILES = (50, 90, 99)
+# Server histograms summarized per concurrency level (deltas of /metrics scrapes)
+SERVER_HISTOGRAMS = ("voice_stage_duration_seconds", "voice_turn_latency_seconds")
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, p):
+    """Linear interpolation between closest ranks"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(values):
+    summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    summary["mean"] = sum(values) / len(values) if values else None
+    return summary
+
+
+def parse_server_timing(header):
+    """'upload;dur=1.2, stt;dur=340.5' -> {"upload": 1.2, "stt": 340.5} (ms)"""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        match = re.search(r"dur=([\d.]+)", params)
+        if name and match:
+            stages[name] = float(match.group(1))
+    return stages
+
+
+def parse_histograms(text, names=SERVER_HISTOGRAMS):
+    """Prometheus text -> {(name, labels without le): {le: cumulative count}}"""
+    histograms = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match or not match.group(1).endswith("_bucket"):
+            continue
+        name = match.group(1)[:-len("_bucket")]
+        if name not in names:
+            continue
+        labels = dict(_LABEL.findall(match.group(2)))
+        le = float(labels.pop("le"))
+        key = (name, tuple(sorted(labels.items())))
+        histograms.setdefault(key, {})[le] = float(match.group(3))
+    return histograms
+
+
+def histogram_quantile(q, buckets):
+    """Estimate a quantile from cumulative buckets, like PromQL's histogram_quantile"""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    target = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= target:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (target - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def server_stage_report(before, after):
+    """Per-stage quantiles (ms) of the turns served between two /metrics scrapes"""
+    report = {}
+    for key, buckets in after.items():
+        name, labels = key
+        earlier = before.get(key, {})
+        delta = {le: count - earlier.get(le, 0.0) for le, count in buckets.items()}
+        if delta[max(delta)] <= 0:
+            continue
+        labels = dict(labels)
+        # Stage durations by name, marks (time since the start of the turn) as @event
+        label = labels["stage"] if "stage" in labels else f"@{labels.get('event')}"
+        label = f"{label} [{labels.get('mode')}]"
+        report[label] = {
+            f"p{p}": round(histogram_quantile(p / 100, delta) * 1000, 1) for p in PERCENTILES
+        }
+        report[label]["count"] = int(delta[max(delta)])
+    return dict(sorted(report.items()))
+
+
+class Process:
+    """A subprocess that is terminated when the load test ends"""
+
+    def __init__(self, args, env=None, log_path=None):
+        self.log = open(log_path, "wb") if log_path else subprocess.DEVNULL
+        self.proc = subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        if self.log is not subprocess.DEVNULL:
+            self.log.close()
+
+
+async def wait_until(url, timeout, ok=lambda response: response.status_code == 200):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.monotonic() < deadline:
+            try:
+                if ok(await client.get(url)):
+                    return True
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    return False
+
+
+async def one_request(client, url, fixture, session_id, stream, audio_format=None):
+    name, data = fixture
+    started = time.perf_counter()
+    result = {"fixture": name, "status": None, "stages_ms": {}}
+    params = {"session_id": session_id, "stream": str(stream).lower()}
+    if audio_format:
+        params["format"] = audio_format
+    try:
+        async with client.stream(
+            "POST",
+            url,
+            params=params,
+            files={"file": (name, data, "application/octet-stream")},
+        ) as response:
+            result["status"] = response.status_code
+            result["stages_ms"] = parse_server_timing(response.headers.get("server-timing"))
+            size = 0
+            async for chunk in response.aiter_bytes():
+                if size == 0 and chunk:
+                    result["ttfb_ms"] = (time.perf_counter() - started) * 1000
+                size += len(chunk)
+            result["bytes"] = size
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+async def run_level(base_url, fixtures, concurrency, requests, stream, timeout, audio_format=None):
+    """Send `requests` uploads with `concurrency` clients, each with its own session"""
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(fixtures[index % len(fixtures)])
+    results = []
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        for user in range(concurrency):
+            await client.get(f"{base_url}/reset", params={"session_id": f"load-{concurrency}-{user}"})
+
+        async def user_loop(user):
+            session_id = f"load-{concurrency}-{user}"
+            while not queue.empty():
+                fixture = queue.get_nowait()
+                results.append(await one_request(
+                    client, f"{base_url}/post-audio/", fixture, session_id, stream, audio_format
+                ))
+
+        before = parse_histograms((await client.get(f"{base_url}/metrics")).text)
+        started = time.perf_counter()
+        await asyncio.gather(*(user_loop(user) for user in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        after = parse_histograms((await client.get(f"{base_url}/metrics")).text)
+        groq_limits = (await client.get(f"{base_url}/stats")).json().get("groq_limits")
+
+    ok = [result for result in results if result["status"] == 200 and "error" not in result]
+    stage_names = sorted({stage for result in ok for stage in result["stages_ms"]})
+    errors = {}
+    for result in results:
+        if result not in ok:
+            reason = result.get("error") or f"HTTP {result['status']}"
+            errors[reason] = errors.get(reason, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "ttfb_ms": summarize([result["ttfb_ms"] for result in ok if "ttfb_ms" in result]),
+        "total_ms": summarize([result["total_ms"] for result in ok]),
+        "reply_bytes": summarize([result["bytes"] for result in ok]),
+        "server_timing_ms": {
+            stage: summarize([result["stages_ms"][stage] for result in ok if stage in result["stages_ms"]])
+            for stage in stage_names
+        },
+        "server_histograms_ms": server_stage_report(before, after),
+        "groq_limits": groq_limits,
+    }
+
+
+def _ms(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def print_level(level):
+    print(f"\n👥 concurrency {level['concurrency']}: {level['ok']}/{level['requests']} ok in {level['elapsed_s']:.1f}s"
+          f" → {level['throughput_rps']:.2f} req/s")
+    for reason, count in level["errors"].items():
+        print(f"   ❌ {count} × {reason}")
+    limits = level.get("groq_limits")
+    if limits and (limits["queued"] or limits["rate_limited"]):
+        print(f"   🚦 Groq budget: {limits['queued']} queued ({limits['waited_seconds']:.1f}s total), "
+              f"{limits['rate_limited']} × 429, {limits['gave_up']} gave up (server totals)")
+    if level["reply_bytes"]["mean"] is not None:
+        print(f"   📦 reply audio: {level['reply_bytes']['mean'] / 1024:.1f} KiB on average")
+    header = "".join(f"{f'p{p}':>8}" for p in PERCENTILES)
+    print(f"   {'client (ms)':<28}{header}")
+    for label, summary in (("time to first byte", level["ttfb_ms"]), ("total", level["total_ms"])):
+        print(f"   {label:<28}" + "".join(f"{_ms(summary[f'p{p}']):>8}" for p in PERCENTILES))
+    if level["server_timing_ms"]:
+        print(f"   {'Server-Timing (ms)':<28}{header}")
+        for stage, summary in level["server_timing_ms"].items():
+            print(f"   {stage:<28}" + "".join(f"{_ms(summary[f'p{p}']):>8}" for p in PERCENTILES))
+    if level["server_histograms_ms"]:
+        print(f"   {'server /metrics (ms, est.)':<28}{header}")
+        for label, summary in level["server_histograms_ms"].items():
+            print(f"   {label:<28}" + "".join(f"{_ms(summary[f'p{p}']):>8}" for p in PERCENTILES))
+
+
+def compare(results, baseline, tolerance):
+    """Regressions: p90 total latency or throughput worse than the baseline by more than `tolerance`"""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in results["levels"]:
+        old = previous.get(level["concurrency"])
+        if not old:
+            continue
+        new_p90, old_p90 = level["total_ms"]["p90"], old["total_ms"]["p90"]
+        if new_p90 and old_p90 and new_p90 > old_p90 * (1 + tolerance):
+            regressions.append(f"concurrency {level['concurrency']}: p90 total {old_p90:.0f} → {new_p90:.0f} ms")
+        if old["throughput_rps"] and level["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"concurrency {level['concurrency']}: throughput {old['throughput_rps']:.2f} → {level['throughput_rps']:.2f} req/s"
+            )
+    return regressions
+
+
+def load_fixtures(paths):
+    fixtures = []
+    for path in paths:
+        with open(path, "rb") as f:
+            fixtures.append((os.path.basename(path), f.read()))
+    return fixtures
+
+
+def synthetic_fixture(seconds=3.0, seed=0):
+    """A deterministic speech-like WAV (voiced syllables and pauses) for when no fixtures are available.
+
+    It gets past VAD trimming, so the server runs the whole pipeline; the
+    transcript is meaningless, which doesn't matter against the mocks.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 20 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(phase * harmonic) / harmonic for harmonic in range(1, 6))
+    # ~4 syllables a second, with a pause every few syllables
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.6 * t) > -0.6)
+    pcm = 0.25 * voice * envelope + rng.normal(0, 0.002, len(t))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(pcm, -1, 1) * 32767).astype("<i2").tobytes())
+    return f"synthetic-{seconds:g}s.wav", buffer.getvalue()
+
+
+async def run(args, fixtures):
+    workdir = tempfile.mkdtemp(prefix="voice-load-")
+    mock_port = args.mock_port or free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    processes = []
+    try:
+        processes.append(Process(
+            [sys.executable, os.path.join(BENCHMARKS_DIR, "mock_upstreams.py"), "--port", str(mock_port),
+             "--seed", str(args.seed)] + mock_arguments(args),
+            log_path=os.path.join(workdir, "mock.log"),
+        ))
+        if not await wait_until(f"{mock_url}/mock/stats", 30):
+            print("❌ Mock upstream server did not start")
+            return None
+
+        base_url = args.server_url
+        if base_url is None:
+            port = args.port or free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            env = dict(os.environ)
+            env.update({
+                "GROQ_BASE_URL": mock_url,
+                "ELEVEN_LABS_BASE_URL": mock_url,
+                "GROQ_API_KEY": "load-test",
+                "ELEVEN_LABS_API_KEY": "load-test",
+                "CONVERSATION_DB": os.path.join(workdir, "conversations.db"),
+                "CONVERSATION_LOG_DIR": os.path.join(workdir, "conversation_log"),
+                "TTS_CACHE_DIR": os.path.join(workdir, "tts_cache"),
+                "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+            })
+            if not args.caches:
+                # Every request should exercise STT and TTS, not replay a cached result
+                env.setdefault("STT_CACHE_ENABLED", "false")
+                env.setdefault("TTS_CACHE_ENABLED", "false")
+            processes.append(Process(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                env=env,
+                log_path=os.path.join(workdir, "server.log"),
+            ))
+            print(f"🚀 Starting the server (logs in {workdir})")
+        print(f"⏳ Waiting for {base_url}/readyz")
+        if not await wait_until(f"{base_url}/readyz", args.ready_timeout):
+            print(f"❌ Server did not become ready within {args.ready_timeout:.0f}s")
+            return None
+
+        # One unmeasured request per fixture so lazy initialization isn't measured
+        await run_level(base_url, fixtures, 1, len(fixtures), args.stream, args.timeout, args.format)
+
+        results = {"stream": args.stream, "format": args.format, "fixtures": [name for name, _ in fixtures], "levels": []}
+        for concurrency in args.concurrency:
+            level = await run_level(
+                base_url, fixtures, concurrency, args.requests, args.stream, args.timeout, args.format
+            )
+            print_level(level)
+            results["levels"].append(level)
+        return results
+    finally:
+        for process in reversed(processes):
+            process.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /post-audio/ against mock Groq and ElevenLabs servers")
+    parser.add_argument("files", nargs="*", help=f"audio files (default: everything in {FIXTURES_DIR})")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="concurrent clients per level")
+    parser.add_argument("--requests", type=int, default=32, help="uploads per concurrency level")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="request sentence-by-sentence streaming (?stream=true)")
+    parser.add_argument("--format", default=None, help="reply audio format to request (?format=mp3|mp3_low|opus)")
+    parser.add_argument("--caches", action="store_true", help="leave the STT and TTS caches enabled")
+    parser.add_argument("--server-url", default=None,
+                        help="test an already running server instead (it must point at the mocks itself)")
+    parser.add_argument("--port", type=int, default=None, help="port for the spawned server (default: any free port)")
+    parser.add_argument("--mock-port", type=int, default=None, help="port for the mock upstreams (default: any free port)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the mock latency jitter")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--ready-timeout", type=float, default=600, help="seconds to wait for the speech model")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the results to this file")
+    parser.add_argument("--baseline", default=None, help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown relative to the baseline")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    paths = args.files or sorted(
+        path for path in glob.glob(os.path.join(FIXTURES_DIR, "*")) if path.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    if paths:
+        fixtures = load_fixtures(paths)
+    else:
+        print(f"⚠️  No fixture audio found in {FIXTURES_DIR} (see fixtures/README.md), using a generated clip")
+        fixtures = [synthetic_fixture()]
+    print(f"🎧 {len(fixtures)} fixture(s), concurrency {args.concurrency}, {args.requests} requests per level")
+
+    results = asyncio.run(run(args, fixtures))
+    if results is None:
+        return 1
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ Regressions beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print(f"\n✅ Within {args.tolerance:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+# mock_upstreams.py - Local stand-ins for the Groq chat and ElevenLabs TTS APIs, with configurable latency
+#
+# cd backend
+# python benchmarks/mock_upstreams.py --port 8100 --llm-first-token-ms 150 --jitter 0.2
+# python benchmarks/mock_upstreams.py --port 8100 --rpm-limit 30 --tpm-limit 6000
+# python benchmarks/mock_upstreams.py --port 8100 --reject-formats opus_48000_32
+# GROQ_BASE_URL=http://127.0.0.1:8100 ELEVEN_LABS_BASE_URL=http://127.0.0.1:8100 uvicorn main:app
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import uvicorn
+
+REPLIES = (
+    "That sounds great, Noufal. Are you looking for a family car or something sporty for the city?",
+    "We have a lovely three bedroom house near the park. Would you like to book a visit this weekend?",
+    "Good choice! The hybrid model saves a lot on fuel. What budget do you have in mind?",
+    "I can arrange a test drive tomorrow morning. Does ten o'clock work for you?",
+)
+
+# Roughly 128 kbit/s MP3 at ~15 spoken characters per second
+MP3_BYTES_PER_CHAR = 1000
+# MPEG-1 Layer III frame header, so the payload at least looks like MP3
+MP3_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+# Ogg page capture pattern for Opus output
+OGG_PAGE = b"OggS" + bytes(412)
+DEFAULT_OUTPUT_FORMAT = "mp3_44100_128"
+
+
+class Latency:
+    """A delay in milliseconds with proportional random jitter"""
+
+    def __init__(self, ms, jitter):
+        self.ms = ms
+        self.jitter = jitter
+
+    async def sleep(self):
+        if self.ms <= 0:
+            return
+        spread = self.ms * self.jitter
+        await asyncio.sleep(max(0.0, random.uniform(self.ms - spread, self.ms + spread)) / 1000)
+
+
+class MockLimit:
+    """A per-minute budget reported like Groq's x-ratelimit-* headers (0 = unlimited)"""
+
+    def __init__(self, name, per_minute):
+        self.name = name
+        self.limit = per_minute
+        self.remaining = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.remaining = min(self.limit, self.remaining + self.limit / 60 * (now - self.updated))
+        self.updated = now
+
+    def wait_for(self, cost):
+        """Seconds until cost fits (0 and charged if it fits now)"""
+        if not self.limit:
+            return 0.0
+        self._refill()
+        cost = min(cost, self.limit)
+        if self.remaining >= cost:
+            self.remaining -= cost
+            return 0.0
+        return (cost - self.remaining) / (self.limit / 60)
+
+    def headers(self):
+        if not self.limit:
+            return {}
+        self._refill()
+        return {
+            f"x-ratelimit-limit-{self.name}": str(self.limit),
+            f"x-ratelimit-remaining-{self.name}": str(int(self.remaining)),
+            f"x-ratelimit-reset-{self.name}": f"{(self.limit - self.remaining) / (self.limit / 60):.2f}s",
+        }
+
+
+def _count_tokens(messages):
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+
+def _fake_audio(text, output_format):
+    """Silence-sized payload for an ElevenLabs output_format such as "mp3_22050_32" or "opus_48000_64" """
+    codec, _, kbps = output_format.rpartition("_")
+    frame = OGG_PAGE if codec.startswith("opus") else MP3_FRAME
+    size = max(len(frame), len(text) * MP3_BYTES_PER_CHAR * int(kbps) // 128)
+    return (frame * (size // len(frame) + 1))[:size]
+
+
+def _media_type(output_format):
+    return "audio/ogg" if output_format.startswith("opus") else "audio/mpeg"
+
+
+def create_app(llm_first_token, llm_token, tts_first_byte, tts_chunk, tts_chunk_bytes=4096, rpm_limit=0, tpm_limit=0,
+               reject_formats=()):
+    app = FastAPI()
+    counters = {"chat": 0, "tts": 0, "rate_limited": 0, "formats": {}}
+    limits = (MockLimit("requests", rpm_limit), MockLimit("tokens", tpm_limit))
+
+    def check_format(output_format):
+        """Count the format, or return the 403 ElevenLabs sends for formats not on the plan"""
+        if output_format in reject_formats:
+            return JSONResponse(status_code=403, content={"detail": {
+                "status": "output_format_not_allowed",
+                "message": f"The output format {output_format} is not available on your subscription.",
+            }})
+        counters["formats"][output_format] = counters["formats"].get(output_format, 0) + 1
+        return None
+
+    def pick_reply():
+        counters["chat"] += 1
+        return REPLIES[counters["chat"] % len(REPLIES)]
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt_tokens = _count_tokens(body.get("messages", []))
+        retry_after = max(limit.wait_for(1 if limit.name == "requests" else prompt_tokens) for limit in limits)
+        rate_headers = {key: value for limit in limits for key, value in limit.headers().items()}
+        if retry_after:
+            counters["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                headers={**rate_headers, "retry-after": str(int(retry_after) + 1)},
+            )
+
+        reply = pick_reply()
+        words = reply.split(" ")
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        await llm_first_token.sleep()
+
+        if not body.get("stream"):
+            # The whole completion is generated before the response is sent
+            for _ in words[1:]:
+                await llm_token.sleep()
+            return JSONResponse(headers=rate_headers, content={
+                "id": f"chatcmpl-mock-{counters['chat']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        async def events():
+            for index, word in enumerate(words):
+                if index:
+                    await llm_token.sleep()
+                delta = word if index == 0 else " " + word
+                chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": delta}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"usage": usage},
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=rate_headers)
+
+    @app.post("/text-to-speech/{voice_id}")
+    async def text_to_speech(voice_id: str, request: Request, output_format: str = Query(DEFAULT_OUTPUT_FORMAT)):
+        body = await request.json()
+        rejected = check_format(output_format)
+        if rejected:
+            return rejected
+        counters["tts"] += 1
+        audio = _fake_audio(body.get("text", ""), output_format)
+        await tts_first_byte.sleep()
+        for _ in range(len(audio) // tts_chunk_bytes):
+            await tts_chunk.sleep()
+        return Response(audio, media_type=_media_type(output_format))
+
+    @app.post("/text-to-speech/{voice_id}/stream")
+    async def text_to_speech_stream(voice_id: str, request: Request, output_format: str = Query(DEFAULT_OUTPUT_FORMAT)):
+        body = await request.json()
+        rejected = check_format(output_format)
+        if rejected:
+            return rejected
+        counters["tts"] += 1
+        audio = _fake_audio(body.get("text", ""), output_format)
+
+        async def chunks():
+            await tts_first_byte.sleep()
+            for offset in range(0, len(audio), tts_chunk_bytes):
+                if offset:
+                    await tts_chunk.sleep()
+                yield audio[offset:offset + tts_chunk_bytes]
+
+        return StreamingResponse(chunks(), media_type=_media_type(output_format))
+
+    @app.get("/mock/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def add_mock_arguments(parser):
+    """Latency and rate limit options shared with load_test.py"""
+    parser.add_argument("--llm-first-token-ms", type=float, default=200, help="Groq time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=15, help="Groq delay between streamed tokens")
+    parser.add_argument("--tts-first-byte-ms", type=float, default=250, help="ElevenLabs time to first audio byte")
+    parser.add_argument("--tts-chunk-ms", type=float, default=20, help="ElevenLabs delay between 4 KiB audio chunks")
+    parser.add_argument("--jitter", type=float, default=0.2, help="random spread as a fraction of each delay")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="Groq requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--tpm-limit", type=int, default=0, help="Groq prompt tokens per minute before 429s (0 = unlimited)")
+    parser.add_argument("--reject-formats", nargs="*", default=[],
+                        help="ElevenLabs output formats to refuse with a 403 (e.g. opus_48000_32)")
+
+
+def mock_arguments(args):
+    """Command-line flags that reproduce the parsed mock options"""
+    return [
+        "--llm-first-token-ms", str(args.llm_first_token_ms),
+        "--llm-token-ms", str(args.llm_token_ms),
+        "--tts-first-byte-ms", str(args.tts_first_byte_ms),
+        "--tts-chunk-ms", str(args.tts_chunk_ms),
+        "--jitter", str(args.jitter),
+        "--rpm-limit", str(args.rpm_limit),
+        "--tpm-limit", str(args.tpm_limit),
+        "--reject-formats", *args.reject_formats,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve mock Groq and ElevenLabs APIs on one port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--seed", type=int, default=None, help="seed the jitter for repeatable runs")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app = create_app(
+        Latency(args.llm_first_token_ms, args.jitter),
+        Latency(args.llm_token_ms, args.jitter),
+        Latency(args.tts_first_byte_ms, args.jitter),
+        Latency(args.tts_chunk_ms, args.jitter),
+        rpm_limit=args.rpm_limit,
+        tpm_limit=args.tpm_limit,
+        reject_formats=set(args.reject_formats),
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
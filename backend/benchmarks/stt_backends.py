@@ -0,0 +1,275 @@
+# stt_backends.py - Benchmark STT engines (load time, real-time factor, peak RSS, WER) on fixture audio
+#
+# cd backend
+# python benchmarks/stt_backends.py
+# python benchmarks/stt_backends.py --backends faster-whisper --model small --compute-type int8 --repeat 5
+# python benchmarks/stt_backends.py --json base.json
+# python benchmarks/stt_backends.py --model tiny --baseline base.json
+#
+# Each backend runs in its own process, so load time and peak RSS aren't
+# affected by the engines measured before it.
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from functions.audio_io import SAMPLE_RATE, decode_audio
+from functions.stt_backends import DEFAULT_OPTIONS, STT_BACKENDS, STT_MODEL, create_backend
+from functions.vad import VAD_SETTINGS, trim_silence
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".webm", ".ogg", ".m4a", ".flac")
+# Pause inserted between clips when building the long fixture
+LONG_CLIP_GAP_SECONDS = 0.8
+
+
+def load_fixtures(paths):
+    """Decode each fixture once; returns [{"name", "category", "pcm", "reference"}]"""
+    fixtures = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pcm = decode_audio(f.read())
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, "r", encoding="utf-8") as f:
+                reference = f.read().strip()
+        fixtures.append({"name": os.path.basename(path), "category": "short", "pcm": pcm, "reference": reference})
+    return fixtures
+
+
+def build_long_fixture(fixtures, min_seconds):
+    """Concatenate the short clips (with pauses) until the result is at least min_seconds long.
+
+    Long inputs exercise Whisper's 30 s windowing, which short recordings never reach.
+    """
+    gap = np.zeros(int(LONG_CLIP_GAP_SECONDS * SAMPLE_RATE), dtype=np.float32)
+    pieces, references, seconds = [], [], 0.0
+    while seconds < min_seconds:
+        for fixture in fixtures:
+            pieces.extend([fixture["pcm"], gap])
+            references.append(fixture["reference"])
+            seconds += len(fixture["pcm"]) / SAMPLE_RATE + LONG_CLIP_GAP_SECONDS
+            if seconds >= min_seconds:
+                break
+    reference = " ".join(references) if all(ref is not None for ref in references) else None
+    return {"name": f"long-{seconds:.0f}s", "category": "long", "pcm": np.concatenate(pieces), "reference": reference}
+
+
+def normalize(text):
+    return " ".join("".join(c for c in text.lower() if c.isalnum() or c.isspace()).split())
+
+
+def word_errors(hypothesis, reference):
+    """Word-level edit distance (substitutions + deletions + insertions) and the reference length"""
+    hyp, ref = normalize(hypothesis).split(), normalize(reference).split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def transcribe_like_server(backend, pcm, options, vad):
+    """The convert_audio_to_text path after decoding: trim silence, then transcribe"""
+    if vad:
+        pcm, _ = trim_silence(pcm)
+        if pcm is None:
+            return "", 0.0
+    return backend.transcribe(pcm, options), len(pcm) / SAMPLE_RATE
+
+
+def benchmark_backend(name, fixtures, repeat, backend_kwargs, options, vad):
+    print(f"\n⏱️ {name}", flush=True)
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    try:
+        backend = create_backend(name, **backend_kwargs).load()
+    except ImportError as e:
+        print(f"⚠️ Skipping {name}: {e}")
+        return None
+    load_seconds = time.perf_counter() - started
+    rss_loaded = peak_rss_mb()
+    print(f"   {backend.capabilities()}")
+    print(f"   loaded in {load_seconds:.2f}s")
+
+    # Warm up once so the first measured run doesn't pay for lazy initialization
+    backend.transcribe(fixtures[0]["pcm"], options)
+
+    clips = []
+    for fixture in fixtures:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            text, transcribed_seconds = transcribe_like_server(backend, fixture["pcm"], options, vad)
+            timings.append(time.perf_counter() - started)
+        duration = len(fixture["pcm"]) / SAMPLE_RATE
+        median = statistics.median(timings)
+        clip = {
+            "name": fixture["name"],
+            "category": fixture["category"],
+            "audio_s": round(duration, 3),
+            "transcribed_s": round(transcribed_seconds, 3),
+            "median_s": round(median, 4),
+            "rtf": round(median / duration, 4) if duration else 0.0,
+            "text": text,
+        }
+        wer = ""
+        if fixture["reference"] is not None:
+            clip["errors"], clip["reference_words"] = word_errors(text, fixture["reference"])
+            clip["wer"] = round(clip["errors"] / clip["reference_words"], 4) if clip["reference_words"] else 0.0
+            wer = f", WER {clip['wer']:.1%}"
+        clips.append(clip)
+        print(f"   {fixture['name']}: {duration:.1f}s audio in {median * 1000:.0f} ms (RTF {clip['rtf']:.3f}{wer}) {text!r}",
+              flush=True)
+
+    def aggregate(selected):
+        audio = sum(clip["audio_s"] for clip in selected)
+        scored = [clip for clip in selected if "wer" in clip]
+        reference_words = sum(clip["reference_words"] for clip in scored)
+        return {
+            "clips": len(selected),
+            "audio_s": round(audio, 3),
+            "rtf": round(sum(clip["median_s"] for clip in selected) / audio, 4) if audio else 0.0,
+            "wer": round(sum(clip["errors"] for clip in scored) / reference_words, 4) if reference_words else None,
+        }
+
+    return {
+        "backend": name,
+        "capabilities": backend.capabilities(),
+        "load_s": round(load_seconds, 3),
+        "rss_before_load_mb": rss_before,
+        "rss_after_load_mb": rss_loaded,
+        "peak_rss_mb": peak_rss_mb(),
+        **aggregate(clips),
+        "by_category": {
+            category: aggregate([clip for clip in clips if clip["category"] == category])
+            for category in sorted({clip["category"] for clip in clips})
+        },
+        "clips": clips,
+    }
+
+
+def compare(results, baseline, tolerance, wer_tolerance):
+    """Regressions against an earlier results file, per backend"""
+    previous = {result["backend"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        old = previous.get(result["backend"])
+        if not old:
+            continue
+        for key, unit in (("rtf", ""), ("load_s", " s"), ("peak_rss_mb", " MB")):
+            if old.get(key) and result.get(key) and result[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{result['backend']}: {key} {old[key]}{unit} → {result[key]}{unit}")
+        if old.get("wer") is not None and result.get("wer") is not None and result["wer"] > old["wer"] + wer_tolerance:
+            regressions.append(f"{result['backend']}: WER {old['wer']:.1%} → {result['wer']:.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark STT backends on fixture audio")
+    parser.add_argument("files", nargs="*", help=f"audio files (default: everything in {FIXTURES_DIR})")
+    parser.add_argument("--backends", nargs="+", default=list(STT_BACKENDS), choices=list(STT_BACKENDS))
+    parser.add_argument("--model", default=STT_MODEL)
+    parser.add_argument("--compute-type", default=None, help="faster-whisper compute type (default: STT_COMPUTE_TYPE)")
+    parser.add_argument("--beam-size", type=int, default=DEFAULT_OPTIONS["beam_size"])
+    parser.add_argument("--language", default=DEFAULT_OPTIONS["language"], help="fixed language code (default: auto-detect)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per file; the median is reported")
+    parser.add_argument("--long-seconds", type=float, default=45,
+                        help="also transcribe the fixtures joined into one clip at least this long (0 to skip)")
+    parser.add_argument("--no-vad", dest="vad", action="store_false", help="skip silence trimming before the model")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the results to this file")
+    parser.add_argument("--baseline", default=None, help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase of RTF, load time and RSS")
+    parser.add_argument("--wer-tolerance", type=float, default=0.01, help="allowed absolute increase of WER")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(
+        path for path in glob.glob(os.path.join(FIXTURES_DIR, "*")) if path.lower().endswith(AUDIO_EXTENSIONS)
+    )
+    if not paths:
+        print(f"❌ No fixture audio found in {FIXTURES_DIR} (see fixtures/README.md)")
+        return 1
+    fixtures = load_fixtures(paths)
+    if args.long_seconds > 0:
+        fixtures.append(build_long_fixture(fixtures, args.long_seconds))
+    print(f"🎧 {len(fixtures)} fixture(s), {sum(len(f['pcm']) for f in fixtures) / SAMPLE_RATE:.1f}s of audio")
+
+    options = {**DEFAULT_OPTIONS, "beam_size": args.beam_size, "language": args.language}
+    # A fresh interpreter per backend keeps the RSS and load time measurements independent
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in args.backends:
+        backend_kwargs = {"model_size": args.model}
+        if name == "faster-whisper" and args.compute_type:
+            backend_kwargs["compute_type"] = args.compute_type
+        with context.Pool(1) as pool:
+            result = pool.apply(benchmark_backend, (name, fixtures, max(1, args.repeat), backend_kwargs, options, args.vad))
+        if result:
+            results.append(result)
+
+    print(f"\n{'backend':<16}{'load s':>8}{'RTF':>8}{'RSS MB':>9}{'WER':>8}")
+    for result in results:
+        wer = f"{result['wer']:.1%}" if result["wer"] is not None else "-"
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        print(f"{result['backend']:<16}{result['load_s']:>8.2f}{result['rtf']:>8.3f}{rss:>9}{wer:>8}")
+        for category, summary in result["by_category"].items():
+            wer = f"{summary['wer']:.1%}" if summary["wer"] is not None else "-"
+            print(f"  {category:<14}{'':>8}{summary['rtf']:>8.3f}{'':>9}{wer:>8}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "model": args.model,
+        "options": options,
+        "vad": VAD_SETTINGS if args.vad else None,
+        "fixtures": [{"name": f["name"], "category": f["category"], "audio_s": round(len(f["pcm"]) / SAMPLE_RATE, 3)}
+                     for f in fixtures],
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.wer_tolerance)
+        if regressions:
+            print("\n❌ Regressions against the baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print("\n✅ Within the baseline tolerances")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
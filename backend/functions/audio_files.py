@@ -0,0 +1,101 @@
+# audio_files.py - File responses for stored reply audio (ETag, If-None-Match, Range)
+
+from decouple import config
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# Stored audio never changes under its id, so browsers and CDNs may keep it
+AUDIO_CACHE_MAX_AGE = config("AUDIO_CACHE_MAX_AGE", default=7 * 24 * 3600, cast=int)
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range starts beyond the end of the file"""
+
+
+def file_etag(key, stat):
+    """Strong ETag for one written version of a cache file.
+
+    Files are only ever replaced whole (os.replace), so the inode and size
+    tell versions apart; mtime can't be used because every cache hit
+    touches it for LRU ordering.
+    """
+    return f'"{key[:16]}-{stat.st_ino:x}-{stat.st_size:x}"'
+
+
+def etag_matches(header, etag):
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single "bytes=" range, or None to send the whole file.
+
+    Multiple ranges and malformed headers are ignored, which RFC 9110
+    allows; a range starting past the end raises RangeNotSatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def audio_file_response(request, path, stat, content_type, etag):
+    """200 (sent straight from the file), 206 for a byte range, 304 or 416"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={AUDIO_CACHE_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    # If-Range: only honour the range if the client's copy is this version
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(_read_range(path, start, end), status_code=206, media_type=content_type, headers=headers)
+
+    # FileResponse hands the file to the server (sendfile where the server supports it)
+    return FileResponse(path, media_type=content_type, headers=headers, stat_result=stat)
@@ -0,0 +1,224 @@
+# audio_formats.py - Reply audio formats: content negotiation, ElevenLabs output_format, ffmpeg transcoding
+
+from decouple import config
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Format used when the client doesn't ask for one (see AUDIO_FORMATS)
+TTS_DEFAULT_FORMAT = config("TTS_DEFAULT_FORMAT", default="mp3")
+# Formats to encode locally from MP3 instead of asking ElevenLabs (e.g. not on your plan)
+TTS_TRANSCODE_FORMATS = config("TTS_TRANSCODE_FORMATS", default="", cast=lambda v: {f.strip() for f in v.split(",") if f.strip()})
+
+TRANSCODE_CHUNK_SIZE = 4096
+
+
+class AudioFormat:
+    """One reply encoding: how to ask ElevenLabs for it and how to make it with ffmpeg.
+
+    `chainable` formats can be synthesized clip by clip and concatenated
+    into one playable stream (MP3 frames); Ogg can't, so multi-sentence
+    streams are synthesized as MP3 and encoded in a single ffmpeg pass.
+    """
+
+    def __init__(self, name, content_type, elevenlabs, container, encoder_args, chainable=True):
+        self.name = name
+        self.content_type = content_type
+        self.elevenlabs = elevenlabs
+        self.container = container
+        self.encoder_args = encoder_args
+        self.chainable = chainable
+
+    def __repr__(self):
+        return f"AudioFormat({self.name!r})"
+
+
+AUDIO_FORMATS = {
+    "mp3": AudioFormat("mp3", "audio/mpeg", "mp3_44100_128", "mp3", ["-b:a", "128k"]),
+    # Speech stays intelligible at 32 kbit/s, a quarter of the default size
+    "mp3_low": AudioFormat("mp3_low", "audio/mpeg", "mp3_22050_32", "mp3", ["-ar", "22050", "-b:a", "32k"]),
+    "opus": AudioFormat(
+        "opus",
+        "audio/ogg; codecs=opus",
+        "opus_48000_32",
+        "ogg",
+        # Short Ogg pages so audio leaves ffmpeg every 100 ms instead of once a second
+        ["-c:a", "libopus", "-b:a", "32k", "-application", "voip", "-page_duration", "100000"],
+        chainable=False,
+    ),
+}
+
+# What ElevenLabs is asked for when a format has to be transcoded locally
+SOURCE_FORMAT = AUDIO_FORMATS["mp3"]
+
+# File extension (container) -> Content-Type, for stored audio
+CONTAINER_TYPES = {}
+for _format in AUDIO_FORMATS.values():
+    CONTAINER_TYPES.setdefault(_format.container, _format.content_type)
+
+if TTS_DEFAULT_FORMAT not in AUDIO_FORMATS:
+    logger.error("Unknown TTS_DEFAULT_FORMAT %r, using mp3", TTS_DEFAULT_FORMAT)
+    TTS_DEFAULT_FORMAT = "mp3"
+
+# Accept media types -> format, in the server's order of preference for equal q-values
+_MEDIA_TYPES = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
+
+# Formats ElevenLabs refused (e.g. not available on the account's plan), transcoded from now on
+_rejected = set()
+
+
+def default_format():
+    return AUDIO_FORMATS[TTS_DEFAULT_FORMAT]
+
+
+class UnknownFormat(ValueError):
+    """A ?format= value that isn't in AUDIO_FORMATS"""
+
+
+def _parse_accept(header):
+    """[(media_type, params, q)] from an Accept header, best first (stable for equal q)"""
+    ranges = []
+    for part in header.split(","):
+        fields = [field.strip() for field in part.split(";")]
+        media_type = fields[0].lower()
+        if not media_type:
+            continue
+        q = 1.0
+        params = {}
+        for field in fields[1:]:
+            key, _, value = field.partition("=")
+            key = key.strip().lower()
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+            elif key:
+                params[key] = value.strip().strip('"').lower()
+        ranges.append((media_type, params, q))
+    return sorted(ranges, key=lambda item: -item[2])
+
+
+def negotiate_format(requested=None, accept="", save_data=""):
+    """Pick the reply format from ?format=, then the Accept header, then the default.
+
+    Save-Data: on swaps full-rate MP3 for the low-bitrate variant. Accept
+    headers that only list types we can't produce fall back to the
+    default rather than failing the turn.
+    """
+    if requested:
+        if requested not in AUDIO_FORMATS:
+            raise UnknownFormat(f"Unknown audio format {requested!r} (use one of: {', '.join(AUDIO_FORMATS)})")
+        return AUDIO_FORMATS[requested]
+
+    name = TTS_DEFAULT_FORMAT
+    for media_type, params, q in _parse_accept(accept or ""):
+        if q <= 0:
+            continue
+        if media_type in ("*/*", "audio/*"):
+            break
+        match = _MEDIA_TYPES.get(media_type)
+        if media_type == "audio/ogg" and params.get("codecs", "opus") != "opus":
+            match = None
+        if match:
+            name = match
+            break
+
+    if name == "mp3" and save_data.strip().lower() == "on":
+        name = "mp3_low"
+    return AUDIO_FORMATS[name]
+
+
+def needs_transcoding(audio_format):
+    """Whether this format is made locally from MP3 rather than by ElevenLabs"""
+    if audio_format is SOURCE_FORMAT:
+        return False
+    return audio_format.name in TTS_TRANSCODE_FORMATS or audio_format.name in _rejected
+
+
+def mark_rejected(audio_format, status_code):
+    """ElevenLabs refused this output_format: transcode it locally from now on"""
+    if audio_format is SOURCE_FORMAT or audio_format.name in _rejected:
+        return
+    _rejected.add(audio_format.name)
+    logger.warning(
+        "ElevenLabs rejected output format, transcoding locally",
+        extra={"format": audio_format.name, "output_format": audio_format.elevenlabs, "status": status_code},
+    )
+
+
+async def transcode_stream(chunks, audio_format, source=SOURCE_FORMAT):
+    """Re-encode an async stream of `source` audio chunks through one ffmpeg process.
+
+    Output is yielded as ffmpeg produces it, so the first audio goes out
+    while later input is still arriving. Ends early (after logging) if
+    ffmpeg is missing or fails.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        # Start encoding from the first frames instead of probing seconds of input
+        "-fflags", "nobuffer", "-probesize", "32768", "-analyzeduration", "0",
+        "-f", source.container, "-i", "pipe:0",
+        "-vn", *audio_format.encoder_args, "-f", audio_format.container, "-flush_packets", "1",
+        "pipe:1",
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        logger.error("ffmpeg not found on PATH, cannot transcode to %s", audio_format.name)
+        return
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            data = await process.stdout.read(TRANSCODE_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+        await feeder
+        stderr = await process.stderr.read()
+        if await process.wait() != 0:
+            message = stderr.decode(errors="replace").strip().splitlines()
+            logger.error("ffmpeg transcoding failed: %s", message[-1] if message else process.returncode,
+                         extra={"format": audio_format.name})
+    finally:
+        feeder.cancel()
+        try:
+            await feeder
+        except BaseException:
+            pass
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+
+async def transcode(data, audio_format, source=SOURCE_FORMAT):
+    """Re-encode a whole clip; returns None if ffmpeg failed"""
+    async def single():
+        yield data
+
+    output = b"".join([chunk async for chunk in transcode_stream(single(), audio_format, source)])
+    return output or None
@@ -0,0 +1,104 @@
+# audio_io.py - In-memory audio ingestion (upload -> ffmpeg pipe -> PCM)
+
+from decouple import config
+import numpy as np
+import subprocess
+import threading
+
+# Whisper expects 16 kHz mono float32 PCM
+SAMPLE_RATE = 16000
+
+MAX_UPLOAD_BYTES = config("MAX_UPLOAD_BYTES", default=10 * 1024 * 1024, cast=int)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class AudioDecodeError(Exception):
+    """Raised when ffmpeg cannot decode the uploaded audio."""
+
+
+async def read_upload(upload, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an UploadFile in chunks, refusing bodies larger than max_bytes"""
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _iter_chunks(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+            yield view[start:start + UPLOAD_CHUNK_SIZE]
+    else:
+        yield from data
+
+
+def decode_audio(data, sr=SAMPLE_RATE):
+    """Decode encoded audio (bytes or an iterable of chunks) to float32 PCM.
+
+    The input is piped through ffmpeg's stdin and the resampled mono
+    signal is read back from stdout, so nothing touches the disk.
+    """
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sr),
+        "pipe:1",
+    ]
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise AudioDecodeError("ffmpeg not found on PATH")
+
+    # Feed stdin from a helper thread so a full stdout pipe can't deadlock us
+    def feed():
+        try:
+            for chunk in _iter_chunks(data):
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    stderr_chunks = []
+    stderr_reader = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+    )
+    stderr_reader.start()
+
+    out = process.stdout.read()
+    process.wait()
+    feeder.join()
+    stderr_reader.join()
+
+    if process.returncode != 0:
+        message = b"".join(stderr_chunks).decode(errors="replace").strip().splitlines()
+        raise AudioDecodeError(message[-1] if message else "ffmpeg failed to decode audio")
+
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
@@ -0,0 +1,86 @@
+# context.py - Token-budgeted conversation history with a rolling summary of older turns
+
+from decouple import config
+import re
+
+# History sent to Groq (summary + recent turns), excluding the system prompt and the new message
+CONTEXT_TOKEN_BUDGET = config("CONTEXT_TOKEN_BUDGET", default=1200, cast=int)
+# Fold turns that no longer fit the budget into the session summary
+SUMMARY_ENABLED = config("SUMMARY_ENABLED", default=True, cast=bool)
+# Summarize once at least this many tokens have fallen out of the window (batches Groq calls)
+SUMMARY_TRIGGER_TOKENS = config("SUMMARY_TRIGGER_TOKENS", default=150, cast=int)
+SUMMARY_MAX_TOKENS = config("SUMMARY_MAX_TOKENS", default=200, cast=int)
+
+# Words, numbers and single punctuation marks: close to BPE token counts for English chat
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """Approximate token count of a message (computed once, when it is stored)"""
+    # Long words split into several BPE tokens, roughly one per 4 characters
+    return sum(max(1, len(piece) // 4) for piece in _TOKEN_PATTERN.findall(text or ""))
+
+
+def _group_turns(messages):
+    """Split messages into turns that each start with a user message.
+
+    Assistant messages before the first user message belong to a turn that
+    started outside the fetched range, so they come back as a partial turn.
+    """
+    partial, turns = [], []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            if message["role"] != "user":
+                partial.append(message)
+                continue
+            turns.append([])
+        turns[-1].append(message)
+    return partial, turns
+
+
+def select_window(messages, budget, summarized_through=0):
+    """Choose the newest whole turns that fit in `budget` tokens.
+
+    `messages` carry "turn" (position in the session) and "tokens". Messages
+    already covered by the summary are skipped. Returns (kept, dropped):
+    kept is sent verbatim, dropped is what the summary should absorb next.
+    """
+    unsummarized = [message for message in messages if message["turn"] > summarized_through]
+    partial, turns = _group_turns(unsummarized)
+
+    kept = []
+    used = 0
+    for index in range(len(turns) - 1, -1, -1):
+        size = sum(message["tokens"] for message in turns[index])
+        if used + size > budget:
+            break
+        kept = turns[index] + kept
+        used += size
+    else:
+        index = -1
+
+    dropped = partial + [message for turn in turns[:index + 1] for message in turn]
+    return kept, dropped
+
+
+def summary_message(summary):
+    return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+
+
+def build_summary_prompt(summary, messages):
+    """Messages asking the LLM to fold new turns into the running summary"""
+    transcript = "\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a voice conversation between a user and an assistant. "
+                "Keep names, preferences, facts and open questions; drop small talk. "
+                f"Answer with the updated summary only, in under {SUMMARY_MAX_TOKENS // 2} words."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Current summary: {summary or '(none)'}\n\nNew messages:\n{transcript}",
+        },
+    ]
@@ -1,135 +1,411 @@
+from collections import defaultdict, deque
+from decouple import config
 import json
-import random
+import logging
+import re
 import os
-import traceback
-
-def get_recent_messages():
-    """Get recent messages from stored_data.json with proper error handling"""
-    
-    print("📚 Loading recent messages...")
-    
-    # Use absolute path to ensure file is found regardless of where the function is called from
-    try:
-        # Get the directory of the current file (database.py)
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # Go up one level to the backend directory
-        backend_dir = os.path.dirname(current_dir)
-        file_name = os.path.join(backend_dir, "stored_data.json")
-        
-        print(f"📁 Looking for file: {file_name}")
-    except Exception as e:
-        print(f"❌ Error constructing file path: {str(e)}")
-        # Fallback to simple relative path
-        file_name = "stored_data.json"
-
-    # Define the learn instruction
-    learn_instruction = {
-        "role": "system",
-        "content": "You are a sales person selling cars and houses  . Ask relevant Q , user is Noufal. Keep your answer under 25 words with simple language to understand."
-    }
-
-    # Initialize messages list with learn instruction
-    messages = []
-
-    # Add random element 
-    x = random.randint(0, 1)
-    if x < 0.5:
-        learn_instruction["content"] = learn_instruction["content"] + " Your response will include some  humour."
-    else:
-        learn_instruction["content"] = learn_instruction["content"] + " Your response will include a rather user freandly qustion."  
-
-    # Append instruction to messages
-    messages.append(learn_instruction)
-    print(f"✅ System instruction added: {learn_instruction['content'][:50]}...")
-
-    # Get last messages
-    try:
-        # Make sure file exists before trying to open it
-        if os.path.exists(file_name):
-            print(f"📖 Reading file: {file_name}")
-            with open(file_name, 'r', encoding='utf-8') as user_file:
-                data = json.load(user_file)
-
-            # Append last 5 items of data 
-            if data:
-                if len(data) < 5:
-                    # If less than 5 messages, append all
-                    for item in data:
-                        messages.append(item)
-                    print(f"📚 Loaded {len(data)} messages (all available)")
-                else:
-                    # Get the last 5 messages (most recent conversation)
-                    for item in data[-5:]:
-                        messages.append(item)
-                    print(f"📚 Loaded last 5 messages from {len(data)} total")
-            else:
-                print("📚 No conversation history found")
+import threading
+import time
+
+from functions.context import (
+    CONTEXT_TOKEN_BUDGET,
+    SUMMARY_ENABLED,
+    SUMMARY_TRIGGER_TOKENS,
+    count_tokens,
+    select_window,
+    summary_message,
+)
+from functions.persistence import WriteBehindQueue
+from functions.prompt import prefix_stats, system_message
+from functions.session_store import SQLiteConversationStore
+
+logger = logging.getLogger(__name__)
+
+# Get the directory of the current file (database.py) and go up to backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "sqlite" (per-session, WAL mode) or "jsonl" (append-only log)
+CONVERSATION_STORE = config("CONVERSATION_STORE", default="sqlite")
+CONVERSATION_DB = config("CONVERSATION_DB", default=os.path.join(BACKEND_DIR, "conversations.db"))
+
+# Conversations without a session id (old clients) share this one
+DEFAULT_SESSION_ID = "default"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Append-only conversation log, split into rotating JSONL segments
+CONVERSATION_LOG_DIR = config("CONVERSATION_LOG_DIR", default=os.path.join(BACKEND_DIR, "conversation_log"))
+LOG_SEGMENT_BYTES = config("LOG_SEGMENT_BYTES", default=1024 * 1024, cast=int)
+LOG_MAX_SEGMENTS = config("LOG_MAX_SEGMENTS", default=8, cast=int)
+
+# "always" fsyncs every append, "interval" at most every LOG_FSYNC_INTERVAL seconds, "never" leaves it to the OS
+LOG_FSYNC = config("LOG_FSYNC", default="interval")
+LOG_FSYNC_INTERVAL = config("LOG_FSYNC_INTERVAL", default=1.0, cast=float)
+
+# Most recent messages considered for the history (and kept in memory by the
+# JSONL log); CONTEXT_TOKEN_BUDGET decides how many of them are sent to Groq
+RECENT_WINDOW = config("RECENT_WINDOW", default=40, cast=int)
+
+# Write-behind group commit: up to PERSIST_BATCH_SIZE turns per flush,
+# waiting at most PERSIST_FLUSH_INTERVAL seconds for a batch to fill
+PERSIST_BATCH_SIZE = config("PERSIST_BATCH_SIZE", default=32, cast=int)
+PERSIST_FLUSH_INTERVAL = config("PERSIST_FLUSH_INTERVAL", default=0.05, cast=float)
+
+# Legacy single-file history, imported once into the log
+LEGACY_FILE = os.path.join(BACKEND_DIR, "stored_data.json")
+
+
+class ConversationLog:
+    """Append-only JSONL message log with an in-memory tail of recent messages per session.
+
+    Each message is one line in the active segment. Segments rotate at
+    LOG_SEGMENT_BYTES; once there are more than LOG_MAX_SEGMENTS the closed
+    ones are compacted into a single segment that keeps, per session, only
+    what the tail needs: the last `window` messages since its last reset,
+    its latest summary, and a "dropped" record carrying the turn counter
+    past the messages left out. Resets are appended as markers rather than
+    truncating. Summary records keep the latest rolling summary of each
+    session.
+    """
+
+    def __init__(self, directory, segment_bytes, max_segments, fsync_policy, fsync_interval, window):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.window = window
+        self.recent = {}
+        self.counts = {}  # session_id -> messages since the last reset (numbers turns)
+        self.summaries = {}  # session_id -> (summary, through_turn)
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_fsync = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._open_active()
+
+    def _segments(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.startswith("segment-") and name.endswith(".jsonl"))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:06d}.jsonl")
+
+    def _segment_number(self, path):
+        return int(os.path.basename(path)[len("segment-"):-len(".jsonl")])
+
+    @staticmethod
+    def _read_records(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    logger.warning("Skipping corrupt log line", extra={"segment": os.path.basename(path)})
+
+    def _replay(self):
+        """Rebuild the in-memory tail from disk (once, at startup)"""
+        segments = self._segments()
+        if not segments and os.path.exists(LEGACY_FILE):
+            self._import_legacy()
+            segments = self._segments()
+
+        for path in segments:
+            for record in self._read_records(path):
+                self._apply(record)
+        logger.info("Conversation log loaded", extra={"segments": len(segments), "sessions": len(self.recent)})
+
+    def _apply(self, record):
+        """Update the in-memory tail with one log record"""
+        session_id = record.get("session", DEFAULT_SESSION_ID)
+        if record.get("reset"):
+            self.recent.pop(session_id, None)
+            self.counts.pop(session_id, None)
+            self.summaries.pop(session_id, None)
+        elif "summary" in record:
+            self.summaries[session_id] = (record["summary"], record["through"])
+        elif "dropped" in record:
+            # Messages removed by compaction still count towards the turn numbers
+            self.counts[session_id] = self.counts.get(session_id, 0) + record["dropped"]
         else:
-            print(f"📁 File not found: {file_name}, using only system instructions")
-            
-    except json.JSONDecodeError as e:
-        print(f"❌ JSON decode error: {str(e)}")
-        print("🔧 The stored_data.json file may be corrupted")
-    except Exception as e:
-        print(f"❌ Error reading messages: {str(e)}")
-        print(traceback.format_exc())
+            turn = self.counts[session_id] = self.counts.get(session_id, 0) + 1
+            tokens = record.get("tokens")
+            tail = self.recent.setdefault(session_id, deque(maxlen=self.window))
+            tail.append({
+                "role": record["role"],
+                "content": record["content"],
+                "turn": turn,
+                "tokens": tokens if tokens is not None else count_tokens(record["content"]),
+            })
+
+    def _import_legacy(self):
+        try:
+            with open(LEGACY_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if not data:
+            return
+        with open(self._segment_path(1), "w", encoding="utf-8") as f:
+            for item in data:
+                f.write(json.dumps({"role": item["role"], "content": item["content"]}, ensure_ascii=False) + "\n")
+        logger.info("Imported legacy messages", extra={"messages": len(data), "path": LEGACY_FILE})
+
+    def _open_active(self):
+        segments = self._segments()
+        path = segments[-1] if segments else self._segment_path(1)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _sync(self, force=False):
+        self._file.flush()
+        if self.fsync_policy == "never":
+            return
+        now = time.monotonic()
+        if force or self.fsync_policy == "always" or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def _rotate(self):
+        self._sync(force=True)
+        number = self._segment_number(self._file.name) + 1
+        self._file.close()
+        self._file = open(self._segment_path(number), "a", encoding="utf-8")
+        if len(self._segments()) > self.max_segments:
+            self._compact()
+
+    def _compact(self):
+        """Merge closed segments into one holding each session's tail, summary and turn counter"""
+        closed = [path for path in self._segments() if path != self._file.name]
+        # session_id -> messages since the last reset, latest summary, and the
+        # last `window` messages; records are numbered to keep their log order
+        counts, summaries, tails = {}, {}, {}
+        position = 0
+        for path in closed:
+            for record in self._read_records(path):
+                session_id = record.get("session", DEFAULT_SESSION_ID)
+                position += 1
+                if record.get("reset"):
+                    counts.pop(session_id, None)
+                    summaries.pop(session_id, None)
+                    tails.pop(session_id, None)
+                elif "summary" in record:
+                    summaries[session_id] = (position, record)
+                elif "dropped" in record:
+                    counts[session_id] = counts.get(session_id, 0) + record["dropped"]
+                else:
+                    counts[session_id] = counts.get(session_id, 0) + 1
+                    tails.setdefault(session_id, deque(maxlen=self.window)).append((position, record))
+
+        kept = []
+        for session_id, count in counts.items():
+            tail = tails.get(session_id, ())
+            if count > len(tail):
+                kept.append((0, {"session": session_id, "dropped": count - len(tail)}))
+            kept.extend(tail)
+        kept.extend(summaries.values())
+        kept = [record for _, record in sorted(kept, key=lambda item: item[0])]
+
+        target = closed[0]
+        temp_path = target + ".compact"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for record in kept:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, target)
+        for path in closed[1:]:
+            os.remove(path)
+        logger.info(
+            "Compacted log segments",
+            extra={"segments": len(closed), "target": os.path.basename(target), "messages": len(kept)},
+        )
 
-    print(f"✅ Returning {len(messages)} messages total")
+    def _append(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._sync()
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def append_turns(self, turns):
+        """Append (session_id, user_message, assistant_message, user_tokens, assistant_tokens) turns and update the tails.
+
+        Returns the last turn number written for each session.
+        """
+        now = time.time()
+        records = []
+        for session_id, request_message, response_message, request_tokens, response_tokens in turns:
+            records.append({"session": session_id, "role": "user", "content": request_message, "tokens": request_tokens, "ts": now})
+            records.append({"session": session_id, "role": "assistant", "content": response_message, "tokens": response_tokens, "ts": now})
+        with self._lock:
+            self._append(records)
+            for record in records:
+                self._apply(record)
+            return {record["session"]: self.counts[record["session"]] for record in records}
+
+    def reset(self, session_id):
+        """Append a reset marker and forget the session's in-memory tail"""
+        record = {"session": session_id, "reset": True, "ts": time.time()}
+        with self._lock:
+            self._append([record])
+            self._apply(record)
+
+    def recent_messages(self, session_id, limit):
+        with self._lock:
+            return list(self.recent.get(session_id, ()))[-limit:]
+
+    def get_summary(self, session_id):
+        with self._lock:
+            return self.summaries.get(session_id)
+
+    def save_summary(self, session_id, summary, through_turn):
+        record = {"session": session_id, "summary": summary, "through": through_turn, "ts": time.time()}
+        with self._lock:
+            self._append([record])
+            self._apply(record)
+
+    def close(self):
+        with self._lock:
+            if self._file and not self._file.closed:
+                self._sync(force=True)
+                self._file.close()
+
+
+def _create_store():
+    if CONVERSATION_STORE == "jsonl":
+        return ConversationLog(
+            CONVERSATION_LOG_DIR,
+            LOG_SEGMENT_BYTES,
+            LOG_MAX_SEGMENTS,
+            LOG_FSYNC,
+            LOG_FSYNC_INTERVAL,
+            RECENT_WINDOW,
+        )
+    return SQLiteConversationStore(CONVERSATION_DB)
+
+
+# Bumped on every reset so summaries computed before a reset are discarded
+_generations = defaultdict(int)
+
+
+def _save_summary(session_id, summary, through_turn, generation):
+    """Apply a summary update (writer thread), unless the session was reset meanwhile"""
+    if _generations[session_id] == generation:
+        message_store.save_summary(session_id, summary, through_turn)
+
+
+message_store = _create_store()
+write_queue = WriteBehindQueue(
+    message_store.append_turns,
+    message_store.reset,
+    _save_summary,
+    max_batch=PERSIST_BATCH_SIZE,
+    flush_interval=PERSIST_FLUSH_INTERVAL,
+)
+
+
+def is_valid_session_id(session_id):
+    """Session ids are client-chosen, so keep them short and URL-safe"""
+    return bool(SESSION_ID_PATTERN.match(session_id or ""))
+
+
+def get_recent_messages(session_id=DEFAULT_SESSION_ID):
+    """Get the system instruction plus the session's most recent messages"""
+
+    # Pinned system prompt first, so every turn of a session starts with the same bytes
+    messages = [system_message(session_id)]
+
+    # Rolling summary of older turns, then the newest turns that fit the token budget.
+    # While a summary update is pending the window may overrun the budget by
+    # SUMMARY_TRIGGER_TOKENS, so its start (and the prompt prefix) only moves
+    # when the summary absorbs the oldest turns.
+    summary, summarized_through = message_store.get_summary(session_id) or (None, 0)
+    budget = CONTEXT_TOKEN_BUDGET + (SUMMARY_TRIGGER_TOKENS if SUMMARY_ENABLED else 0)
+    if summary:
+        messages.append(summary_message(summary))
+        budget -= count_tokens(summary)
+    recent, dropped = select_window(_load_recent(session_id), budget, summarized_through)
+    messages.extend({"role": message["role"], "content": message["content"]} for message in recent)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Loaded conversation history",
+            extra={
+                "session_id": session_id,
+                "messages": len(recent),
+                "tokens": sum(message["tokens"] for message in recent),
+                "summarized": bool(summary),
+                "awaiting_summary": len(dropped),
+            },
+        )
     return messages
 
-def store_messages(request_message, response_message):
-    """Store messages to stored_data.json with proper error handling"""
-    
-    print(f"💾 Storing messages: User='{request_message[:30]}...', Assistant='{response_message[:30]}...'")
-    
-    # Define the file name (use simple relative path for storage)
-    file_name = "stored_data.json"
+def _load_recent(session_id):
+    """Last messages of a session with turn numbers and token counts, including turns still waiting to be written"""
+    return write_queue.read_through(
+        session_id,
+        lambda: message_store.recent_messages(session_id, RECENT_WINDOW),
+    )[-RECENT_WINDOW:]
+
+
+def get_summary_work(session_id):
+    """Return (summary, messages to fold in, generation) once enough has fallen out of the window, else None"""
+    if not SUMMARY_ENABLED:
+        return None
+    generation = _generations[session_id]
+    summary, summarized_through = message_store.get_summary(session_id) or (None, 0)
+    budget = CONTEXT_TOKEN_BUDGET - (count_tokens(summary) if summary else 0)
+    _, dropped = select_window(_load_recent(session_id), budget, summarized_through)
+    if sum(message["tokens"] for message in dropped) < SUMMARY_TRIGGER_TOKENS:
+        return None
+    return summary, dropped, generation
+
+
+def save_summary(session_id, summary, through_turn, generation):
+    """Save the new rolling summary behind the turns it covers (waits until applied)"""
+    write_queue.write_summary(session_id, summary, through_turn, generation)
+
+
+def store_messages(request_message, response_message, session_id=DEFAULT_SESSION_ID):
+    """Queue the user and assistant messages of one turn for a session (written in the background)"""
 
     try:
-        # Load existing messages (excluding system instruction)
-        existing_data = []
-        if os.path.exists(file_name):
-            try:
-                with open(file_name, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                print(f"📖 Loaded {len(existing_data)} existing messages")
-            except json.JSONDecodeError:
-                print("🔧 Corrupted JSON file, starting fresh")
-                existing_data = []
-
-        # Add new messages to data
-        user_message = {"role": "user", "content": request_message}
-        assistant_message = {"role": "assistant", "content": response_message}
-        
-        existing_data.append(user_message)
-        existing_data.append(assistant_message)
-
-        # Save the updated file
-        with open(file_name, "w", encoding='utf-8') as f:
-            json.dump(existing_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Messages stored successfully. Total messages: {len(existing_data)}")
-        
+        write_queue.enqueue(
+            session_id,
+            request_message,
+            response_message,
+            count_tokens(request_message),
+            count_tokens(response_message),
+        )
+        logger.debug("Messages queued for storage", extra={"session_id": session_id})
+
     except Exception as e:
-        print(f"❌ Error storing messages: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error storing messages")
         raise e
 
-def reset_messages():
-    """Reset messages by clearing stored_data.json"""
-    
-    print("🔄 Resetting conversation history...")
-    
-    file_name = "stored_data.json"
-    
+def reset_messages(session_id=DEFAULT_SESSION_ID):
+    """Reset one session's conversation history"""
+
     try:
-        # Overwrite the stored_data.json file with an empty list
-        with open(file_name, "w", encoding='utf-8') as f:
-            json.dump([], f)
-        
-        print("✅ Conversation history reset successfully")
-        
+        _generations[session_id] += 1
+        write_queue.reset(session_id)
+        prefix_stats.forget(session_id)
+        logger.info("Conversation history reset", extra={"session_id": session_id})
+
     except Exception as e:
-        print(f"❌ Error resetting messages: {str(e)}")
-        print(traceback.format_exc())
-        raise e
\ No newline at end of file
+        logger.exception("Error resetting messages")
+        raise e
+
+def close_message_store():
+    """Drain pending writes and close the conversation store (called on app shutdown)"""
+    write_queue.drain()
+    message_store.close()
+
+
+def get_persistence_stats():
+    """Write-behind queue depth and flush latency"""
+    return write_queue.stats()
@@ -3,132 +3,557 @@
 from decouple import config
 from typing import Union, BinaryIO
 from fastapi import UploadFile
-import requests
-import whisper
+from functions.audio_io import decode_audio, SAMPLE_RATE
+from functions.context import SUMMARY_MAX_TOKENS, build_summary_prompt, count_tokens
+from functions.database import DEFAULT_SESSION_ID, get_recent_messages, get_summary_work, save_summary
+from functions.http_clients import get_client
+from functions.metrics import AUDIO_SECONDS, LLM_SECONDS, LLM_TOKENS, STT_AUDIO_SECONDS, STT_PARTIAL_SECONDS, STT_SECONDS
+from functions.prompt import prefix_stats
+from functions.rate_limit import GROQ_MAX_RETRIES, GROQ_MAX_WAIT_SECONDS, RateLimited, TooManyRequests, groq_limiter
+from functions.resilience import CircuitOpen, HedgedCall, UpstreamError
+from functions.stt_backends import DEFAULT_OPTIONS, STT_BACKEND, STT_MODEL, create_backend
+from functions.stt_cache import stt_cache, transcription_key
+from functions.vad import VAD_SETTINGS, trim_silence
+from functions.timings import startup_report
+from functions.workers import POOLS, run_in_stage
+import asyncio
+import numpy as np
+import json
+import logging
+import threading
+import time
 import os
 
+logger = logging.getLogger(__name__)
+
 # Groq API setup
 GROQ_API_KEY = config("GROQ_API_KEY", default=None)
-GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+GROQ_BASE_URL = config("GROQ_BASE_URL", default="https://api.groq.com/openai/v1")
+CHAT_MODEL = "llama-3.1-8b-instant"  # Fast model
+
+# Hedging and the circuit breaker (buffered replies, time to first streamed token, summaries)
+groq_chat = HedgedCall("groq", "chat")
+groq_stream = HedgedCall("groq", "stream")
+groq_summary = HedgedCall("groq", "summary", hedge=False)
+
+# Local speech-to-text engine (STT_BACKEND / STT_MODEL). It is loaded and
+# warmed up in the background after the server starts (see warm_up_stt), so
+# importing this module stays cheap and never imports torch.
+stt_backend = None
+stt_state = "cold"  # cold -> loading -> warming -> ready | failed
+stt_load_attempts = 0
+WARMUP_SECONDS = 1.0
+# Extra load attempts after a failure (e.g. a model download that timed out),
+# waiting STT_LOAD_RETRY_SECONDS, doubling each time; then the state stays "failed"
+STT_LOAD_RETRIES = config("STT_LOAD_RETRIES", default=3, cast=int)
+STT_LOAD_RETRY_SECONDS = config("STT_LOAD_RETRY_SECONDS", default=5.0, cast=float)
 
-# Load local Whisper model (one time at startup)
-whisper_model = None
+# Backends that aren't thread-safe (openai-whisper's kv-cache hooks) get one
+# instance per STT worker thread; thread-safe ones are shared.
+_model_lock = threading.Lock()
+_model_claimed = False
+_thread_state = threading.local()
 
 def load_whisper_model():
-    """Load Whisper model with better error handling"""
-    global whisper_model
+    """Load the configured STT backend with better error handling"""
+    global stt_backend
     try:
-        print("Loading Whisper model...")
-        whisper_model = whisper.load_model("base")  # or "tiny" for faster
-        print("Whisper model loaded successfully!")
+        logger.info("Loading %s model '%s'", STT_BACKEND, STT_MODEL)
+        stt_backend = create_backend().load()
+        logger.info("Speech model loaded")
         return True
-    except Exception as e:
-        print(f"Error loading Whisper model: {e}")
-        whisper_model = None
+    except Exception:
+        logger.exception("Error loading speech model")
+        stt_backend = None
         return False
 
-# Load model at startup
-load_whisper_model()
 
-if not GROQ_API_KEY:
-    print("Warning: GROQ_API_KEY not set. Add it to your .env file")
+def _get_thread_model():
+    """Return the STT backend the calling STT worker thread may use"""
+    global _model_claimed
+    if stt_backend.thread_safe:
+        return stt_backend
+
+    model = getattr(_thread_state, "model", None)
+    if model is not None:
+        return model
+
+    with _model_lock:
+        if not _model_claimed:
+            # First worker reuses the model loaded at startup
+            _model_claimed = True
+            model = stt_backend
+        else:
+            logger.info("Loading speech model for %s", threading.current_thread().name)
+            model = create_backend().load()
+
+    _thread_state.model = model
+    return model
+
+
+def get_stt_capabilities():
+    """Describe the loaded STT backend (engine, model size, compute type)"""
+    if stt_backend is None:
+        return {"backend": STT_BACKEND, "model": STT_MODEL, "loaded": False, "state": stt_state, "attempts": stt_load_attempts}
+    return {**stt_backend.capabilities(), "state": stt_state, "attempts": stt_load_attempts}
+
+
+def _warm_up_worker(barrier):
+    """Run one inference on this STT worker's model so the first real request isn't slow"""
+    try:
+        clip = np.random.default_rng(0).normal(0, 0.01, int(SAMPLE_RATE * WARMUP_SECONDS)).astype(np.float32)
+        _get_thread_model().transcribe(clip)
+    except BaseException:
+        if barrier is not None:
+            barrier.abort()
+        raise
+    # Hold this worker until every worker has a job, so each thread warms its own model
+    if barrier is not None:
+        barrier.wait()
+
+
+async def warm_up_stt():
+    """Load and warm up the STT model, retrying with backoff (background startup task)"""
+    global stt_state, stt_load_attempts
+    startup_report.mark("stt_loading")
+    delay = STT_LOAD_RETRY_SECONDS
+    while True:
+        stt_load_attempts += 1
+        if await _load_and_warm_up():
+            return True
+        if stt_load_attempts > STT_LOAD_RETRIES:
+            stt_state = "failed"
+            logger.error("Speech model unavailable after %d attempt(s)", stt_load_attempts)
+            return False
+        logger.warning("Retrying speech model load in %gs", delay, extra={"attempt": stt_load_attempts})
+        await asyncio.sleep(delay)
+        delay *= 2
+
+
+async def _load_and_warm_up():
+    global stt_state
+    try:
+        stt_state = "loading"
+        with startup_report.phase("stt_load"):
+            if not await run_in_stage("stt", load_whisper_model):
+                return False
+
+        stt_state = "warming"
+        workers = 1 if stt_backend.thread_safe else POOLS["stt"].max_workers
+        barrier = threading.Barrier(workers) if workers > 1 else None
+        with startup_report.phase("stt_warmup"):
+            await asyncio.gather(*(run_in_stage("stt", _warm_up_worker, barrier) for _ in range(workers)))
+
+        stt_state = "ready"
+        startup_report.mark("stt_ready")
+        logger.info("Speech model warm on %d worker(s)", workers)
+        return True
+    except Exception:
+        logger.exception("Speech model warm-up failed")
+        return False
 
 
-def _get_file_obj(audio_file: Union[str, BinaryIO, UploadFile]):
-    """Return a file-like object for the given input."""
-    if isinstance(audio_file, UploadFile):
-        return audio_file.file
-    if isinstance(audio_file, str):
-        return open(audio_file, "rb")
-    return audio_file
+def is_stt_ready():
+    return stt_state == "ready"
 
 
-def convert_audio_to_text(audio_file: Union[str, BinaryIO, UploadFile]):
-    """Convert audio to text using the preloaded Whisper model"""
-    temp_path = None
+def is_stt_failed():
+    """The model couldn't be loaded and no more attempts will be made"""
+    return stt_state == "failed"
+
+if not GROQ_API_KEY:
+    logger.warning("GROQ_API_KEY not set. Add it to your .env file")
+
+
+def convert_audio_to_text(audio_file: Union[str, bytes, BinaryIO, UploadFile, np.ndarray]):
+    """Convert audio to text using the preloaded STT backend"""
     try:
-        if not whisper_model:
-            print("❌ Whisper model not loaded.")
+        if not stt_backend:
+            logger.error("Speech model not loaded")
             return None
 
-        # Prepare file (absolute path or temp)
-        if isinstance(audio_file, str):
+        if isinstance(audio_file, np.ndarray):
+            # Already decoded 16 kHz float32 PCM
+            audio = audio_file
+        elif isinstance(audio_file, str):
             audio_path = os.path.abspath(audio_file)
             if not os.path.exists(audio_path):
-                print(f"Audio file not found: {audio_path}")
+                logger.error("Audio file not found: %s", audio_path)
                 return None
+            with open(audio_path, "rb") as f:
+                audio = decode_audio(f.read())
         else:
-            temp_path = os.path.abspath("whisper_temp.wav")
-            with open(temp_path, "wb") as f:
+            # Raw upload bytes / file objects are decoded in memory
+            if isinstance(audio_file, UploadFile):
+                audio_file = audio_file.file
+            if not isinstance(audio_file, (bytes, bytearray)):
                 if hasattr(audio_file, "seek"):
                     audio_file.seek(0)
-                f.write(audio_file.read())
-            audio_path = temp_path
+                audio_file = audio_file.read()
+            audio = decode_audio(audio_file)
 
-        print(f"Transcribing: {audio_path}")
-        result = whisper_model.transcribe(audio_path, fp16=False)
+        # Trim leading/trailing silence; clips without speech never reach the model
+        AUDIO_SECONDS.inc(len(audio) / SAMPLE_RATE, kind="received")
+        audio, seconds_saved = trim_silence(audio)
+        if audio is None:
+            logger.info("No speech detected", extra={"silence_seconds": round(seconds_saved, 1)})
+            return ""
 
-        return result["text"].strip()
+        seconds = len(audio) / SAMPLE_RATE
+        logger.debug("Transcribing audio", extra={"audio_seconds": round(seconds, 1), "silence_seconds": round(seconds_saved, 1)})
+        model = _get_thread_model()
+        started = time.perf_counter()
+        text = model.transcribe(audio)
+        STT_SECONDS.observe(time.perf_counter() - started, backend=model.name)
+        STT_AUDIO_SECONDS.observe(seconds)
+        AUDIO_SECONDS.inc(seconds, kind="transcribed")
+        return text
 
-    except Exception as e:
-        print(f"Error in convert_audio_to_text: {e}")
+    except Exception:
+        logger.exception("Error in convert_audio_to_text")
         return None
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
 
 
-def get_chat_response(message_input):
+def transcribe_partial(audio: np.ndarray):
+    """Transcribe a window of an utterance still being spoken (WebSocket partials).
+
+    Partials re-read overlapping audio every WS_PARTIAL_INTERVAL, so they
+    stay out of the VAD stats and the per-turn audio/inference metrics and
+    are timed under voice_stt_partial_inference_seconds instead.
+    """
+    if not stt_backend:
+        return None
+    audio, _ = trim_silence(audio, record=False)
+    if audio is None:
+        return ""
+    model = _get_thread_model()
+    started = time.perf_counter()
+    text = model.transcribe(audio)
+    STT_PARTIAL_SECONDS.observe(time.perf_counter() - started, backend=model.name)
+    return text
+
+
+async def transcribe_audio_bytes(data):
+    """Transcribe an uploaded recording on the STT pool.
+
+    Identical uploads (client retries, double submits) reuse the cached
+    transcript or join the transcription already running for them.
+    """
+    capabilities = get_stt_capabilities()
+    engine = {name: capabilities.get(name) for name in ("backend", "model", "compute_type")}
+    key = transcription_key(data, engine, {"decode": DEFAULT_OPTIONS, "vad": VAD_SETTINGS})
+    return await stt_cache.get_or_transcribe(key, lambda: run_in_stage("stt", convert_audio_to_text, data))
+
+
+class CannedReply(str):
+    """Text spoken in place of the model's reply; never stored in the history"""
+
+
+def is_model_reply(text):
+    """Whether a reply came from the model (and so belongs in the history)"""
+    return bool(text and text.strip()) and not isinstance(text, CannedReply)
+
+
+# Canned replies used when Groq can't answer (they are spoken to the user).
+# The rate limit reply is only used once queueing and retries ran out of time.
+RATE_LIMIT_REPLY = CannedReply("Sorry, I'm a bit overwhelmed right now. Give me a moment and ask me again.")
+CONNECTION_ERROR_REPLY = CannedReply("Sorry, I'm having trouble connecting right now.")
+PROCESSING_ERROR_REPLY = CannedReply("Sorry, I encountered an error while processing your request.")
+MISSING_KEY_REPLY = CannedReply("Error: GROQ_API_KEY not configured")
+
+
+async def _build_chat_request(message_input, session_id, stream=False):
+    """Return headers and JSON body for a /chat/completions call"""
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+    # Get the session's messages from the database including system instructions
+    messages = await run_in_stage("io", get_recent_messages, session_id)
+
+    # Add the current user message last: everything before it is the session's stable prefix
+    messages.append({"role": "user", "content": message_input})
+    prefix_stats.observe_prompt(session_id, messages)
+
+    data = {
+        "model": CHAT_MODEL,
+        "messages": messages,
+        "max_tokens": 500,
+        "temperature": 0.7,
+    }
+    if stream:
+        data["stream"] = True
+
+    return headers, data
+
+
+def _request_cost(messages):
+    """Estimated tokens a chat call will count against the token budget"""
+    return groq_limiter.estimate(sum(count_tokens(message["content"]) for message in messages))
+
+
+def _completion_tokens(usage):
+    return (usage or {}).get("completion_tokens")
+
+
+def _record_llm_usage(messages, reply, usage):
+    """Count prompt/completion tokens, preferring the provider's usage block"""
+    if usage and "prompt_tokens" in usage:
+        LLM_TOKENS.inc(usage["prompt_tokens"], direction="in")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), direction="out")
+    else:
+        LLM_TOKENS.inc(sum(count_tokens(message["content"]) for message in messages), direction="in")
+        LLM_TOKENS.inc(count_tokens(reply), direction="out")
+
+
+async def get_chat_response(message_input, session_id=DEFAULT_SESSION_ID):
     """Get chat response from Groq API - FAST and generous free tier!"""
     if not GROQ_API_KEY:
-        return "Error: GROQ_API_KEY not configured"
+        return MISSING_KEY_REPLY
+
+    try:
+        headers, data = await _build_chat_request(message_input, session_id)
+        cost = _request_cost(data["messages"])
+        deadline = time.monotonic() + GROQ_MAX_WAIT_SECONDS
+
+        async def post():
+            started = time.perf_counter()
+            response = await get_client("groq").post(
+                f"{GROQ_BASE_URL}/chat/completions",
+                headers=headers,
+                json=data,
+            )
+            LLM_SECONDS.observe(time.perf_counter() - started, kind="chat", status=response.status_code)
+            if response.status_code == 429:
+                raise TooManyRequests(response.headers)
+            if response.status_code >= 500:
+                raise UpstreamError("groq", response.status_code, response.text)
+            return response
+
+        for attempt in range(GROQ_MAX_RETRIES + 1):
+            await groq_limiter.acquire(cost, deadline)
+            try:
+                # A hedged duplicate needs its own budget, taken only if it is free right now
+                response = await groq_chat.call(
+                    post, may_hedge=lambda: groq_limiter.try_acquire(cost), passthrough=(TooManyRequests,)
+                )
+                break
+            except TooManyRequests as e:
+                # The limiter holds back this and every other call until the retry delay has passed
+                delay = groq_limiter.on_rate_limited(e.headers, attempt)
+                logger.warning("Groq rate limited", extra={"attempt": attempt + 1, "delay_seconds": round(delay, 2)})
+        else:
+            groq_limiter.give_up()
+            return RATE_LIMIT_REPLY
+
+        if response.status_code == 200:
+            result = response.json()
+            reply = result["choices"][0]["message"]["content"]
+            groq_limiter.observe(response.headers, _completion_tokens(result.get("usage")))
+            prefix_stats.observe_usage(result.get("usage"))
+            _record_llm_usage(data["messages"], reply, result.get("usage"))
+            return reply
+        else:
+            groq_limiter.observe(response.headers)
+            logger.error("Groq API error %s", response.status_code, extra={"body": response.text})
+            return CONNECTION_ERROR_REPLY
+
+    except RateLimited as e:
+        logger.warning("%s", e)
+        return RATE_LIMIT_REPLY
+    except CircuitOpen as e:
+        logger.warning("%s", e)
+        return CONNECTION_ERROR_REPLY
+    except UpstreamError as e:
+        logger.error("Groq API error %s", e.status_code, extra={"body": e.body})
+        return CONNECTION_ERROR_REPLY
+    except Exception:
+        logger.exception("Error in get_chat_response")
+        return PROCESSING_ERROR_REPLY
+
+
+async def stream_chat_response(message_input, session_id=DEFAULT_SESSION_ID):
+    """Yield the Groq reply as text deltas using server-sent events.
+
+    Failures are reported the same way as get_chat_response: the canned
+    reply is yielded as a single delta so the caller can still speak it.
+    An error after part of the reply was yielded is raised instead, so
+    the caller knows the reply is incomplete.
+    """
+    if not GROQ_API_KEY:
+        yield MISSING_KEY_REPLY
+        return
 
-    # Import the get_recent_messages function from database.py
-    from functions.database import get_recent_messages
+    produced = False
+    try:
+        headers, data = await _build_chat_request(message_input, session_id, stream=True)
+        cost = _request_cost(data["messages"])
+        deadline = time.monotonic() + GROQ_MAX_WAIT_SECONDS
+
+        for attempt in range(GROQ_MAX_RETRIES + 1):
+            await groq_limiter.acquire(cost, deadline)
+            try:
+                async for delta in groq_stream.stream(
+                    lambda: _chat_stream_attempt(headers, data),
+                    may_hedge=lambda: groq_limiter.try_acquire(cost),
+                    passthrough=(TooManyRequests,),
+                ):
+                    produced = True
+                    yield delta
+                return
+            except TooManyRequests as e:
+                delay = groq_limiter.on_rate_limited(e.headers, attempt)
+                logger.warning("Groq rate limited", extra={"attempt": attempt + 1, "delay_seconds": round(delay, 2)})
+        groq_limiter.give_up()
+        yield RATE_LIMIT_REPLY
+
+    except RateLimited as e:
+        logger.warning("%s", e)
+        yield RATE_LIMIT_REPLY
+    except CircuitOpen as e:
+        logger.warning("%s", e)
+        yield CONNECTION_ERROR_REPLY
+    except UpstreamError as e:
+        logger.error("Groq API error %s", e.status_code, extra={"body": e.body})
+        if produced:
+            raise
+        yield CONNECTION_ERROR_REPLY
+    except Exception:
+        logger.exception("Error in stream_chat_response")
+        if produced:
+            raise
+        yield PROCESSING_ERROR_REPLY
 
+
+async def _chat_stream_attempt(headers, data):
+    """One streamed /chat/completions request, yielding text deltas"""
+    status = "error"
+    started = time.perf_counter()
     try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json",
-        }
-
-        # Get messages from database including system instructions
-        messages = get_recent_messages()
-
-        # Add the current user message
-        messages.append({"role": "user", "content": message_input})
-
-        data = {
-            "model": "llama-3.1-8b-instant",  # Fast model
-            "messages": messages,
-            "max_tokens": 500,
-            "temperature": 0.7,
-        }
-
-        print("Sending request to Groq API...")
-        response = requests.post(
+        async with get_client("groq").stream(
+            "POST",
             f"{GROQ_BASE_URL}/chat/completions",
             headers=headers,
             json=data,
-            timeout=30,
+        ) as response:
+            status = response.status_code
+            if response.status_code == 429:
+                raise TooManyRequests(response.headers)
+            if response.status_code >= 500:
+                await response.aread()
+                raise UpstreamError("groq", response.status_code, response.text)
+            async for delta in _read_chat_stream(response, data["messages"]):
+                yield delta
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - started, kind="stream", status=status)
+
+
+async def _read_chat_stream(response, messages):
+    """Yield the text deltas of a streamed completion (or the canned reply on an error status)"""
+    if response.status_code != 200:
+        groq_limiter.observe(response.headers)
+        await response.aread()
+        logger.error("Groq API error %s", response.status_code, extra={"body": response.text})
+        yield CONNECTION_ERROR_REPLY
+        return
+
+    groq_limiter.observe(response.headers)
+    reply = []
+    usage = None
+    async for line in response.aiter_lines():
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        event = json.loads(payload)
+        # Usage arrives on the final chunk (x_groq.usage on Groq, usage elsewhere)
+        event_usage = event.get("usage") or (event.get("x_groq") or {}).get("usage")
+        if event_usage:
+            usage = event_usage
+            prefix_stats.observe_usage(usage)
+        choices = event.get("choices") or []
+        if not choices:
+            continue
+        delta = choices[0].get("delta", {}).get("content")
+        if delta:
+            reply.append(delta)
+            yield delta
+
+    groq_limiter.observe(None, _completion_tokens(usage))
+    _record_llm_usage(messages, "".join(reply), usage)
+
+
+# Running summary updates, at most one per session
+_summary_tasks = {}
+
+
+async def update_summary(session_id):
+    """Fold turns that fell out of the token budget into the session's rolling summary"""
+    work = await run_in_stage("io", get_summary_work, session_id)
+    if work is None or not GROQ_API_KEY:
+        return
+    summary, dropped, generation = work
+
+    messages = build_summary_prompt(summary, dropped)
+    # Summaries can wait for the next turn; they never queue ahead of a user's reply
+    if not groq_limiter.try_acquire(_request_cost(messages)):
+        logger.debug("Summary postponed: Groq budget is in use", extra={"session_id": session_id})
+        return
+
+    async def post():
+        started = time.perf_counter()
+        response = await get_client("groq").post(
+            f"{GROQ_BASE_URL}/chat/completions",
+            headers={"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"},
+            json={
+                "model": CHAT_MODEL,
+                "messages": messages,
+                "max_tokens": SUMMARY_MAX_TOKENS,
+                "temperature": 0.2,
+            },
         )
+        LLM_SECONDS.observe(time.perf_counter() - started, kind="summary", status=response.status_code)
+        if response.status_code >= 500:
+            raise UpstreamError("groq", response.status_code, response.text)
+        return response
 
-        print(f"Groq API response status: {response.status_code}")
+    try:
+        response = await groq_summary.call(post)
+    except (CircuitOpen, UpstreamError) as e:
+        logger.warning("Summary skipped: %s", e, extra={"session_id": session_id})
+        return
+    if response.status_code == 429:
+        groq_limiter.on_rate_limited(response.headers, 0)
+        return
+    groq_limiter.observe(response.headers)
+    if response.status_code != 200:
+        logger.error("Groq API error while summarizing: %s", response.status_code, extra={"body": response.text})
+        return
+    result = response.json()
+    new_summary = result["choices"][0]["message"]["content"].strip()
+    _record_llm_usage(messages, new_summary, result.get("usage"))
+    await run_in_stage("io", save_summary, session_id, new_summary, dropped[-1]["turn"], generation)
+    logger.info("Summary updated", extra={"session_id": session_id, "through_turn": dropped[-1]["turn"]})
 
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        elif response.status_code == 429:
-            return "Rate limit exceeded. Please wait a moment and try again."
-        else:
-            print(f"Groq API error: {response.status_code} - {response.text}")
-            return "Sorry, I'm having trouble connecting right now."
 
-    except Exception as e:
-        print("Error in get_chat_response:", e)
-        return "Sorry, I encountered an error while processing your request."
+def schedule_summary_update(session_id):
+    """Start a background summary update for a session after a turn was stored"""
+    if session_id in _summary_tasks:
+        return
+
+    async def run():
+        try:
+            await update_summary(session_id)
+        except Exception:
+            logger.exception("Error updating summary")
+        finally:
+            _summary_tasks.pop(session_id, None)
+
+    _summary_tasks[session_id] = asyncio.ensure_future(run())
 
 
 def check_groq_limits():
-    """Dummy function for main.py import (extend if you add usage limits)."""
-    return {"status": "ok"}
+    """Live request/token budget of the Groq limiter (status ok, throttled or limited)"""
+    return groq_limiter.stats()
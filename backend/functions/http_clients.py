@@ -0,0 +1,76 @@
+# http_clients.py - Shared keep-alive async HTTP clients for the Groq and ElevenLabs upstreams
+
+from decouple import config
+import importlib.util
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Connection pool limits (per upstream)
+HTTP_MAX_CONNECTIONS = config("HTTP_MAX_CONNECTIONS", default=20, cast=int)
+HTTP_MAX_KEEPALIVE = config("HTTP_MAX_KEEPALIVE", default=10, cast=int)
+HTTP_KEEPALIVE_EXPIRY = config("HTTP_KEEPALIVE_EXPIRY", default=30.0, cast=float)
+
+# Separate connect / read budgets instead of one flat timeout=30
+HTTP_CONNECT_TIMEOUT = config("HTTP_CONNECT_TIMEOUT", default=5.0, cast=float)
+HTTP_READ_TIMEOUT = config("HTTP_READ_TIMEOUT", default=30.0, cast=float)
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HTTP2_ENABLED = config("HTTP2_ENABLED", default=True, cast=bool)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+UPSTREAMS = ("groq", "elevenlabs")
+
+_clients = {}
+
+
+def _create_client():
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            HTTP_READ_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+        ),
+    )
+
+
+async def startup_clients():
+    """Open one pooled client per upstream (called on app startup)"""
+    for name in UPSTREAMS:
+        if name not in _clients:
+            _clients[name] = _create_client()
+    logger.info(
+        "HTTP clients ready",
+        extra={"protocol": "HTTP/2" if HTTP2_ENABLED and HTTP2_AVAILABLE else "HTTP/1.1", "max_connections": HTTP_MAX_CONNECTIONS},
+    )
+
+
+async def shutdown_clients():
+    """Close all pooled clients (called on app shutdown)"""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get_client(name):
+    """Return the shared client for an upstream, creating it on first use"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _create_client()
+    return client
+
+
+def get_client_stats():
+    return {
+        "http2": HTTP2_ENABLED and HTTP2_AVAILABLE,
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive": HTTP_MAX_KEEPALIVE,
+        "open_clients": sorted(name for name, client in _clients.items() if not client.is_closed),
+    }
@@ -0,0 +1,149 @@
+# log.py - Structured JSON logging through a background queue, tagged with the request id
+
+from contextvars import ContextVar
+from decouple import config
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import uuid
+
+LOG_LEVEL = config("LOG_LEVEL", default="INFO").upper()
+# "json" for log collectors, "text" for reading in a terminal
+LOG_FORMAT = config("LOG_FORMAT", default="json")
+# Records waiting for the writer thread; when full, new records are dropped instead of blocking
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+# Longer messages and string fields (transcripts, replies, upstream error bodies) are cut
+LOG_MAX_FIELD_CHARS = config("LOG_MAX_FIELD_CHARS", default=300, cast=int)
+
+request_id_var = ContextVar("request_id", default="-")
+
+# LogRecord attributes that aren't user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def truncate(value, limit=LOG_MAX_FIELD_CHARS):
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}… ({len(value)} chars)"
+    return value
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the request id of the task that logged them"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": truncate(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = truncate(value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(
+            f"{key}={truncate(value)!r}" for key, value in vars(record).items() if key not in _RESERVED
+        )
+        line = (
+            f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} "
+            f"[{getattr(record, 'request_id', '-')}] {record.name}: {truncate(record.getMessage())}"
+        )
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped when the queue is full.
+
+    Formatting and the write to stdout happen on the listener thread; the
+    caller only merges the message arguments and enqueues.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message now (arguments may change later) and render the
+        # traceback while its frames still exist; JSON formatting and the
+        # write happen on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging():
+    """Route all logging through one background writer (idempotent)"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # httpx logs every upstream request at INFO
+    logging.getLogger("httpx").setLevel(max(root.level, logging.WARNING))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records (called at shutdown)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_log_stats():
+    return {
+        "level": LOG_LEVEL,
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+    }
@@ -0,0 +1,203 @@
+# metrics.py - Counters and histograms exported at /metrics in the Prometheus text format
+
+from bisect import bisect_left
+import threading
+
+# Latency buckets in seconds, from a cache hit to a slow Whisper pass
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 20.0, 30.0)
+BYTES_BUCKETS = (4096, 16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 5242880, 10485760)
+AUDIO_SECONDS_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic total, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge:
+    """Current value, optionally split by labels"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            # Per-bucket counts; made cumulative when rendered
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(float(bound))),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Pipeline stages (from each turn's TurnTimer)
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "voice_stage_duration_seconds", "Time spent in each pipeline stage of a turn", labelnames=("mode", "stage")))
+TURN_SECONDS = REGISTRY.register(Histogram(
+    "voice_turn_latency_seconds", "Time from the start of a turn to an event (first audio byte, end of turn, ...)",
+    labelnames=("mode", "event")))
+TURNS = REGISTRY.register(Counter("voice_turns", "Conversation turns completed", labelnames=("mode",)))
+REQUESTS = REGISTRY.register(Counter(
+    "voice_http_requests", "HTTP requests by route and status code", labelnames=("route", "status")))
+
+# Speech-to-text
+UPLOAD_BYTES = REGISTRY.register(Histogram("voice_upload_bytes", "Size of uploaded recordings", buckets=BYTES_BUCKETS))
+AUDIO_SECONDS = REGISTRY.register(Counter(
+    "voice_audio_seconds", "Seconds of audio received and actually transcribed after VAD trimming", labelnames=("kind",)))
+STT_AUDIO_SECONDS = REGISTRY.register(Histogram(
+    "voice_stt_audio_duration_seconds", "Length of the audio passed to the model", buckets=AUDIO_SECONDS_BUCKETS))
+STT_SECONDS = REGISTRY.register(Histogram(
+    "voice_stt_inference_seconds", "Model time per transcription, excluding queueing and decoding", labelnames=("backend",)))
+STT_PARTIAL_SECONDS = REGISTRY.register(Histogram(
+    "voice_stt_partial_inference_seconds", "Model time per WebSocket partial transcript", labelnames=("backend",)))
+
+# Groq
+LLM_SECONDS = REGISTRY.register(Histogram(
+    "voice_llm_request_seconds", "Groq chat completion calls", labelnames=("kind", "status")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "voice_llm_tokens", "Prompt and completion tokens (provider usage when reported, else estimated)",
+    labelnames=("direction",)))
+LLM_RATE_LIMITED = REGISTRY.register(Counter(
+    "voice_llm_rate_limit_events", "Groq calls queued for budget, answered with 429, or given up on", labelnames=("outcome",)))
+LLM_RATE_LIMIT_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "voice_llm_rate_limit_wait_seconds", "Time Groq calls waited for request/token budget"))
+
+# ElevenLabs
+TTS_SECONDS = REGISTRY.register(Histogram(
+    "voice_tts_request_seconds", "ElevenLabs synthesis calls (whole response or whole stream)", labelnames=("kind", "status")))
+TTS_CHARACTERS = REGISTRY.register(Counter(
+    "voice_tts_characters", "Characters sent for synthesis, by TTS cache outcome", labelnames=("cache",)))
+
+# Hedging and circuit breakers (Groq and ElevenLabs)
+UPSTREAM_HEDGES = REGISTRY.register(Counter(
+    "voice_upstream_hedged_requests", "Duplicate requests fired after the hedge delay, and how many of them won",
+    labelnames=("upstream", "operation", "outcome")))
+HEDGE_DELAY_SECONDS = REGISTRY.register(Gauge(
+    "voice_upstream_hedge_delay_seconds", "Current adaptive hedge delay", labelnames=("upstream", "operation")))
+UPSTREAM_CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "voice_upstream_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", labelnames=("upstream",)))
+UPSTREAM_CIRCUIT_TRANSITIONS = REGISTRY.register(Counter(
+    "voice_upstream_circuit_transitions", "Circuit breaker state changes", labelnames=("upstream", "state")))
+
+# Persistence
+PERSIST_FLUSH_SECONDS = REGISTRY.register(Histogram(
+    "voice_persist_flush_seconds", "Write-behind group commit latency"))
+PERSIST_TURNS = REGISTRY.register(Counter(
+    "voice_persist_turns", "Conversation turns handled by the write-behind queue", labelnames=("outcome",)))
+
+
+def observe_turn(timer_dict):
+    """Feed one finished TurnTimer into the stage and turn histograms"""
+    mode = timer_dict["mode"]
+    TURNS.inc(mode=mode)
+    for stage, duration_ms in timer_dict["durations_ms"].items():
+        STAGE_SECONDS.observe(duration_ms / 1000, mode=mode, stage=stage)
+    for event, elapsed_ms in timer_dict["marks_ms"].items():
+        TURN_SECONDS.observe(elapsed_ms / 1000, mode=mode, event=event)
+
+
+def render_metrics():
+    return REGISTRY.render()
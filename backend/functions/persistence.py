@@ -0,0 +1,244 @@
+# persistence.py - Write-behind queue that group-commits conversation turns off the request path
+
+from collections import defaultdict
+import logging
+import queue
+import threading
+import time
+
+from functions.metrics import PERSIST_FLUSH_SECONDS, PERSIST_TURNS
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedTurn:
+    """A turn waiting in the queue; stored_through is its assistant message's turn number once written"""
+
+    __slots__ = ("turn", "writing", "stored_through")
+
+    def __init__(self, turn):
+        self.turn = turn
+        self.writing = False
+        self.stored_through = None
+
+
+class WriteBehindQueue:
+    """Background writer for conversation turns.
+
+    Turns are queued by the request handlers and written by one thread in
+    batches of up to max_batch, waiting at most flush_interval after the
+    first queued turn for more to arrive. Resets and summary updates travel
+    through the same queue so they stay ordered with the writes around them.
+    Turns that are queued but not yet written stay visible through
+    read_through(). write_batch returns the last turn number it stored
+    for each session, which tells readers whether a store read already
+    includes a turn.
+    """
+
+    def __init__(self, write_batch, reset_session, save_summary=None, max_batch=32, flush_interval=0.05, max_retries=3):
+        self.write_batch = write_batch
+        self.reset_session = reset_session
+        self.save_summary = save_summary
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        self._pending = defaultdict(list)  # session_id -> QueuedTurns not yet written
+        self._resets = defaultdict(int)  # session_id -> resets applied
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+
+        self.flushes = 0
+        self.turns_written = 0
+        self.turns_dropped = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, session_id, request_message, response_message, request_tokens, response_tokens):
+        """Queue one turn for writing and return immediately"""
+        queued = QueuedTurn((session_id, request_message, response_message, request_tokens, response_tokens))
+        with self._lock:
+            self._pending[session_id].append(queued)
+        self._queue.put(("turn", queued))
+
+    def reset(self, session_id, timeout=10):
+        """Queue a reset after any pending writes and wait until it is applied"""
+        done = threading.Event()
+        self._queue.put(("reset", (session_id, done)))
+        if not done.wait(timeout):
+            raise TimeoutError(f"Reset of session '{session_id}' did not complete in {timeout}s")
+
+    def write_summary(self, session_id, *summary, timeout=10):
+        """Queue a summary update behind the turns it covers and wait until it is applied"""
+        done = threading.Event()
+        self._queue.put(("summary", (session_id, summary, done)))
+        if not done.wait(timeout):
+            raise TimeoutError(f"Summary of session '{session_id}' was not saved in {timeout}s")
+
+    def read_through(self, session_id, read_stored):
+        """Return stored messages plus queued ones, consistent with the writer.
+
+        The store is read without holding the lock; queued turns that were
+        written meanwhile are dropped by turn number, since the read may
+        already include them.
+        """
+        while True:
+            with self._lock:
+                queued = list(self._pending.get(session_id, ()))
+                resets = self._resets[session_id]
+            stored = read_stored()
+            last_turn = stored[-1]["turn"] if stored else 0
+            with self._lock:
+                # A write in progress may or may not be part of the read; wait until it is numbered
+                while any(turn.writing for turn in queued):
+                    self._written.wait()
+                if self._resets[session_id] != resets:
+                    continue
+            unread = [turn for turn in queued if turn.stored_through is None or turn.stored_through > last_turn]
+            return stored + self._messages(unread, last_turn)
+
+    @staticmethod
+    def _messages(queued, last_turn):
+        """Queued turns as messages, numbered to follow the stored ones"""
+        messages = []
+        for turn in queued:
+            _, request_message, response_message, request_tokens, response_tokens = turn.turn
+            messages.append({"role": "user", "content": request_message, "turn": last_turn + 1, "tokens": request_tokens})
+            messages.append({"role": "assistant", "content": response_message, "turn": last_turn + 2, "tokens": response_tokens})
+            last_turn += 2
+        return messages
+
+    def _collect(self, first):
+        """Gather turns for one group commit, stopping early at a control item"""
+        turns = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(turns) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                kind, item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if kind != "turn":
+                return turns, (kind, item)
+            turns.append(item)
+        return turns, None
+
+    def _settle(self, queued, last_turns=None):
+        """Stop treating turns as pending, numbering them from the last turn stored per session (lock held)"""
+        for turn in reversed(queued):
+            session_id = turn.turn[0]
+            if last_turns is not None:
+                turn.stored_through = last_turns[session_id]
+                last_turns[session_id] -= 2
+            turn.writing = False
+            pending = self._pending.get(session_id)
+            if pending and turn in pending:
+                pending.remove(turn)
+                if not pending:
+                    del self._pending[session_id]
+        self._written.notify_all()
+
+    def _flush(self, queued):
+        turns = [turn.turn for turn in queued]
+        started = time.perf_counter()
+        for attempt in range(1, self.max_retries + 1):
+            with self._lock:
+                for turn in queued:
+                    turn.writing = True
+            try:
+                last_turns = self.write_batch(turns)
+                break
+            except Exception as e:
+                with self._lock:
+                    for turn in queued:
+                        turn.writing = False
+                    self._written.notify_all()
+                self.failures += 1
+                logger.warning("Write-behind flush failed (attempt %d/%d): %s", attempt, self.max_retries, e)
+                if attempt == self.max_retries:
+                    logger.error("Dropping %d turns after %d failed flushes", len(turns), attempt, exc_info=True)
+                    with self._lock:
+                        self._settle(queued)
+                    self.turns_dropped += len(turns)
+                    PERSIST_TURNS.inc(len(turns), outcome="dropped")
+                    return
+                time.sleep(0.1 * attempt)
+
+        with self._lock:
+            self._settle(queued, dict(last_turns))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        PERSIST_FLUSH_SECONDS.observe(elapsed_ms / 1000)
+        PERSIST_TURNS.inc(len(turns), outcome="written")
+        self.flushes += 1
+        self.turns_written += len(turns)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+    def _apply_control(self, kind, item):
+        if kind == "reset":
+            session_id, done = item
+            try:
+                # Counted first, so a read that may see the reset starts over
+                with self._lock:
+                    self._resets[session_id] += 1
+                self.reset_session(session_id)
+            except Exception as e:
+                logger.error("Reset of session failed: %s", e, extra={"session_id": session_id})
+            finally:
+                done.set()
+            return True
+        if kind == "summary":
+            session_id, summary, done = item
+            try:
+                self.save_summary(session_id, *summary)
+            except Exception as e:
+                logger.error("Saving summary failed: %s", e, extra={"session_id": session_id})
+            finally:
+                done.set()
+            return True
+        return False  # stop
+
+    def _run(self):
+        while True:
+            kind, item = self._queue.get()
+            if kind == "turn":
+                turns, control = self._collect(item)
+                self._flush(turns)
+                if control is None:
+                    continue
+                kind, item = control
+            if not self._apply_control(kind, item):
+                break
+
+    def drain(self, timeout=10):
+        """Write everything still queued and stop the writer (called on shutdown)"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(("stop", None))
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Write-behind queue did not drain within %ss (%d items left)", timeout, self._queue.qsize())
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(turns) for turns in self._pending.values())
+        return {
+            "queue_depth": self._queue.qsize(),
+            "pending_turns": pending,
+            "flushes": self.flushes,
+            "turns_written": self.turns_written,
+            "turns_dropped": self.turns_dropped,
+            "failures": self.failures,
+            "avg_batch": round(self.turns_written / self.flushes, 2) if self.flushes else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
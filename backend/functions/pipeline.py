@@ -0,0 +1,193 @@
+# pipeline.py - Streaming LLM -> TTS pipeline (speak sentences while Groq is still generating)
+
+from decouple import config
+import asyncio
+import logging
+import re
+
+from functions.audio_formats import SOURCE_FORMAT, default_format, transcode_stream
+from functions.grouq_api import CannedReply, stream_chat_response
+from functions.text_to_speech import store_reply_audio, stream_text_to_speech
+from functions.tts_cache import tts_cache
+
+logger = logging.getLogger(__name__)
+
+# Don't send tiny fragments ("Sure.") to TTS on their own
+MIN_SENTENCE_CHARS = config("MIN_SENTENCE_CHARS", default=20, cast=int)
+# Sentences synthesized at once per turn: the one being sent plus those started ahead of it
+TTS_SENTENCES_IN_FLIGHT = config("TTS_SENTENCES_IN_FLIGHT", default=2, cast=int)
+
+# Sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+
+async def iter_sentences(deltas, min_chars=MIN_SENTENCE_CHARS):
+    """Regroup an async stream of text deltas into sentence-sized chunks"""
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        search_from = 0
+        while True:
+            match = SENTENCE_BOUNDARY.search(buffer, search_from)
+            if not match:
+                break
+            if match.end() < min_chars:
+                search_from = match.end()
+                continue
+            sentence = buffer[:match.end()].strip()
+            buffer = buffer[match.end():]
+            search_from = 0
+            if sentence:
+                yield sentence
+
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def _timed_deltas(deltas, timer, canned):
+    async for delta in deltas:
+        timer.mark("llm_first_token")
+        if isinstance(delta, CannedReply):
+            canned.append(delta)
+        yield delta
+
+
+class SpeechJob:
+    """Streams one text through ElevenLabs in a background task.
+
+    Chunks are buffered in an asyncio queue as they arrive, so a job can be
+    started early (e.g. for the next sentence) and read later in order.
+    """
+
+    def __init__(self, text, timer=None, audio_format=None):
+        self.text = text
+        self.timer = timer
+        self.audio_format = audio_format
+        self.failed = False
+        self._chunks = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        try:
+            async for chunk in stream_text_to_speech(self.text, self.audio_format):
+                self._chunks.put_nowait(chunk)
+        except Exception as e:
+            self.failed = True
+            logger.error("TTS failed for a sentence: %s", e, extra={"chars": len(self.text)})
+        finally:
+            self._chunks.put_nowait(None)
+
+    async def chunks(self):
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                break
+            if self.timer:
+                self.timer.mark("tts_first_audio")
+            yield chunk
+
+    def cancel(self):
+        self._task.cancel()
+
+
+async def stream_speech(text, timer=None, audio_format=None):
+    """Async generator of audio chunks for text, forwarded as ElevenLabs sends them"""
+    job = SpeechJob(text, timer, audio_format)
+    try:
+        async for chunk in job.chunks():
+            yield chunk
+    finally:
+        job.cancel()
+
+
+async def stream_reply_audio(message_input, timer, session_id, on_complete=None, audio_format=None):
+    """Async generator of reply audio chunks, sentence by sentence, in order.
+
+    Groq is streamed in a background task; every finished sentence is
+    handed to its own TTS job so synthesis overlaps generation, with at
+    most TTS_SENTENCES_IN_FLIGHT jobs started and not yet sent. Audio is
+    forwarded as soon as the previous sentences have been sent.
+    on_complete receives the full reply text once it has all been sent,
+    and isn't called for canned replies, failed synthesis or a client
+    that went away: only those turns are stored.
+
+    Formats whose clips can't simply be concatenated (Ogg) are
+    synthesized as MP3 per sentence and encoded as one stream. The audio
+    sent is recorded under reply_audio_id(reply text, audio_format) so
+    clients can fetch it again from GET /audio/{id}.
+    """
+    audio_format = audio_format or default_format()
+    reply = []
+
+    if audio_format.chainable:
+        chunks = _reply_audio(message_input, timer, session_id, reply.append, audio_format)
+    else:
+        chunks = transcode_stream(_reply_audio(message_input, timer, session_id, reply.append, SOURCE_FORMAT), audio_format)
+    received = []
+    try:
+        async for chunk in chunks:
+            if tts_cache.serves_files:
+                received.append(chunk)
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+    # Only after the encoded stream was sent too, which the Ogg encoder lags behind
+    if reply and on_complete:
+        on_complete(reply[0])
+    if reply and received:
+        try:
+            await store_reply_audio(reply[0], audio_format, b"".join(received))
+        except Exception:
+            logger.exception("Could not record reply audio")
+
+
+async def _reply_audio(message_input, timer, session_id, on_complete, audio_format):
+    tts_jobs = asyncio.Queue()
+    # Bounds the ElevenLabs requests (and buffered audio) a turn has ahead of the client
+    slots = asyncio.Semaphore(max(1, TTS_SENTENCES_IN_FLIGHT))
+    spoken = []
+    canned = []
+
+    async def produce():
+        try:
+            deltas = _timed_deltas(stream_chat_response(message_input, session_id), timer, canned)
+            async for sentence in iter_sentences(deltas):
+                timer.mark("llm_first_sentence")
+                spoken.append(sentence)
+                await slots.acquire()
+                tts_jobs.put_nowait(SpeechJob(sentence, timer, audio_format))
+        finally:
+            timer.mark("llm_done")
+            tts_jobs.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce())
+    job = None
+    complete = True
+    try:
+        while True:
+            job = await tts_jobs.get()
+            if job is None:
+                break
+            async for chunk in job.chunks():
+                yield chunk
+            slots.release()
+            complete = complete and not job.failed
+
+        try:
+            await producer
+        except Exception as e:
+            complete = False
+            logger.exception("Error streaming chat response")
+    finally:
+        producer.cancel()
+        if job is not None:
+            job.cancel()
+        while not tts_jobs.empty():
+            pending = tts_jobs.get_nowait()
+            if pending is not None:
+                pending.cancel()
+
+    # Reached only when the client took the whole reply (not on disconnect)
+    if on_complete and complete and spoken and not canned:
+        on_complete(" ".join(spoken))
@@ -0,0 +1,104 @@
+# prompt.py - Byte-stable prompt prefix per session, so provider-side prompt caching can hit
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+SYSTEM_PROMPT = "You are a sales person selling cars and houses  . Ask relevant Q , user is Noufal. Keep your answer under 25 words with simple language to understand."
+
+# One style per session, picked from the session id so it is the same on every
+# turn (and after a restart) instead of changing the system prompt per call
+STYLE_VARIANTS = (
+    " Your response will include some  humour.",
+    " Your response will include a rather user freandly qustion.",
+)
+
+# Sessions whose last prompt is remembered for prefix statistics
+PREFIX_TRACKED_SESSIONS = 1024
+
+
+def pinned_style(session_id):
+    digest = hashlib.sha256(session_id.encode("utf-8")).digest()
+    return STYLE_VARIANTS[digest[0] % len(STYLE_VARIANTS)]
+
+
+def system_message(session_id):
+    """The session's system prompt: identical bytes on every turn"""
+    return {"role": "system", "content": SYSTEM_PROMPT + pinned_style(session_id)}
+
+
+def _message_hashes(messages):
+    return [hashlib.sha256(json.dumps(message, sort_keys=True).encode("utf-8")).digest() for message in messages]
+
+
+class PrefixStats:
+    """How much of each prompt repeats the previous prompt of the same session.
+
+    The local side compares message hashes with the session's previous
+    request. The provider side sums cached prompt tokens when the usage
+    block reports them (prompt_tokens_details.cached_tokens).
+    """
+
+    def __init__(self, max_sessions=PREFIX_TRACKED_SESSIONS):
+        self.max_sessions = max_sessions
+        self._last = OrderedDict()  # session_id -> message hashes of the previous prompt
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.messages = 0
+        self.reused_messages = 0
+        self.full_prefix_hits = 0
+        self.usage_reports = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def observe_prompt(self, session_id, messages):
+        """Record how many leading messages match the session's previous prompt"""
+        hashes = _message_hashes(messages[:-1])  # everything before the new user message
+        with self._lock:
+            previous = self._last.pop(session_id, [])
+            reused = 0
+            for old, new in zip(previous, hashes):
+                if old != new:
+                    break
+                reused += 1
+            self._last[session_id] = hashes + _message_hashes(messages[-1:])
+            while len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+
+            self.requests += 1
+            self.messages += len(hashes)
+            self.reused_messages += reused
+            # The whole previous prompt is a prefix of this one
+            if previous and reused == len(previous):
+                self.full_prefix_hits += 1
+
+    def observe_usage(self, usage):
+        """Record a provider usage block (non-streaming body or final stream chunk)"""
+        if not usage:
+            return
+        details = usage.get("prompt_tokens_details") or {}
+        with self._lock:
+            self.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+            if "cached_tokens" in details:
+                self.usage_reports += 1
+                self.cached_tokens += details["cached_tokens"] or 0
+
+    def forget(self, session_id):
+        with self._lock:
+            self._last.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "full_prefix_hits": self.full_prefix_hits,
+                "reused_message_ratio": round(self.reused_messages / self.messages, 3) if self.messages else 0.0,
+                "provider_reports": self.usage_reports,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_token_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            }
+
+
+prefix_stats = PrefixStats()
@@ -0,0 +1,250 @@
+# rate_limit.py - Client-side Groq rate limiting from the x-ratelimit-* response headers
+
+from decouple import config
+import asyncio
+import random
+import re
+import time
+
+from functions.metrics import LLM_RATE_LIMIT_WAIT_SECONDS, LLM_RATE_LIMITED
+
+# Starting budgets until Groq's headers report the real ones (free tier for llama-3.1-8b-instant)
+GROQ_RPM_LIMIT = config("GROQ_RPM_LIMIT", default=30, cast=int)
+GROQ_TPM_LIMIT = config("GROQ_TPM_LIMIT", default=6000, cast=int)
+# Longest a turn may wait for budget, across queueing and retries, before the canned reply is used
+GROQ_MAX_WAIT_SECONDS = config("GROQ_MAX_WAIT_SECONDS", default=8.0, cast=float)
+GROQ_MAX_RETRIES = config("GROQ_MAX_RETRIES", default=3, cast=int)
+# Retry delays after a 429 grow from this base (doubling per attempt) with random jitter
+GROQ_BACKOFF_BASE = config("GROQ_BACKOFF_BASE", default=0.5, cast=float)
+
+# Completion length assumed before any reply has been measured
+DEFAULT_COMPLETION_TOKENS = 60
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RateLimited(Exception):
+    """No budget within the allowed wait"""
+
+    def __init__(self, wait_seconds):
+        super().__init__(f"Groq rate limit: next slot in {wait_seconds:.1f}s")
+        self.wait_seconds = wait_seconds
+
+
+class TooManyRequests(Exception):
+    """A 429 from the upstream; carries the response headers for the limiter"""
+
+    def __init__(self, headers):
+        super().__init__("429 Too Many Requests")
+        self.headers = headers
+
+
+def parse_duration(value):
+    """Seconds from a reset header: "7.66s", "2m59.56s", "250ms" or a plain number"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_number(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class Bucket:
+    """A token bucket that refills continuously and is corrected by the server's headers.
+
+    The refill rate comes from the reset header: the server reports how long
+    until the used part of the budget (limit - remaining) is back, so the
+    same model fits per-minute and per-day windows.
+    """
+
+    def __init__(self, name, limit, window=60.0):
+        self.name = name
+        self.limit = float(limit)
+        self.remaining = float(limit)
+        self.rate = self.limit / window if window else 0.0  # units per second
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if self.rate:
+            self.remaining = min(self.limit, self.remaining + self.rate * (now - self.updated))
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Seconds until `cost` units are available (0 if they are now)"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.limit <= 0:
+            return 0.0
+        # A request larger than the whole budget only waits for a full bucket
+        needed = min(cost, self.limit)
+        if self.remaining >= needed:
+            return 0.0
+        return (needed - self.remaining) / self.rate if self.rate else 60.0
+
+    def take(self, cost):
+        self.remaining -= cost
+
+    def update(self, limit, remaining, reset_seconds, now):
+        if limit is not None:
+            self.limit = limit
+        # Headers of a response that started before a 429 must not lift the block
+        if remaining is None or now < self.blocked_until:
+            return
+        self.remaining = remaining
+        self.updated = now
+        if reset_seconds and self.limit > remaining:
+            self.rate = (self.limit - remaining) / reset_seconds
+
+    def block(self, seconds, now):
+        self.remaining = min(self.remaining, 0.0)
+        self.updated = now
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def stats(self, now):
+        self._refill(now)
+        return {
+            "limit": int(self.limit),
+            "remaining": max(0, int(self.remaining)),
+            "refill_per_minute": round(self.rate * 60, 1),
+            "blocked_seconds": round(max(0.0, self.blocked_until - now), 2),
+        }
+
+
+class RateLimiter:
+    """Request and token buckets for one upstream, shared by every call in this process.
+
+    Callers wait in FIFO order for budget, so bursts are spread out instead
+    of turning into 429s. After a 429 the buckets are blocked for the
+    server's retry-after plus a jittered exponential backoff.
+    """
+
+    def __init__(self, requests_per_minute=GROQ_RPM_LIMIT, tokens_per_minute=GROQ_TPM_LIMIT):
+        self.buckets = {
+            "requests": Bucket("requests", requests_per_minute),
+            "tokens": Bucket("tokens", tokens_per_minute),
+        }
+        self._lock = asyncio.Lock()
+        self.completion_tokens = float(DEFAULT_COMPLETION_TOKENS)
+        self.requests = 0
+        self.queued = 0
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+        self.gave_up = 0
+        self.header_updates = 0
+
+    def estimate(self, prompt_tokens):
+        """Tokens a call will use: its prompt plus a typical completion"""
+        return prompt_tokens + int(self.completion_tokens)
+
+    def _wait_time(self, tokens, now):
+        return max(
+            self.buckets["requests"].wait_time(1, now),
+            self.buckets["tokens"].wait_time(tokens, now),
+        )
+
+    def _take(self, tokens):
+        self.buckets["requests"].take(1)
+        self.buckets["tokens"].take(tokens)
+        self.requests += 1
+
+    async def acquire(self, tokens, deadline):
+        """Wait (in arrival order) until the call fits both buckets; RateLimited past the deadline"""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    self._take(tokens)
+                    break
+                if now + wait > deadline:
+                    self.give_up()
+                    raise RateLimited(wait)
+                await asyncio.sleep(wait)
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.queued += 1
+            self.waited_seconds += waited
+            LLM_RATE_LIMITED.inc(outcome="queued")
+        LLM_RATE_LIMIT_WAIT_SECONDS.observe(waited)
+
+    def give_up(self):
+        self.gave_up += 1
+        LLM_RATE_LIMITED.inc(outcome="gave_up")
+
+    def try_acquire(self, tokens):
+        """Take budget only if it is free right now and nobody is waiting (background work)"""
+        if self._lock.locked() or self._wait_time(tokens, time.monotonic()) > 0:
+            return False
+        self._take(tokens)
+        return True
+
+    def observe(self, headers, completion_tokens=None):
+        """Resynchronize the buckets from a response's x-ratelimit-* headers"""
+        now = time.monotonic()
+        for name, bucket in self.buckets.items() if headers else ():
+            limit = _header_number(headers, f"x-ratelimit-limit-{name}")
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{name}")
+            if limit is None and remaining is None:
+                continue
+            bucket.update(limit, remaining, parse_duration(headers.get(f"x-ratelimit-reset-{name}")), now)
+            self.header_updates += 1
+        if completion_tokens:
+            self.completion_tokens = 0.8 * self.completion_tokens + 0.2 * completion_tokens
+
+    def on_rate_limited(self, headers, attempt):
+        """Block the exhausted bucket(s) after a 429; returns the delay before the next attempt"""
+        self.rate_limited += 1
+        LLM_RATE_LIMITED.inc(outcome="429")
+        self.observe(headers)
+        retry_after = parse_duration(headers.get("retry-after")) or 0.0
+        delay = retry_after + random.uniform(0, GROQ_BACKOFF_BASE * 2 ** attempt)
+        now = time.monotonic()
+        exhausted = [
+            bucket for name, bucket in self.buckets.items()
+            if _header_number(headers, f"x-ratelimit-remaining-{name}") == 0
+        ]
+        # The reset headers give the time to a *full* bucket; the next call only
+        # needs retry-after, after which the bucket's refill rate takes over
+        for bucket in exhausted or self.buckets.values():
+            bucket.block(delay, now)
+        return delay
+
+    def stats(self):
+        now = time.monotonic()
+        wait = self._wait_time(self.estimate(0), now)
+        if any(bucket.blocked_until > now for bucket in self.buckets.values()):
+            status = "limited"
+        elif wait > 0 or self._lock.locked():
+            status = "throttled"
+        else:
+            status = "ok"
+        return {
+            "status": status,
+            "next_slot_seconds": round(wait, 2),
+            **{name: bucket.stats(now) for name, bucket in self.buckets.items()},
+            "calls": self.requests,
+            "queued": self.queued,
+            "waited_seconds": round(self.waited_seconds, 2),
+            "rate_limited": self.rate_limited,
+            "gave_up": self.gave_up,
+            "from_headers": self.header_updates > 0,
+            "max_wait_seconds": GROQ_MAX_WAIT_SECONDS,
+        }
+
+
+groq_limiter = RateLimiter()
@@ -0,0 +1,367 @@
+# realtime.py - Full-duplex conversation over a WebSocket with incremental partial transcripts
+
+from collections import deque
+from decouple import config
+from starlette.websockets import WebSocketDisconnect
+import asyncio
+import json
+import logging
+import numpy as np
+
+from functions.audio_formats import UnknownFormat, default_format, negotiate_format
+from functions.audio_io import SAMPLE_RATE, decode_audio
+from functions.database import store_messages
+from functions.grouq_api import convert_audio_to_text, schedule_summary_update, transcribe_partial
+from functions.log import new_request_id, request_id_var
+from functions.pipeline import stream_reply_audio
+from functions.text_to_speech import reply_audio_id
+from functions.tts_cache import tts_cache
+from functions.timings import TurnTimer, record_turn
+from functions.vad import EnergyVAD
+from functions.workers import POOLS, run_in_stage
+
+logger = logging.getLogger(__name__)
+
+# Run a partial transcription every WS_PARTIAL_INTERVAL seconds of new audio,
+# over at most the last WS_PARTIAL_WINDOW seconds
+WS_PARTIAL_INTERVAL = config("WS_PARTIAL_INTERVAL", default=1.0, cast=float)
+WS_PARTIAL_WINDOW = config("WS_PARTIAL_WINDOW", default=10.0, cast=float)
+# Trailing silence that ends an utterance (after some speech has been heard)
+WS_END_SILENCE_MS = config("WS_END_SILENCE_MS", default=800, cast=int)
+WS_MAX_UTTERANCE_SECONDS = config("WS_MAX_UTTERANCE_SECONDS", default=30.0, cast=float)
+
+# pcm16: raw little-endian 16-bit mono frames; anything else is a container
+# (webm/ogg Opus from MediaRecorder) decoded through ffmpeg
+RAW_FORMATS = ("pcm16",)
+
+
+class LinearResampler:
+    """Linear resampling to 16 kHz of audio that arrives in frames.
+
+    Output sample k is interpolated at input position k * rate / 16000
+    counted from the start of the stream, and the last input sample is
+    carried over, so framing doesn't change the result.
+    """
+
+    def __init__(self, sample_rate):
+        self.step = sample_rate / SAMPLE_RATE
+        self._received = 0  # input samples so far
+        self._produced = 0  # output samples so far
+        self._last = None
+
+    def __call__(self, samples):
+        start = self._received
+        self._received += len(samples)
+        if self._last is not None:
+            samples = np.concatenate(([self._last], samples))
+            start -= 1
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+        self._last = samples[-1]
+
+        available = int((self._received - 1) // self.step) + 1
+        positions = np.arange(self._produced, available) * self.step - start
+        self._produced = max(self._produced, available)
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class Utterance:
+    """Audio received for the current user turn"""
+
+    def __init__(self, audio_format="pcm16", sample_rate=SAMPLE_RATE):
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self._resample = LinearResampler(sample_rate) if sample_rate != SAMPLE_RATE else None
+        self._pcm = []
+        self._samples = 0
+        self._encoded = bytearray()
+        self._decoded = np.zeros(0, dtype=np.float32)
+        self.partial_at = 0.0  # seconds of audio covered by the last partial
+
+    @property
+    def raw(self):
+        return self.audio_format in RAW_FORMATS
+
+    def add(self, data):
+        """Append a frame; returns its 16 kHz samples for raw input (None for encoded input)"""
+        if self.raw:
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], np.int16).astype(np.float32) / 32768.0
+            if self._resample is not None:
+                samples = self._resample(samples)
+            self._pcm.append(samples)
+            self._samples += len(samples)
+            return samples
+        self._encoded.extend(data)
+        return None
+
+    def seconds(self):
+        """Seconds of audio decoded so far (encoded input only counts once decoded)"""
+        return (self._samples if self.raw else len(self._decoded)) / SAMPLE_RATE
+
+    def pcm(self):
+        """All audio as float32 PCM (blocking: decodes encoded input)"""
+        if self.raw:
+            # Runs on a worker thread while the event loop keeps appending frames
+            chunks = list(self._pcm)
+            if not chunks:
+                return np.zeros(0, dtype=np.float32)
+            if len(chunks) == 1:
+                return chunks[0]
+            merged = np.concatenate(chunks)
+            self._pcm[:len(chunks)] = [merged]
+            return merged
+        if self._encoded:
+            self._decoded = decode_audio(bytes(self._encoded))
+        return self._decoded
+
+    def __bool__(self):
+        return bool(self._samples or self._encoded)
+
+
+def _ended(speech, tail):
+    return len(speech) > tail and speech[:-tail].any() and not speech[-tail:].any()
+
+
+def speech_ended(audio, vad, end_silence_ms=WS_END_SILENCE_MS):
+    """True once speech has been heard and the last end_silence_ms are silent"""
+    _, speech = vad.speech_frames(audio)
+    return _ended(speech, max(1, end_silence_ms // vad.frame_ms))
+
+
+class Endpointer:
+    """speech_ended() over the last window_seconds of raw audio, kept up to date frame by frame.
+
+    Only new samples are analysed: the RMS and zero-crossing rate of each
+    complete VAD frame are kept for the window, so the check after every
+    WebSocket frame costs the same however long the utterance gets.
+    """
+
+    def __init__(self, vad, window_seconds=WS_PARTIAL_WINDOW, end_silence_ms=WS_END_SILENCE_MS):
+        self.vad = vad
+        self.frame_length = max(1, int(SAMPLE_RATE * vad.frame_ms / 1000))
+        frames = max(1, int(window_seconds * 1000 / vad.frame_ms))
+        self.tail = max(1, end_silence_ms // vad.frame_ms)
+        self._rms = deque(maxlen=frames)
+        self._zcr = deque(maxlen=frames)
+        self._rest = np.zeros(0, dtype=np.float32)
+        self.ended = False
+
+    def add(self, samples):
+        """Feed new 16 kHz samples; returns whether the utterance has ended"""
+        audio = np.concatenate([self._rest, samples]) if len(self._rest) else samples
+        n_frames = len(audio) // self.frame_length
+        self._rest = audio[n_frames * self.frame_length:]
+        if n_frames:
+            frames = audio[:n_frames * self.frame_length].reshape(n_frames, self.frame_length)
+            rms, zcr = self.vad.features(frames)
+            self._rms.extend(rms)
+            self._zcr.extend(zcr)
+            speech = self.vad.classify(np.array(self._rms), np.array(self._zcr))
+            self.ended = _ended(speech, self.tail)
+        return self.ended
+
+
+class ConversationSocket:
+    """One /ws/converse connection.
+
+    Client -> server: an optional {"type": "start", "format": "pcm16" | "webm" | "ogg",
+    "sample_rate": 16000, "reply_format": "mp3" | "mp3_low" | "opus"} message,
+    binary audio frames, and {"type": "end"} to finish an utterance early
+    (otherwise trailing silence ends it).
+    Server -> client: {"type": "partial"}, {"type": "final"} and {"type": "reply_start",
+    "content_type": ...} messages, the reply as binary audio frames, then
+    {"type": "reply_end", "audio_id": ...}.
+
+    Replies run in their own tasks while the socket keeps reading, so the
+    client can stream the next utterance (and get its partials) while a
+    reply is still playing. Replies are sent one at a time, in order.
+    """
+
+    def __init__(self, websocket, session_id, reply_format=None):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.reply_format = reply_format or default_format()
+        self.vad = EnergyVAD()
+        self.audio_format = "pcm16"
+        self.sample_rate = SAMPLE_RATE
+        self.utterance = None
+        self.new_utterance()
+        self._partial_task = None
+        self._reply_tasks = set()
+        self._last_text = ""
+        self._reply_lock = asyncio.Lock()
+        self._send_lock = asyncio.Lock()
+
+    def new_utterance(self):
+        """Start collecting the next utterance; returns the previous one"""
+        previous = self.utterance
+        self.utterance = Utterance(self.audio_format, self.sample_rate)
+        self.endpointer = Endpointer(self.vad)
+        return previous
+
+    async def send_event(self, event_type, **fields):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps({"type": event_type, **fields}))
+
+    async def send_audio(self, chunk):
+        async with self._send_lock:
+            await self.websocket.send_bytes(chunk)
+
+    async def run(self):
+        await self.websocket.accept()
+        await self.send_event("ready", session_id=self.session_id, sample_rate=SAMPLE_RATE)
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self.on_audio(message["bytes"])
+                elif message.get("text") is not None:
+                    await self.on_control(message["text"])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if self._partial_task:
+                self._partial_task.cancel()
+            for task in list(self._reply_tasks):
+                task.cancel()
+            logger.info("WebSocket closed", extra={"session_id": self.session_id})
+
+    async def on_control(self, text):
+        try:
+            event = json.loads(text)
+        except json.JSONDecodeError:
+            await self.send_event("error", detail="Control messages must be JSON")
+            return
+
+        if event.get("type") == "start":
+            try:
+                sample_rate = int(event.get("sample_rate", SAMPLE_RATE))
+            except (TypeError, ValueError):
+                sample_rate = 0
+            if sample_rate <= 0:
+                await self.send_event("error", detail=f"Invalid sample_rate: {event.get('sample_rate')!r}")
+                return
+            self.audio_format = event.get("format", "pcm16")
+            self.sample_rate = sample_rate
+            if event.get("reply_format"):
+                try:
+                    self.reply_format = negotiate_format(event["reply_format"])
+                except UnknownFormat as e:
+                    await self.send_event("error", detail=str(e))
+            self.new_utterance()
+        elif event.get("type") == "end":
+            await self.finish_utterance()
+        else:
+            await self.send_event("error", detail=f"Unknown message type: {event.get('type')}")
+
+    async def on_audio(self, data):
+        samples = self.utterance.add(data)
+        utterance = self.utterance
+
+        if utterance.raw:
+            ended = self.endpointer.add(samples)
+            if ended or utterance.seconds() >= WS_MAX_UTTERANCE_SECONDS:
+                await self.finish_utterance()
+                return
+
+        # One partial at a time, and only when the STT pool has no backlog
+        busy = self._partial_task is not None and not self._partial_task.done()
+        if not busy and POOLS["stt"].stats()["queued"] == 0:
+            self._partial_task = asyncio.ensure_future(self.partial(utterance))
+
+    async def partial(self, utterance):
+        """Transcribe the tail of the utterance so far and send it as a partial"""
+        try:
+            pcm = await run_in_stage("stt", utterance.pcm)
+            seconds = len(pcm) / SAMPLE_RATE
+            if seconds - utterance.partial_at < WS_PARTIAL_INTERVAL:
+                return
+            utterance.partial_at = seconds
+
+            if not utterance.raw:
+                if seconds >= WS_MAX_UTTERANCE_SECONDS or await run_in_stage("stt", speech_ended, pcm, self.vad):
+                    if utterance is self.utterance:
+                        await self.finish_utterance()
+                    return
+
+            window = pcm[-int(WS_PARTIAL_WINDOW * SAMPLE_RATE):]
+            text = await run_in_stage("stt", transcribe_partial, window)
+            if text and utterance is self.utterance and text != self._last_text:
+                self._last_text = text
+                await self.send_event("partial", text=text, seconds=round(seconds, 2))
+        except Exception as e:
+            logger.warning("Partial transcription failed: %s", e)
+
+    async def finish_utterance(self):
+        """Start a new utterance and answer the finished one in a reply task"""
+        utterance = self.new_utterance()
+        self._last_text = ""
+        if self._partial_task and self._partial_task is not asyncio.current_task():
+            self._partial_task.cancel()
+        self._partial_task = None
+        if not utterance:
+            return
+
+        task = asyncio.ensure_future(self._queued_reply(utterance))
+        self._reply_tasks.add(task)
+        task.add_done_callback(self._reply_tasks.discard)
+
+    async def _queued_reply(self, utterance):
+        # One reply at a time per socket; later utterances wait their turn
+        try:
+            async with self._reply_lock:
+                await self._reply(utterance)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Usually the client went away mid-reply
+            logger.warning("WebSocket reply failed: %s", e)
+
+    async def _reply(self, utterance):
+        """Final transcription, then stream the spoken reply back on the socket"""
+
+        # Each turn on the socket gets its own request id
+        request_id_var.set(new_request_id())
+        timer = TurnTimer(mode="websocket")
+        try:
+            with timer.stage("stt"):
+                pcm = await run_in_stage("stt", utterance.pcm)
+                text = await run_in_stage("stt", convert_audio_to_text, pcm)
+        except Exception as e:
+            logger.error("Final transcription failed: %s", e)
+            await self.send_event("error", detail="Audio transcription failed")
+            return
+
+        if text is None:
+            await self.send_event("error", detail="Audio transcription failed")
+            return
+        if not text:
+            # No speech in the utterance
+            await self.send_event("final", text="")
+            return
+        await self.send_event("final", text=text)
+
+        reply = []
+
+        def on_complete(chat_response):
+            reply.append(chat_response)
+            try:
+                store_messages(text, chat_response, self.session_id)
+                schedule_summary_update(self.session_id)
+            except Exception:
+                logger.exception("Error storing messages")
+
+        await self.send_event("reply_start", content_type=self.reply_format.content_type)
+        try:
+            async for chunk in stream_reply_audio(
+                text, timer, self.session_id, on_complete=on_complete, audio_format=self.reply_format
+            ):
+                timer.mark("first_byte")
+                await self.send_audio(chunk)
+        finally:
+            record_turn(timer)
+        # The reply's audio is recorded once the stream ends, for replay through GET /audio/{id}
+        stored = {"audio_id": reply_audio_id(reply[0], self.reply_format)} if reply and tts_cache.serves_files else {}
+        await self.send_event("reply_end", timings=timer.as_dict(), **stored)
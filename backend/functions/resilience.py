@@ -0,0 +1,268 @@
+# resilience.py - Hedged requests and circuit breakers for the Groq and ElevenLabs upstreams
+
+from collections import deque
+from decouple import config
+import asyncio
+import logging
+import time
+
+from functions.metrics import HEDGE_DELAY_SECONDS, UPSTREAM_CIRCUIT_STATE, UPSTREAM_CIRCUIT_TRANSITIONS, UPSTREAM_HEDGES
+
+logger = logging.getLogger(__name__)
+
+# Fire a duplicate request when the first one is slower than this percentile of recent calls
+HEDGE_ENABLED = config("HEDGE_ENABLED", default=True, cast=bool)
+HEDGE_PERCENTILE = config("HEDGE_PERCENTILE", default=95, cast=float)
+HEDGE_MIN_DELAY_MS = config("HEDGE_MIN_DELAY_MS", default=150, cast=int)
+HEDGE_MAX_DELAY_MS = config("HEDGE_MAX_DELAY_MS", default=4000, cast=int)
+# Calls observed before hedging starts, and the most calls (share of recent ones) that may be duplicated
+HEDGE_MIN_SAMPLES = config("HEDGE_MIN_SAMPLES", default=20, cast=int)
+HEDGE_MAX_RATIO = config("HEDGE_MAX_RATIO", default=0.1, cast=float)
+# Consecutive failures (errors, timeouts, 5xx) that open a breaker, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = config("CIRCUIT_FAILURE_THRESHOLD", default=5, cast=int)
+CIRCUIT_OPEN_SECONDS = config("CIRCUIT_OPEN_SECONDS", default=30.0, cast=float)
+
+LATENCY_WINDOW = 200
+
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(Exception):
+    """The upstream is failing; the call was not attempted"""
+
+    def __init__(self, upstream):
+        super().__init__(f"{upstream} circuit is open")
+        self.upstream = upstream
+
+
+class UpstreamError(Exception):
+    """A server-side failure (5xx) that counts against the circuit breaker"""
+
+    def __init__(self, upstream, status_code, body=""):
+        super().__init__(f"{upstream} returned {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+class CircuitBreaker:
+    """closed -> open after CIRCUIT_FAILURE_THRESHOLD consecutive failures;
+    open -> half_open after CIRCUIT_OPEN_SECONDS, when one probe call is let
+    through; the probe's outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, upstream, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.short_circuited = 0
+        UPSTREAM_CIRCUIT_STATE.set(0, upstream=upstream)
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        logger.warning("Circuit %s", state, extra={"upstream": self.upstream, "failures": self.failures})
+        self.state = state
+        UPSTREAM_CIRCUIT_STATE.set(_STATE_VALUES[state], upstream=self.upstream)
+        UPSTREAM_CIRCUIT_TRANSITIONS.inc(upstream=self.upstream, state=state)
+
+    def allow(self):
+        """Whether a call may go out now (a half-open circuit admits one probe)"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._set_state("half_open")
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_in_flight = False
+        self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release(self):
+        """The call ended without an outcome (cancelled): let another probe through"""
+        self.probe_in_flight = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "open_for_seconds": round(max(0.0, self.opened_at + self.open_seconds - time.monotonic()), 1)
+            if self.state == "open" else 0.0,
+        }
+
+
+BREAKERS = {}
+HEDGED_CALLS = []
+
+
+def get_breaker(upstream):
+    breaker = BREAKERS.get(upstream)
+    if breaker is None:
+        breaker = BREAKERS[upstream] = CircuitBreaker(upstream)
+    return breaker
+
+
+class HedgedCall:
+    """One kind of upstream call (e.g. Groq streaming chat) with its own latency history.
+
+    Latency is the time to the first item: the whole response for buffered
+    calls, the first token or audio chunk for streams. When the first
+    attempt is slower than the HEDGE_PERCENTILE of recent calls, a duplicate
+    is started and whichever produces its first item first is used; the
+    other is cancelled. Calls go through the upstream's circuit breaker.
+    """
+
+    def __init__(self, upstream, operation, hedge=HEDGE_ENABLED):
+        self.upstream = upstream
+        self.operation = operation
+        self.hedge = hedge
+        self.breaker = get_breaker(upstream)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.recent_hedges = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        HEDGED_CALLS.append(self)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None when this call shouldn't be hedged"""
+        if not self.hedge or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.recent_hedges and sum(self.recent_hedges) / len(self.recent_hedges) >= HEDGE_MAX_RATIO:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        delay = min(max(ordered[index], HEDGE_MIN_DELAY_MS / 1000), HEDGE_MAX_DELAY_MS / 1000)
+        HEDGE_DELAY_SECONDS.set(round(delay, 4), upstream=self.upstream, operation=self.operation)
+        return delay
+
+    async def stream(self, open_attempt, may_hedge=None, passthrough=()):
+        """Async generator over the items of the winning attempt.
+
+        open_attempt() returns a new async iterator per attempt. may_hedge()
+        is asked before a duplicate is sent (e.g. for rate-limit budget).
+        Exceptions in `passthrough` are re-raised without counting as
+        upstream failures.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(self.upstream)
+        self.calls += 1
+        started = time.perf_counter()
+        primary = open_attempt()
+        pending = {asyncio.ensure_future(primary.__anext__()): primary}
+        delay = self.hedge_delay()
+        winner, first, error, hedged = None, None, None, False
+        outcome_recorded = False
+        try:
+            while pending and winner is None:
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    delay = None
+                    if may_hedge is None or may_hedge():
+                        hedged = True
+                        self.hedged += 1
+                        UPSTREAM_HEDGES.inc(upstream=self.upstream, operation=self.operation, outcome="fired")
+                        duplicate = open_attempt()
+                        pending[asyncio.ensure_future(duplicate.__anext__())] = duplicate
+                    continue
+                for task in done:
+                    attempt = pending.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = _EMPTY
+                    except Exception as e:
+                        error = e
+                        continue
+                    winner = attempt
+                    break
+                # The first attempt failed quickly: don't hedge the one that's left
+                delay = None
+            self.recent_hedges.append(hedged)
+
+            if winner is None:
+                outcome_recorded = True
+                if isinstance(error, passthrough):
+                    self.breaker.release()
+                else:
+                    self.breaker.record_failure()
+                raise error
+
+            # The upstream answered; a later mid-stream error still counts as a failure
+            outcome_recorded = True
+            self.breaker.record_success()
+            self.latencies.append(time.perf_counter() - started)
+            if winner is not primary:
+                self.hedge_wins += 1
+                UPSTREAM_HEDGES.inc(upstream=self.upstream, operation=self.operation, outcome="won")
+        finally:
+            for task, attempt in pending.items():
+                task.cancel()
+            for task, attempt in pending.items():
+                try:
+                    await task
+                except BaseException:
+                    pass
+                await attempt.aclose()
+            if winner is None and not outcome_recorded:
+                self.breaker.release()
+
+        try:
+            if first is not _EMPTY:
+                yield first
+            async for item in winner:
+                yield item
+        except passthrough:
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            await winner.aclose()
+
+    async def call(self, attempt, may_hedge=None, passthrough=()):
+        """Hedged, breaker-guarded `await attempt()` for buffered calls"""
+        async def once():
+            yield await attempt()
+
+        results = self.stream(once, may_hedge, passthrough)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+
+    def stats(self):
+        delay = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "samples": len(self.latencies),
+        }
+
+
+_EMPTY = object()
+
+
+def get_resilience_stats():
+    return {
+        "breakers": {name: breaker.stats() for name, breaker in BREAKERS.items()},
+        "hedging": {f"{call.upstream}.{call.operation}": call.stats() for call in HEDGED_CALLS},
+    }
@@ -0,0 +1,145 @@
+# session_store.py - Per-session conversation store backed by SQLite in WAL mode
+
+import logging
+import sqlite3
+import threading
+import time
+
+from functions.context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    tokens INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_turn ON messages (session_id, turn);
+CREATE TABLE IF NOT EXISTS summaries (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    through_turn INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteConversationStore:
+    """Messages keyed by (session_id, turn), where turn numbers each message in a session.
+
+    WAL mode lets readers run alongside the single writer, so every thread
+    gets its own read connection while writes share one connection behind a
+    lock and are committed in batches.
+    """
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._migrate()
+        logger.info("SQLite conversation store ready", extra={"path": path})
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return connection
+
+    def _migrate(self):
+        """Add columns introduced after a database was created"""
+        columns = {row[1] for row in self._writer.execute("PRAGMA table_info(messages)")}
+        if "tokens" not in columns:
+            # Older rows keep NULL and are counted when read
+            self._writer.execute("ALTER TABLE messages ADD COLUMN tokens INTEGER")
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def append_turns(self, turns):
+        """Write (session_id, user_message, assistant_message, user_tokens, assistant_tokens) turns in one transaction.
+
+        Returns the last turn number written for each session.
+        """
+        if not turns:
+            return {}
+        now = time.time()
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                next_turn = {}
+                rows = []
+                for session_id, request_message, response_message, request_tokens, response_tokens in turns:
+                    if session_id not in next_turn:
+                        cursor.execute(
+                            "SELECT COALESCE(MAX(turn), 0) FROM messages WHERE session_id = ?",
+                            (session_id,),
+                        )
+                        next_turn[session_id] = cursor.fetchone()[0] + 1
+                    turn = next_turn[session_id]
+                    rows.append((session_id, turn, "user", request_message, now, request_tokens))
+                    rows.append((session_id, turn + 1, "assistant", response_message, now, response_tokens))
+                    next_turn[session_id] = turn + 2
+                cursor.executemany(
+                    "INSERT INTO messages (session_id, turn, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        return {session_id: turn - 1 for session_id, turn in next_turn.items()}
+
+    def recent_messages(self, session_id, limit):
+        """Return the last `limit` messages of a session, oldest first (index range scan)"""
+        rows = self._reader().execute(
+            "SELECT turn, role, content, tokens FROM messages WHERE session_id = ? ORDER BY turn DESC LIMIT ?",
+            (session_id, limit),
+        ).fetchall()
+        return [
+            {"role": role, "content": content, "turn": turn, "tokens": tokens if tokens is not None else count_tokens(content)}
+            for turn, role, content, tokens in reversed(rows)
+        ]
+
+    def get_summary(self, session_id):
+        """Return (summary, through_turn) for a session, or None"""
+        return self._reader().execute(
+            "SELECT summary, through_turn FROM summaries WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+
+    def save_summary(self, session_id, summary, through_turn):
+        with self._write_lock:
+            self._writer.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, summary, through_turn, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, summary, through_turn, time.time()),
+            )
+
+    def reset(self, session_id):
+        """Delete one session's history and summary"""
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                cursor.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
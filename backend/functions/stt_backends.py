@@ -0,0 +1,130 @@
+# stt_backends.py - Speech-to-text engines behind one interface (openai-whisper, faster-whisper)
+
+from decouple import config
+import os
+
+from functions.workers import STT_WORKERS
+
+# "openai-whisper" (PyTorch, fp32 on CPU) or "faster-whisper" (CTranslate2, quantized)
+STT_BACKEND = config("STT_BACKEND", default="openai-whisper")
+STT_MODEL = config("STT_MODEL", default="base")  # tiny, base, small, medium, large-v3, ...
+# CTranslate2 compute type: int8 is the fastest and smallest on CPU; float32 matches openai-whisper
+STT_COMPUTE_TYPE = config("STT_COMPUTE_TYPE", default="int8")
+STT_DEVICE = config("STT_DEVICE", default="cpu")
+# CTranslate2 intra-op threads (0 lets it choose); the shared model serves STT_WORKERS calls at once
+STT_CPU_THREADS = config("STT_CPU_THREADS", default=0, cast=int)
+STT_BEAM_SIZE = config("STT_BEAM_SIZE", default=1, cast=int)
+STT_LANGUAGE = config("STT_LANGUAGE", default=None)  # None auto-detects
+
+DEFAULT_OPTIONS = {
+    "language": STT_LANGUAGE,
+    "beam_size": STT_BEAM_SIZE,
+    "initial_prompt": None,
+}
+
+
+class OpenAIWhisperBackend:
+    """The reference openai-whisper package on PyTorch.
+
+    Whisper installs kv-cache hooks on the model while decoding, so a model
+    instance must not be shared between threads.
+    """
+
+    name = "openai-whisper"
+    thread_safe = False
+
+    def __init__(self, model_size=STT_MODEL, device=STT_DEVICE):
+        self.model_size = model_size
+        self.device = device
+        self.model = None
+
+    def load(self):
+        import whisper
+
+        self.model = whisper.load_model(self.model_size, device=self.device)
+        return self
+
+    def transcribe(self, audio, options=None):
+        """Transcribe 16 kHz float32 PCM and return the text"""
+        options = {**DEFAULT_OPTIONS, **(options or {})}
+        kwargs = {"fp16": False, "language": options["language"], "initial_prompt": options["initial_prompt"]}
+        if options["beam_size"] and options["beam_size"] > 1:
+            kwargs["beam_size"] = options["beam_size"]
+        result = self.model.transcribe(audio, **kwargs)
+        return result["text"].strip()
+
+    def capabilities(self):
+        return {
+            "backend": self.name,
+            "model": self.model_size,
+            "device": self.device,
+            "compute_type": "float32",
+            "thread_safe": self.thread_safe,
+            "loaded": self.model is not None,
+        }
+
+
+class FasterWhisperBackend:
+    """Whisper converted to CTranslate2 (faster-whisper), quantized to STT_COMPUTE_TYPE.
+
+    CTranslate2 models can serve concurrent calls, so one instance is shared
+    by all STT workers.
+    """
+
+    name = "faster-whisper"
+    thread_safe = True
+
+    def __init__(self, model_size=STT_MODEL, device=STT_DEVICE, compute_type=STT_COMPUTE_TYPE, cpu_threads=STT_CPU_THREADS):
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.model = None
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(
+            self.model_size,
+            device=self.device,
+            compute_type=self.compute_type,
+            cpu_threads=self.cpu_threads,
+            num_workers=STT_WORKERS,
+        )
+        return self
+
+    def transcribe(self, audio, options=None):
+        """Transcribe 16 kHz float32 PCM and return the text"""
+        options = {**DEFAULT_OPTIONS, **(options or {})}
+        segments, _ = self.model.transcribe(
+            audio,
+            language=options["language"],
+            beam_size=max(1, options["beam_size"] or 1),
+            initial_prompt=options["initial_prompt"],
+        )
+        # Segments are decoded lazily while iterating
+        return "".join(segment.text for segment in segments).strip()
+
+    def capabilities(self):
+        return {
+            "backend": self.name,
+            "model": self.model_size,
+            "device": self.device,
+            "compute_type": self.compute_type,
+            "cpu_threads": self.cpu_threads or os.cpu_count(),
+            "thread_safe": self.thread_safe,
+            "loaded": self.model is not None,
+        }
+
+
+STT_BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def create_backend(name=STT_BACKEND, **kwargs):
+    """Instantiate (but don't load) an STT backend by name"""
+    if name not in STT_BACKENDS:
+        raise ValueError(f"Unknown STT_BACKEND '{name}' (choose from {', '.join(STT_BACKENDS)})")
+    return STT_BACKENDS[name](**kwargs)
@@ -0,0 +1,86 @@
+# stt_cache.py - Transcription cache keyed by audio content, with single-flight deduplication
+
+from collections import OrderedDict
+from decouple import config
+import asyncio
+import hashlib
+import json
+
+STT_CACHE_ENABLED = config("STT_CACHE_ENABLED", default=True, cast=bool)
+STT_CACHE_ENTRIES = config("STT_CACHE_ENTRIES", default=256, cast=int)
+
+
+def transcription_key(data, engine, options):
+    """Hash the audio bytes together with everything that changes the transcript"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"engine": engine, "options": options}, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """LRU of finished transcripts plus the transcriptions currently running.
+
+    A request for a key that is already being transcribed awaits the same
+    task instead of starting another model run. The task is shielded, so a
+    cancelled caller (client gone) doesn't cancel it for the others. Only
+    successful results are cached; None means the transcription failed.
+    """
+
+    def __init__(self, max_entries=STT_CACHE_ENTRIES, enabled=STT_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.enabled = enabled and max_entries > 0
+        self._items = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_transcribe(self, key, transcribe):
+        """Return the cached transcript for key, or await transcribe() exactly once"""
+        if not self.enabled:
+            return await transcribe()
+
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(transcribe())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        self._items[key] = task.result()
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._items),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+
+stt_cache = TranscriptionCache()
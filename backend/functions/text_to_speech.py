@@ -1,67 +1,283 @@
-import requests
+import httpx
 from decouple import config
-import traceback
+import logging
+import os
+import re
+import time
+
+from functions.audio_formats import CONTAINER_TYPES, SOURCE_FORMAT, default_format, mark_rejected, needs_transcoding
+from functions.audio_formats import transcode, transcode_stream
+from functions.http_clients import get_client
+from functions.metrics import TTS_CHARACTERS, TTS_SECONDS
+from functions.resilience import CircuitOpen, HedgedCall, UpstreamError
+from functions.tts_cache import tts_cache, cache_key
+from functions.workers import run_in_stage
+
+logger = logging.getLogger(__name__)
 
 ELEVEN_LABS_API_KEY = config("ELEVEN_LABS_API_KEY", default=None)
+ELEVEN_LABS_BASE_URL = config("ELEVEN_LABS_BASE_URL", default="https://api.elevenlabs.io/v1")
 
-def convert_text_to_speech(message):
-    """Convert text to speech using Eleven Labs API"""
-    
-    if not ELEVEN_LABS_API_KEY:
-        print("❌ ELEVEN_LABS_API_KEY not configured")
-        return None
-    
-    if not message or message.strip() == "":
-        print("❌ Empty message provided for TTS")
-        return None
+# Define voice ID - Rachel
+VOICE_ID = "UgBBYS2sOqTuMpoF3BR0"  #NOpBlnGInO9m6vDvFkFC Rachel voice ID
+
+VOICE_SETTINGS = {
+    "stability": 0,
+    "similarity_boost": 0,
+}
+
+# Size of the pieces forwarded from the ElevenLabs stream
+STREAM_CHUNK_SIZE = 4096
+
+# Ids served by GET /audio/{id}: a TTS cache key plus the container as extension
+AUDIO_ID = re.compile(r"^([0-9a-f]{64})\.([a-z0-9]+)$")
 
-    print(f"🔊 Converting text to speech: '{message[:50]}...'")
+# Hedging and the circuit breaker (whole clips, time to first streamed chunk)
+tts_convert = HedgedCall("elevenlabs", "convert")
+tts_stream = HedgedCall("elevenlabs", "stream")
 
+
+class FormatRejected(Exception):
+    """ElevenLabs refused the requested output_format"""
+
+    def __init__(self, status_code):
+        super().__init__(f"output format rejected ({status_code})")
+        self.status_code = status_code
+
+
+def _build_tts_request(message, audio_format):
+    """Return headers, JSON body and query parameters for a text-to-speech call"""
     # Define Data
     body = {
         "text": message,
-        "voice_settings": {
-            "stability": 0,
-            "similarity_boost": 0,
-        }
+        "voice_settings": VOICE_SETTINGS,
     }
 
-    # Define voice ID - Rachel
-    voice_rachel = "UgBBYS2sOqTuMpoF3BR0"  #NOpBlnGInO9m6vDvFkFC Rachel voice ID
-
-    # Construct headers and endpoint
+    # Construct headers
     headers = {
         "xi-api-key": ELEVEN_LABS_API_KEY,
         "Content-Type": "application/json",
-        "Accept": "audio/mpeg"
+        "Accept": audio_format.content_type
     }
-    endpoint = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_rachel}"
+    return headers, body, {"output_format": audio_format.elevenlabs}
+
+
+def _format_rejected(response, audio_format):
+    """A 4xx about output_format (e.g. not available on the plan) for a format we can make locally"""
+    return (
+        audio_format is not SOURCE_FORMAT
+        and response.status_code in (400, 403, 422)
+        and "format" in response.text.lower()
+    )
+
+
+def _check_tts_input(message):
+    if not ELEVEN_LABS_API_KEY:
+        logger.error("ELEVEN_LABS_API_KEY not configured")
+        return False
+
+    if not message or message.strip() == "":
+        logger.warning("Empty message provided for TTS")
+        return False
+
+    return True
+
+
+def _cache_key(message, audio_format):
+    return cache_key(message, VOICE_ID, VOICE_SETTINGS, audio_format.elevenlabs)
+
+
+def _reply_key(text, audio_format):
+    # Recorded replies get their own namespace: a recording is what the client
+    # was sent (possibly cut short), so it must never answer a TTS lookup
+    return cache_key(text, VOICE_ID, VOICE_SETTINGS, f"reply:{audio_format.elevenlabs}")
+
+
+def audio_id(message, audio_format):
+    """Id of the synthesized clip for message, once the TTS disk cache holds it"""
+    return f"{_cache_key(message, audio_format)}.{audio_format.container}"
+
+
+def reply_audio_id(text, audio_format):
+    """Id of a streamed reply recorded with store_reply_audio"""
+    return f"{_reply_key(text, audio_format)}.{audio_format.container}"
+
+
+async def store_reply_audio(text, audio_format, data):
+    """Keep the audio of a multi-sentence reply on disk so clients can re-fetch it"""
+    await run_in_stage("io", tts_cache.put, _reply_key(text, audio_format), data, audio_format.container, memory=False)
+
+
+def find_audio(audio_id):
+    """(path, os.stat_result, content type) of stored audio for an id, or None (blocking)"""
+    match = AUDIO_ID.match(audio_id)
+    if not match or match.group(2) not in CONTAINER_TYPES:
+        return None
+    found = tts_cache.locate(match.group(1))
+    # The extension must name the container that was stored, or the Content-Type would lie
+    if found is None or found[1] != match.group(2):
+        return None
+    path = found[0]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return path, stat, CONTAINER_TYPES[match.group(2)]
+
+
+async def synthesize_speech(message, audio_format=None):
+    """Convert text to speech using Eleven Labs API and return the audio bytes"""
+    audio_format = audio_format or default_format()
+
+    if not _check_tts_input(message):
+        return None
+
+    key = _cache_key(message, audio_format)
+    cached = await run_in_stage("io", tts_cache.get, key)
+    if cached is not None:
+        logger.debug("TTS cache hit", extra={"bytes": len(cached)})
+        TTS_CHARACTERS.inc(len(message), cache="hit")
+        return cached
+    TTS_CHARACTERS.inc(len(message), cache="miss")
+
+    audio_content = await _synthesize(message, audio_format)
+    if audio_content:
+        await run_in_stage("io", tts_cache.put, key, audio_content, audio_format.container)
+    return audio_content
+
+
+async def _synthesize(message, audio_format):
+    """Uncached synthesis: ElevenLabs in the requested format, or MP3 transcoded locally"""
+    if needs_transcoding(audio_format):
+        source = await _synthesize(message, SOURCE_FORMAT)
+        return await transcode(source, audio_format) if source else None
+
+    headers, body, params = _build_tts_request(message, audio_format)
+    endpoint = f"{ELEVEN_LABS_BASE_URL}/text-to-speech/{VOICE_ID}"
+
+    async def post():
+        started = time.perf_counter()
+        response = await get_client("elevenlabs").post(endpoint, json=body, headers=headers, params=params)
+        TTS_SECONDS.observe(time.perf_counter() - started, kind="convert", status=response.status_code)
+        if response.status_code >= 500:
+            raise UpstreamError("elevenlabs", response.status_code, response.text)
+        return response
 
     # Send request
     try:
-        print(f"📡 Sending request to Eleven Labs API...")
-        response = requests.post(endpoint, json=body, headers=headers, timeout=30)
-        print(f"📡 Eleven Labs response status: {response.status_code}")
-        
+        response = await tts_convert.call(post)
+
         if response.status_code == 200:
-            # Save audio content to file
-            output_filename = "voice.mp3"
-            with open(output_filename, "wb") as f:
-                f.write(response.content)
-            print(f"✅ Audio content written to file '{output_filename}' ({len(response.content)} bytes)")
-            return output_filename
+            logger.debug("Audio content received", extra={"bytes": len(response.content)})
+            return response.content
+        elif _format_rejected(response, audio_format):
+            mark_rejected(audio_format, response.status_code)
+            return await _synthesize(message, audio_format)
         else:
-            print(f"❌ Eleven Labs API Error: {response.status_code}")
-            print(f"❌ Response: {response.text}")
+            logger.error("Eleven Labs API error %s", response.status_code, extra={"body": response.text})
             return None
-            
-    except requests.exceptions.Timeout:
-        print("❌ Timeout error: Eleven Labs API took too long to respond")
+
+    except CircuitOpen as e:
+        logger.warning("%s", e)
         return None
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Request error: {str(e)}")
+    except UpstreamError as e:
+        logger.error("Eleven Labs API error %s", e.status_code, extra={"body": e.body})
+        return None
+    except httpx.TimeoutException:
+        logger.error("Eleven Labs API timed out")
+        return None
+    except httpx.RequestError as e:
+        logger.error("Eleven Labs request error: %s", e)
         return None
     except Exception as e:
-        print(f"❌ Unexpected error in convert_text_to_speech: {str(e)}")
-        print(traceback.format_exc())
-        return None
\ No newline at end of file
+        logger.exception("Unexpected error in synthesize_speech")
+        return None
+
+
+async def stream_text_to_speech(message, audio_format=None):
+    """Yield audio chunks from the Eleven Labs /stream endpoint as they arrive.
+
+    Errors are logged and end the stream early, so callers only ever see
+    audio bytes (an empty stream means TTS failed).
+    """
+    audio_format = audio_format or default_format()
+
+    if not _check_tts_input(message):
+        return
+
+    key = _cache_key(message, audio_format)
+    cached = await run_in_stage("io", tts_cache.get, key)
+    if cached is not None:
+        logger.debug("TTS cache hit", extra={"bytes": len(cached)})
+        TTS_CHARACTERS.inc(len(message), cache="hit")
+        for start in range(0, len(cached), STREAM_CHUNK_SIZE):
+            yield cached[start:start + STREAM_CHUNK_SIZE]
+        return
+
+    TTS_CHARACTERS.inc(len(message), cache="miss")
+
+    try:
+        # Keep a copy for the cache; only complete streams are stored
+        received = []
+        async for chunk in _synthesize_stream(message, audio_format):
+            received.append(chunk)
+            yield chunk
+        if received:
+            audio_content = b"".join(received)
+            await run_in_stage("io", tts_cache.put, key, audio_content, audio_format.container)
+            logger.debug("Streamed audio", extra={"bytes": len(audio_content)})
+
+    except CircuitOpen as e:
+        logger.warning("%s", e)
+    except UpstreamError as e:
+        logger.error("Eleven Labs API error %s", e.status_code, extra={"body": e.body})
+    except httpx.TimeoutException:
+        logger.error("Eleven Labs API timed out")
+    except httpx.RequestError as e:
+        logger.error("Eleven Labs request error: %s", e)
+    except Exception as e:
+        logger.exception("Unexpected error in stream_text_to_speech")
+
+
+async def _synthesize_stream(message, audio_format):
+    """Uncached streaming synthesis, transcoding from MP3 when ElevenLabs can't produce the format"""
+    if not needs_transcoding(audio_format):
+        headers, body, params = _build_tts_request(message, audio_format)
+        endpoint = f"{ELEVEN_LABS_BASE_URL}/text-to-speech/{VOICE_ID}/stream"
+        try:
+            async for chunk in tts_stream.stream(
+                lambda: _tts_stream_attempt(endpoint, headers, body, params, audio_format),
+                passthrough=(FormatRejected,),
+            ):
+                yield chunk
+            return
+        except FormatRejected as e:
+            mark_rejected(audio_format, e.status_code)
+
+    async for chunk in transcode_stream(_synthesize_stream(message, SOURCE_FORMAT), audio_format):
+        yield chunk
+
+
+async def _tts_stream_attempt(endpoint, headers, body, params, audio_format):
+    """One /stream request, yielding audio chunks (nothing on a client error)"""
+    status = "error"
+    started = time.perf_counter()
+    try:
+        async with get_client("elevenlabs").stream("POST", endpoint, json=body, headers=headers, params=params) as response:
+            status = response.status_code
+
+            if response.status_code >= 500:
+                await response.aread()
+                raise UpstreamError("elevenlabs", response.status_code, response.text)
+            if response.status_code != 200:
+                await response.aread()
+                if _format_rejected(response, audio_format):
+                    raise FormatRejected(response.status_code)
+                logger.error("Eleven Labs API error %s", response.status_code, extra={"body": response.text})
+                return
+
+            async for chunk in response.aiter_bytes(chunk_size=STREAM_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+    finally:
+        TTS_SECONDS.observe(time.perf_counter() - started, kind="stream", status=status)
@@ -0,0 +1,136 @@
+# timings.py - Per-turn stage timings for the voice pipeline
+
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+from functions.metrics import observe_turn
+
+# Keep the most recent turns for /stats
+RECENT_TURNS = deque(maxlen=100)
+_recent_lock = threading.Lock()
+
+
+class TurnTimer:
+    """Collects stage durations and first-event marks for one conversation turn.
+
+    Durations are the wall time spent inside a stage; marks are the time
+    since the start of the turn when something happened for the first time
+    (e.g. first LLM token, first audio byte). All values are milliseconds.
+    """
+
+    def __init__(self, mode="buffered"):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def mark(self, name):
+        """Record the first time an event happens (later calls are ignored)"""
+        with self._lock:
+            if name not in self.marks:
+                self.marks[name] = round(self.elapsed_ms(), 1)
+
+    def add(self, name, duration_ms):
+        with self._lock:
+            self.durations[name] = round(self.durations.get(name, 0) + duration_ms, 1)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work as the given stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "durations_ms": dict(self.durations),
+                "marks_ms": dict(self.marks),
+            }
+
+    def server_timing(self):
+        """Render the durations collected so far as a Server-Timing header"""
+        with self._lock:
+            return ", ".join(f"{name};dur={value}" for name, value in self.durations.items())
+
+
+def record_turn(timer):
+    """Finish a turn and keep its timings for reporting"""
+    timer.mark("total")
+    turn = timer.as_dict()
+    with _recent_lock:
+        RECENT_TURNS.append(turn)
+    observe_turn(turn)
+
+
+def get_timing_summary():
+    """Average stage durations and marks over the recent turns, per mode"""
+    with _recent_lock:
+        turns = list(RECENT_TURNS)
+
+    summary = {}
+    for turn in turns:
+        mode = summary.setdefault(turn["mode"], {"turns": 0, "durations_ms": {}, "marks_ms": {}})
+        mode["turns"] += 1
+        for section in ("durations_ms", "marks_ms"):
+            for name, value in turn[section].items():
+                mode[section].setdefault(name, []).append(value)
+
+    for mode in summary.values():
+        for section in ("durations_ms", "marks_ms"):
+            mode[section] = {
+                name: round(sum(values) / len(values), 1)
+                for name, values in mode[section].items()
+            }
+
+    return {"averages": summary, "last": turns[-1] if turns else None}
+
+
+class StartupReport:
+    """Wall time of each server startup phase (imports, clients, model load, warm-up).
+
+    Marks are milliseconds since the process imported this module, e.g.
+    when the app started serving and when the speech model became ready.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        with self._lock:
+            self.marks[name] = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def add(self, name, duration_ms):
+        with self._lock:
+            self.phases[name] = round(duration_ms, 1)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def as_dict(self):
+        with self._lock:
+            return {"phases_ms": dict(self.phases), "marks_ms": dict(self.marks)}
+
+
+startup_report = StartupReport()
+
+
+def get_startup_report():
+    return startup_report.as_dict()
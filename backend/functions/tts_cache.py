@@ -0,0 +1,289 @@
+# tts_cache.py - Content-addressed cache for synthesized speech (memory LRU + disk tier)
+
+from collections import OrderedDict
+from decouple import config
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_ENABLED = config("TTS_CACHE_ENABLED", default=True, cast=bool)
+TTS_CACHE_MEMORY_BYTES = config("TTS_CACHE_MEMORY_BYTES", default=16 * 1024 * 1024, cast=int)
+TTS_CACHE_DISK_BYTES = config("TTS_CACHE_DISK_BYTES", default=256 * 1024 * 1024, cast=int)
+TTS_CACHE_TTL_SECONDS = config("TTS_CACHE_TTL_SECONDS", default=7 * 24 * 3600, cast=int)
+TTS_CACHE_DIR = config(
+    "TTS_CACHE_DIR",
+    default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tts_cache"),
+)
+
+
+def cache_key(text, voice_id, voice_settings, output_format):
+    """Hash everything that changes the synthesized audio"""
+    material = json.dumps(
+        {
+            "text": text.strip(),
+            "voice_id": voice_id,
+            "voice_settings": voice_settings,
+            "output_format": output_format,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """Byte-bounded in-memory LRU"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        data = self._items.get(key)
+        if data is not None:
+            self._items.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._items[key] = data
+        self.bytes += len(data)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskTier:
+    """Files named by content hash and container (e.g. <sha256>.ogg), evicted by TTL and then least-recent use"""
+
+    def __init__(self, directory, max_bytes, ttl_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bytes = 0
+        self.evictions = 0
+        self._index = OrderedDict()  # key -> (size, last_used, container), oldest first
+        self._load_index()
+
+    def path_for(self, key, container):
+        return os.path.join(self.directory, f"{key}.{container}")
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                # Skips half-written "<key>.<container>.<thread>.tmp" files
+                key, dot, container = name.partition(".")
+                if not dot or "." in container or not container:
+                    continue
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, key, stat.st_size, container))
+        except OSError as e:
+            logger.error("TTS disk cache unavailable: %s", e)
+            return
+
+        for last_used, key, size, container in sorted(entries):
+            if key in self._index:
+                # Left over from a crash between writing one container and removing the other
+                self._remove(key)
+            self._index[key] = (size, last_used, container)
+            self.bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        size, _, container = self._index.pop(key)
+        self.bytes -= size
+        self.evictions += 1
+        try:
+            os.remove(self.path_for(key, container))
+        except OSError:
+            pass
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key, (_, last_used, _) in list(self._index.items()):
+            if last_used >= cutoff and self.bytes <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def _live_entry(self, key):
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time() - self.ttl_seconds:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, key):
+        entry = self._live_entry(key)
+        if entry is None:
+            return None
+        try:
+            with open(self.path_for(key, entry[2]), "rb") as f:
+                data = f.read()
+        except OSError:
+            self._index.pop(key, None)
+            self.bytes -= entry[0]
+            return None
+
+        self._touch(key, entry)
+        return data
+
+    def _touch(self, key, entry):
+        # Touch the file so LRU order survives restarts
+        now = time.time()
+        try:
+            os.utime(self.path_for(key, entry[2]), (now, now))
+        except OSError:
+            pass
+        self._index[key] = (entry[0], now, entry[2])
+        self._index.move_to_end(key)
+
+    def locate(self, key):
+        """(path, container) of a live entry without reading it (for file responses), or None"""
+        entry = self._live_entry(key)
+        if entry is None:
+            return None
+        self._touch(key, entry)
+        return self.path_for(key, entry[2]), entry[2]
+
+    def put(self, key, data, container):
+        if len(data) > self.max_bytes:
+            return
+        path = self.path_for(key, container)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning("Could not write TTS cache entry: %s", e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        old = self._index.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0]
+            if old[2] != container:
+                try:
+                    os.remove(self.path_for(key, old[2]))
+                except OSError:
+                    pass
+        self._index[key] = (len(data), time.time(), container)
+        self.bytes += len(data)
+        self._evict()
+
+    def __len__(self):
+        return len(self._index)
+
+
+class TTSCache:
+    """Two-tier cache in front of ElevenLabs with hit/miss/byte counters"""
+
+    def __init__(self, memory_bytes, disk_dir, disk_bytes, ttl_seconds, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(disk_dir, disk_bytes, ttl_seconds) if enabled and disk_bytes > 0 else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+        self.files_located = 0
+
+    @property
+    def serves_files(self):
+        """Whether entries are kept on disk, where GET /audio/{id} can serve them"""
+        return self.disk is not None
+
+    def get(self, key):
+        """Return cached audio bytes or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory_hits += 1
+                self.bytes_served += len(data)
+                return data
+
+            data = self.disk.get(key) if self.disk is not None else None
+            if data is not None:
+                self.disk_hits += 1
+                self.bytes_served += len(data)
+                self.memory.put(key, data)
+                return data
+
+            self.misses += 1
+            return None
+
+    def put(self, key, data, container="mp3", memory=True):
+        """Store audio; memory=False keeps it on disk only (audio that is only re-fetched by clients)"""
+        if not self.enabled or not data:
+            return
+        with self._lock:
+            if memory:
+                self.memory.put(key, data)
+            if self.disk is not None:
+                self.disk.put(key, data, container)
+            self.bytes_stored += len(data)
+
+    def locate(self, key):
+        """(path, container) of the on-disk copy of an entry, or None"""
+        if self.disk is None:
+            return None
+        with self._lock:
+            found = self.disk.locate(key)
+            if found is not None:
+                self.files_located += 1
+            return found
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "bytes_served": self.bytes_served,
+                "bytes_stored": self.bytes_stored,
+                "files_located": self.files_located,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory.bytes,
+                "memory_evictions": self.memory.evictions,
+                "disk_entries": len(self.disk) if self.disk is not None else 0,
+                "disk_bytes": self.disk.bytes if self.disk is not None else 0,
+                "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+            }
+
+
+tts_cache = TTSCache(
+    TTS_CACHE_MEMORY_BYTES,
+    TTS_CACHE_DIR,
+    TTS_CACHE_DISK_BYTES,
+    TTS_CACHE_TTL_SECONDS,
+    enabled=TTS_CACHE_ENABLED,
+)
@@ -0,0 +1,147 @@
+# vad.py - Voice activity detection: trim silence and reject empty clips before Whisper
+
+from decouple import config
+import numpy as np
+import threading
+
+from functions.audio_io import SAMPLE_RATE
+
+# "energy" (NumPy energy + zero-crossing rate) or "none" to pass audio through untouched
+VAD_BACKEND = config("VAD_BACKEND", default="energy")
+VAD_FRAME_MS = config("VAD_FRAME_MS", default=30, cast=int)
+VAD_PADDING_MS = config("VAD_PADDING_MS", default=200, cast=int)
+VAD_MIN_SPEECH_MS = config("VAD_MIN_SPEECH_MS", default=250, cast=int)
+# Frames louder than this many times the noise floor count as speech
+VAD_ENERGY_RATIO = config("VAD_ENERGY_RATIO", default=4.0, cast=float)
+# Absolute RMS floor (float PCM in [-1, 1]) so digital silence never looks like speech
+VAD_MIN_RMS = config("VAD_MIN_RMS", default=0.003, cast=float)
+
+# Everything above that changes what reaches the model (part of transcription cache keys)
+VAD_SETTINGS = {
+    "backend": VAD_BACKEND,
+    "frame_ms": VAD_FRAME_MS,
+    "padding_ms": VAD_PADDING_MS,
+    "min_speech_ms": VAD_MIN_SPEECH_MS,
+    "energy_ratio": VAD_ENERGY_RATIO,
+    "min_rms": VAD_MIN_RMS,
+}
+
+
+class EnergyVAD:
+    """Frame-level speech detector from short-time energy and zero-crossing rate.
+
+    A frame is speech when its RMS clears both VAD_MIN_RMS and the noise
+    floor (10th percentile RMS) times VAD_ENERGY_RATIO, capped at a tenth of
+    the loudest frame. Quieter frames with a high zero-crossing rate,
+    typical of fricatives like "s" and "f", count as speech when they are
+    still above half that threshold.
+    """
+
+    def __init__(self, frame_ms=VAD_FRAME_MS, energy_ratio=VAD_ENERGY_RATIO, min_rms=VAD_MIN_RMS):
+        self.frame_ms = frame_ms
+        self.energy_ratio = energy_ratio
+        self.min_rms = min_rms
+
+    def speech_frames(self, audio, sr=SAMPLE_RATE):
+        """Return (frame_length, boolean speech mask per frame)"""
+        frame_length = max(1, int(sr * self.frame_ms / 1000))
+        n_frames = len(audio) // frame_length
+        if n_frames == 0:
+            return frame_length, np.zeros(0, dtype=bool)
+
+        frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+        return frame_length, self.classify(*self.features(frames))
+
+    @staticmethod
+    def features(frames):
+        """RMS and zero-crossing rate of each row of a (n_frames, frame_length) array"""
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return rms, zcr
+
+    def classify(self, rms, zcr):
+        """Boolean speech mask for frames, judged against the noise floor of the same frames"""
+        if len(rms) == 0:
+            return np.zeros(0, dtype=bool)
+
+        # Cap the threshold relative to the loudest frame so clips that are
+        # speech from start to end (high noise floor) aren't trimmed into.
+        noise_floor = np.percentile(rms, 10)
+        threshold = max(self.min_rms, min(noise_floor * self.energy_ratio, rms.max() * 0.1))
+        voiced = rms > threshold
+        unvoiced = (zcr > 0.25) & (rms > max(self.min_rms, threshold / 2))
+        return voiced | unvoiced
+
+
+VAD_BACKENDS = {
+    "energy": EnergyVAD,
+}
+
+
+class VADStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clips = 0
+        self.rejected = 0
+        self.seconds_in = 0.0
+        self.seconds_out = 0.0
+
+    def record(self, seconds_in, seconds_out, rejected):
+        with self._lock:
+            self.clips += 1
+            self.rejected += int(rejected)
+            self.seconds_in += seconds_in
+            self.seconds_out += seconds_out
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "backend": VAD_BACKEND,
+                "clips": self.clips,
+                "rejected": self.rejected,
+                "seconds_in": round(self.seconds_in, 2),
+                "seconds_out": round(self.seconds_out, 2),
+                "seconds_saved": round(self.seconds_in - self.seconds_out, 2),
+            }
+
+
+vad_stats = VADStats()
+_vad = VAD_BACKENDS[VAD_BACKEND]() if VAD_BACKEND in VAD_BACKENDS else None
+
+
+def trim_silence(audio, sr=SAMPLE_RATE, record=True):
+    """Trim leading/trailing silence from float32 PCM.
+
+    Returns (trimmed_audio, seconds_saved); trimmed_audio is None when the
+    clip has less than VAD_MIN_SPEECH_MS of speech and shouldn't be
+    transcribed at all. record=False leaves vad_stats alone (partial
+    transcripts re-trim overlapping windows of the same utterance).
+    """
+    seconds_in = len(audio) / sr
+    if _vad is None or len(audio) == 0:
+        if record:
+            vad_stats.record(seconds_in, seconds_in, rejected=False)
+        return audio, 0.0
+
+    frame_length, speech = _vad.speech_frames(audio, sr)
+    speech_ms = int(speech.sum()) * _vad.frame_ms
+    if speech_ms < VAD_MIN_SPEECH_MS:
+        if record:
+            vad_stats.record(seconds_in, 0.0, rejected=True)
+        return None, seconds_in
+
+    indices = np.flatnonzero(speech)
+    padding = int(sr * VAD_PADDING_MS / 1000)
+    start = max(0, indices[0] * frame_length - padding)
+    end = min(len(audio), (indices[-1] + 1) * frame_length + padding)
+    trimmed = audio[start:end]
+
+    seconds_out = len(trimmed) / sr
+    if record:
+        vad_stats.record(seconds_in, seconds_out, rejected=False)
+    return trimmed, seconds_in - seconds_out
+
+
+def get_vad_stats():
+    return vad_stats.as_dict()
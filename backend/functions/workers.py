@@ -0,0 +1,111 @@
+# workers.py - Dedicated executors for blocking pipeline work (Whisper, file I/O)
+
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+import asyncio
+import contextvars
+import threading
+
+# Pool sizes. Groq and ElevenLabs calls run on the event loop through the
+# shared async HTTP clients, so only CPU-bound Whisper work and blocking
+# file I/O (caches, persistence) need threads.
+STT_WORKERS = config("STT_WORKERS", default=1, cast=int)
+IO_WORKERS = config("IO_WORKERS", default=4, cast=int)
+
+# Max jobs waiting for a free worker before new work is rejected (0 = unbounded)
+STT_QUEUE_LIMIT = config("STT_QUEUE_LIMIT", default=16, cast=int)
+IO_QUEUE_LIMIT = config("IO_QUEUE_LIMIT", default=0, cast=int)
+
+
+class PoolSaturated(Exception):
+    """Raised when a stage already has queue_limit jobs waiting."""
+
+
+class StagePool:
+    """Thread pool for one pipeline stage that keeps queue depth counters"""
+
+    def __init__(self, name, max_workers, queue_limit=0):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"{name}-worker",
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.active -= 1
+                self.failed += 1
+            raise
+        else:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+        return result
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn on this stage and return a concurrent.futures.Future"""
+        with self._lock:
+            if self.queue_limit and self.queued >= self.queue_limit:
+                self.rejected += 1
+                raise PoolSaturated(f"{self.name} queue is full ({self.queued} waiting)")
+            self.queued += 1
+        try:
+            return self._executor.submit(self._run, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "queue_limit": self.queue_limit,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+POOLS = {
+    "stt": StagePool("stt", STT_WORKERS, STT_QUEUE_LIMIT),
+    "io": StagePool("io", IO_WORKERS, IO_QUEUE_LIMIT),
+}
+
+
+async def run_in_stage(stage, fn, *args, **kwargs):
+    """Run a blocking call on the executor dedicated to the given stage"""
+    # Carry the caller's context (request id) into the worker thread
+    context = contextvars.copy_context()
+    future = POOLS[stage].submit(context.run, fn, *args, **kwargs)
+    return await asyncio.wrap_future(future)
+
+
+def get_pool_stats():
+    """Return worker, queue depth and completion counters for every stage"""
+    return {name: pool.stats() for name, pool in POOLS.items()}
+
+
+def shutdown_pools(wait=True):
+    """Stop all stage executors (called on app shutdown)"""
+    for pool in POOLS.values():
+        pool.shutdown(wait=wait)
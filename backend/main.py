@@ -4,74 +4,77 @@
 #uvicorn main:app --reload
 
 #Main Imports
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from decouple import config
-import json
+import asyncio
+import logging
 import os
-import traceback
+import time
 
-print("🔥 Starting server initialization...")
+# Configure logging before the function modules create their loggers and log at import time
+from functions.log import setup_logging, stop_logging, get_log_stats, request_id_var, new_request_id
+setup_logging()
+logger = logging.getLogger("main")
+
+logger.info("Starting server initialization")
+_imports_started = time.perf_counter()
 
 #Custom Function Imports with detailed error handling
 try:
-    from functions.grouq_api import convert_audio_to_text, get_chat_response, check_groq_limits
-    print("✅ Successfully imported groq_api functions")
+    from functions.grouq_api import get_chat_response, check_groq_limits, get_stt_capabilities, is_model_reply
+    from functions.grouq_api import warm_up_stt, is_stt_ready, is_stt_failed, transcribe_audio_bytes, schedule_summary_update
 except Exception as e:
-    print(f"❌ Error importing groq_api functions: {str(e)}")
-    print(traceback.format_exc())
+    logger.exception("Error importing groq_api functions")
 
 try:
-    from functions.database import store_messages, reset_messages, get_recent_messages
-    print("✅ Successfully imported database functions")
+    from functions.database import store_messages, reset_messages, close_message_store
+    from functions.database import DEFAULT_SESSION_ID, is_valid_session_id, get_persistence_stats
 except Exception as e:
-    print(f"❌ Error importing database functions: {str(e)}")
-    print(traceback.format_exc())
+    logger.exception("Error importing database functions")
 
 try:
-    from functions.text_to_speech import convert_text_to_speech
-    print("✅ Successfully imported text_to_speech functions")
+    from functions.text_to_speech import synthesize_speech, audio_id, find_audio
 except Exception as e:
-    print(f"❌ Error importing text_to_speech functions: {str(e)}")
-    print(traceback.format_exc())
+    logger.exception("Error importing text_to_speech functions")
+
+try:
+    from functions.pipeline import stream_reply_audio, stream_speech
+except Exception as e:
+    logger.exception("Error importing pipeline functions")
+
+try:
+    from functions.realtime import ConversationSocket
+except Exception as e:
+    logger.exception("Error importing realtime functions")
+
+from functions.audio_io import read_upload, UploadTooLarge, MAX_UPLOAD_BYTES
+from functions.audio_formats import negotiate_format, UnknownFormat
+from functions.audio_files import audio_file_response, file_etag
+from functions.workers import run_in_stage, get_pool_stats, shutdown_pools, PoolSaturated
+from functions.timings import TurnTimer, record_turn, get_timing_summary, startup_report, get_startup_report
+from functions.tts_cache import tts_cache
+from functions.stt_cache import stt_cache
+from functions.prompt import prefix_stats
+from functions.metrics import REQUESTS, UPLOAD_BYTES, CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from functions.http_clients import startup_clients, shutdown_clients, get_client_stats
+from functions.vad import get_vad_stats
+from functions.resilience import get_resilience_stats
+
+startup_report.add("imports", (time.perf_counter() - _imports_started) * 1000)
 
 # Test environment variables
 try:
     groq_key = config("GROQ_API_KEY", default=None)
     eleven_key = config("ELEVEN_LABS_API_KEY", default=None)
-    print(f"🔑 GROQ_API_KEY: {'✅ Set' if groq_key else '❌ Missing'}")
-    print(f"🔑 ELEVEN_LABS_API_KEY: {'✅ Set' if eleven_key else '❌ Missing'}")
+    logger.info("GROQ_API_KEY: %s", "set" if groq_key else "missing")
+    logger.info("ELEVEN_LABS_API_KEY: %s", "set" if eleven_key else "missing")
 except Exception as e:
-    print(f"❌ Error loading environment variables: {str(e)}")
+    logger.exception("Error loading environment variables")
 
-# Function to save conversation history
-def save_conversation(user_message, assistant_response):
-    """Save conversation to stored_data.json"""
-    try:
-        # Use absolute path to ensure file is found
-        file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stored_data.json")
-        
-        # Load existing data
-        try:
-            with open(file_name, "r") as user_file:
-                data = json.load(user_file)
-        except:
-            data = []
-        
-        # Add new messages
-        data.append({"role": "user", "content": user_message})
-        data.append({"role": "assistant", "content": assistant_response})
-        
-        # Save updated data
-        with open(file_name, "w") as user_file:
-            json.dump(data, user_file)
-        print(f"✅ Conversation saved to {file_name}")
-        return True
-    except Exception as e:
-        print(f"❌ Error saving conversation: {str(e)}")
-        print(traceback.format_exc())
-        return False
+# Stream replies sentence by sentence unless ?stream=false is passed
+STREAM_RESPONSES = config("STREAM_RESPONSES", default=True, cast=bool)
 
 #Initialize app
 app = FastAPI()
@@ -94,253 +97,386 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-print("🚀 FastAPI app initialized with CORS")
+
+# Count requests per route template and status code for /metrics, and tag
+# every log line of the request with its id (X-Request-ID, echoed back)
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    request_id = request.headers.get("x-request-id", "")[:64] or new_request_id()
+    request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    except Exception:
+        REQUESTS.inc(route=getattr(request.scope.get("route"), "path", "unmatched"), status=500)
+        raise
+    REQUESTS.inc(route=getattr(request.scope.get("route"), "path", "unmatched"), status=response.status_code)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# Background startup work, kept referenced so it isn't garbage collected
+_startup_tasks = set()
+
+# Open pooled keep-alive connections to Groq and ElevenLabs once, then load
+# and warm up the speech model without holding up startup
+@app.on_event("startup")
+async def startup_http_clients():
+    with startup_report.phase("http_clients"):
+        await startup_clients()
+    task = asyncio.create_task(warm_up_stt())
+    _startup_tasks.add(task)
+    task.add_done_callback(_startup_tasks.discard)
+    startup_report.mark("serving")
+
+# Close upstream connections and stop the worker executors with the server
+@app.on_event("shutdown")
+async def shutdown_workers():
+    logger.info("Shutting down HTTP clients and worker pools")
+    await shutdown_clients()
+    shutdown_pools(wait=False)
+    close_message_store()
+    stop_logging()
 
 # Root endpoint
 @app.get("/")
 async def root():
-    print("🏠 Root endpoint accessed")
     return {
         "message": "Welcome to the Chat with Rachel API", 
         "version": "2.0",
         "features": ["Local Whisper", "Groq API", "Fast responses"]
     }
 
+# Liveness: the process is up and serving requests
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: the speech model is loaded and warm, so requests won't hit a cold model
+@app.get("/readyz")
+async def readyz():
+    stt = get_stt_capabilities()
+    body = {"status": "ready" if is_stt_ready() else stt["state"], "stt": stt, "startup": get_startup_report()}
+    if not is_stt_ready():
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+def check_stt_ready():
+    """Turn away audio while the speech model is still loading, or if it failed to load"""
+    if is_stt_failed():
+        # Retrying won't help until the server is fixed and restarted, so no Retry-After
+        raise HTTPException(status_code=503, detail="Speech model failed to load. Check the server logs.")
+    if not is_stt_ready():
+        raise HTTPException(status_code=503, detail="Speech model is still loading, please retry shortly.", headers={"Retry-After": "5"})
+
+def check_session_id(session_id):
+    """Reject session ids that aren't short URL-safe strings"""
+    if not is_valid_session_id(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id (use 1-64 letters, digits, '-' or '_').")
+
+def reply_audio_format(request, requested):
+    """Reply audio format from ?format=, then the Accept and Save-Data headers"""
+    try:
+        return negotiate_format(requested, request.headers.get("accept", ""), request.headers.get("save-data", ""))
+    except UnknownFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Prometheus scrape endpoint: stage latency histograms and volume counters
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+# Runtime stats endpoint
+@app.get("/stats")
+async def stats():
+    return {
+        "startup": get_startup_report(),
+        "stt": get_stt_capabilities(),
+        "workers": get_pool_stats(),
+        "timings": get_timing_summary(),
+        "stt_cache": stt_cache.stats(),
+        "tts_cache": tts_cache.stats(),
+        "http": get_client_stats(),
+        "persistence": get_persistence_stats(),
+        "prompt_prefix": prefix_stats.stats(),
+        "vad": get_vad_stats(),
+        "groq_limits": check_groq_limits(),
+        "resilience": get_resilience_stats(),
+        "logging": get_log_stats(),
+    }
+
+# Stored reply audio by content-addressed id (X-Audio-ID header, WebSocket reply_end)
+@app.get("/audio/{audio_id}")
+async def get_stored_audio(audio_id: str, request: Request):
+    found = await run_in_stage("io", find_audio, audio_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    path, stat, content_type = found
+    return audio_file_response(request, path, stat, content_type, file_etag(audio_id, stat))
+
+# Full-duplex conversation: audio frames in, partial/final transcripts and reply audio out
+@app.websocket("/ws/converse")
+async def converse(
+    websocket: WebSocket,
+    session_id: str = DEFAULT_SESSION_ID,
+    requested_format: str = Query(None, alias="format"),
+):
+    try:
+        audio_format = negotiate_format(requested_format, websocket.headers.get("accept", ""))
+    except UnknownFormat:
+        audio_format = None
+    if not is_valid_session_id(session_id) or audio_format is None:
+        await websocket.close(code=1008)
+        return
+    if not is_stt_ready():
+        # 1011: server error (the model failed to load); 1013: try again later
+        await websocket.close(code=1011 if is_stt_failed() else 1013)
+        return
+    # HTTP middleware doesn't see WebSockets; each turn gets its own id in ConversationSocket
+    request_id_var.set(websocket.headers.get("x-request-id", "")[:64] or new_request_id())
+    logger.info("WebSocket connected", extra={"session_id": session_id})
+    await ConversationSocket(websocket, session_id, audio_format).run()
+
 #Reset Messages endpoint
 @app.get("/reset")
-async def reset_conversation():
-    print("🔄 Reset endpoint accessed")
+async def reset_conversation(session_id: str = DEFAULT_SESSION_ID):
+    check_session_id(session_id)
     try:
-        reset_messages()
-        print("✅ Messages reset successfully")
+        await run_in_stage("io", reset_messages, session_id)
+        logger.info("Messages reset", extra={"session_id": session_id})
         return {"message": "conversation reset"}
     except Exception as e:
-        print(f"❌ Error resetting messages: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error resetting messages")
         raise HTTPException(status_code=500, detail=f"Reset failed: {str(e)}")
 
 #get audio endpoint
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
 @app.get("/post-audio-get/")
-async def get_audio():
-    """Process audio file and return chat response"""
-    print("\n" + "="*50)
-    print("🎯 GET /post-audio-get/ endpoint accessed")
-    print("="*50)
+async def get_audio(
+    request: Request,
+    session_id: str = DEFAULT_SESSION_ID,
+    source_id: str = Query(None, alias="audio_id"),
+    requested_format: str = Query(None, alias="format"),
+):
+    """Transcribe stored audio (?audio_id=) or the sample voice.mp3 and return the reply audio"""
+    timer = TurnTimer(mode="get")
+    check_session_id(session_id)
+    check_stt_ready()
+    audio_format = reply_audio_format(request, requested_format)
     
     try:
-        # Try both relative and absolute paths
-        audio_file_path = "voice.mp3"
-        if not os.path.exists(audio_file_path):
-            # Try absolute path
-            audio_file_path = os.path.join(os.path.dirname(__file__), "voice.mp3")
-            
-        if not os.path.exists(audio_file_path):
-            print(f"❌ Audio file not found: {audio_file_path}")
-            print(f"📁 Current directory: {os.getcwd()}")
-            print(f"📁 Files in current directory: {os.listdir('.')}")
-            raise HTTPException(status_code=404, detail=f"Audio file not found in current directory: {os.getcwd()}")
+        if source_id:
+            found = await run_in_stage("io", find_audio, source_id)
+            if found is None:
+                raise HTTPException(status_code=404, detail="Audio not found")
+            audio_file_path = found[0]
+        else:
+            # A sample recording placed next to the server; it is only ever read
+            audio_file_path = "voice.mp3"
+            if not os.path.exists(audio_file_path):
+                # Try absolute path
+                audio_file_path = os.path.join(os.path.dirname(__file__), "voice.mp3")
+
+            if not os.path.exists(audio_file_path):
+                logger.error("Audio file not found: %s", audio_file_path, extra={"cwd": os.getcwd()})
+                raise HTTPException(status_code=404, detail=f"Audio file not found in current directory: {os.getcwd()}")
         
-        # Get file size for debugging
-        file_size = os.path.getsize(audio_file_path)
-        print(f"🎤 Found audio file: {audio_file_path} ({file_size} bytes)")
         
-        # Decode audio using local Whisper (pass file path directly)
-        print("🎤 Transcribing audio with local Whisper...")
+        # Decode and transcribe in memory using local Whisper
         try:
-            message_decoded = convert_audio_to_text(audio_file_path)
-            print(f"📝 Transcription result: '{message_decoded}'")
+            with timer.stage("stt"):
+                content = await run_in_stage("io", _read_file, audio_file_path)
+                message_decoded = await transcribe_audio_bytes(content)
+            logger.debug("Transcription result", extra={"transcript": message_decoded})
+        except PoolSaturated as e:
+            logger.warning("%s", e)
+            raise HTTPException(status_code=503, detail="Server busy, please retry shortly.")
         except Exception as e:
-            print(f"❌ Error in convert_audio_to_text: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error in convert_audio_to_text")
             raise HTTPException(status_code=400, detail=f"Audio transcription failed: {str(e)}")
         
-        if not message_decoded or message_decoded.strip() == "":
-            print("❌ Empty or None transcription result")
+        if message_decoded is None:
+            logger.warning("Empty or None transcription result")
             raise HTTPException(status_code=400, detail="Could not decode audio. Check if the file is a valid audio format.")
+
+        if message_decoded.strip() == "":
+            logger.info("No speech in recording")
+            raise HTTPException(status_code=400, detail="No speech detected in the recording.")
         
-        print(f"📝 Successfully transcribed: '{message_decoded}'")
         
         # Get chat response from Groq API
-        print("🚀 Getting response from Groq API...")
         try:
-            chat_response = get_chat_response(message_decoded)
-            print(f"💬 Chat response received: '{chat_response}'")
+            with timer.stage("llm"):
+                chat_response = await get_chat_response(message_decoded, session_id)
+            logger.debug("Chat response", extra={"reply": chat_response})
         except Exception as e:
-            print(f"❌ Error in get_chat_response: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error in get_chat_response")
             raise HTTPException(status_code=400, detail=f"Chat response failed: {str(e)}")
 
         if not chat_response or chat_response.strip() == "":
-            print("❌ Empty or None chat response")
+            logger.warning("Empty or None chat response")
             raise HTTPException(status_code=400, detail="Could not get chat response from API.")
         
-        print(f"✅ Successfully got chat response: '{chat_response}'")
         
-        # Store messages
-        try:
-            print("💾 Storing messages to database...")
-            store_messages(message_decoded, chat_response)
-            print("✅ Messages stored successfully")
-        except Exception as e:
-            print(f"❌ Error storing messages: {str(e)}")
-            print(traceback.format_exc())
+        # Store messages (canned replies, sent when Groq can't answer, are not kept)
+        if is_model_reply(chat_response):
+            try:
+                store_messages(message_decoded, chat_response, session_id)
+                schedule_summary_update(session_id)
+            except Exception as e:
+                logger.exception("Error storing messages")
         
-        # Also save using the save_conversation function
-        print("💾 Saving conversation to JSON...")
-        save_conversation(message_decoded, chat_response)
-
-        #Convert chat response to audio 
-        print("🔊 Converting text to speech...")
+        #Convert chat response to audio, kept in this request's own buffer
         try:
-            audio_output = convert_text_to_speech(chat_response)
-            print(f"🔊 TTS result: {audio_output}")
+            with timer.stage("tts"):
+                audio_content = await synthesize_speech(chat_response, audio_format)
         except Exception as e:
-            print(f"❌ Error in convert_text_to_speech: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error in synthesize_speech")
             raise HTTPException(status_code=400, detail=f"Text-to-speech failed: {str(e)}")
 
-        if not audio_output:
-            print("❌ Failed to get audio output from TTS")
+        if not audio_content:
+            logger.error("Failed to get audio output from TTS")
             raise HTTPException(status_code=400, detail="Failed to get Eleven labs audio response.")
 
-        print("✅ Successfully generated audio response")
-
-        # Read the audio file
-        try:
-            with open(audio_output, "rb") as audio_file:
-                audio_content = audio_file.read()
-            print(f"🎵 Read audio file: {len(audio_content)} bytes")
-        except Exception as e:
-            print(f"❌ Error reading audio file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error reading audio file: {str(e)}")
 
-        #Create a generator that yields chunks of the data
-        def iterfile():
-            yield audio_content
+        record_turn(timer)
 
-        print("🎵 Returning audio stream response")
-        print("="*50)
-        
-        #Return audio file as streaming response
-        return StreamingResponse(iterfile(), media_type="audio/mpeg")
+        headers = {"Vary": "Accept, Save-Data"}
+        if tts_cache.serves_files:
+            headers["X-Audio-ID"] = audio_id(chat_response, audio_format)
+        return Response(audio_content, media_type=audio_format.content_type, headers=headers)
         
     except HTTPException as e:
-        print(f"🚫 HTTP Exception: {e.detail}")
-        print("="*50)
+        logger.info("Request failed: %s", e.detail, extra={"status": e.status_code})
         # Re-raise HTTP exceptions
         raise e
     except Exception as e:
-        print(f"❌ Unexpected error in get_audio: {str(e)}")
-        print(traceback.format_exc())
-        print("="*50)
+        logger.exception("Unexpected error in get_audio")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def audio_stream_response(audio_chunks, timer, audio_format, stored_id=None):
+    """Forward TTS audio chunks to the client as they arrive"""
+    # Wait for the first chunk so failures can still be reported with a status code
+    try:
+        first_chunk = await audio_chunks.__anext__()
+    except StopAsyncIteration:
+        logger.error("Failed to get audio output from TTS")
+        raise HTTPException(status_code=400, detail="Failed to get Eleven labs audio response.")
+
+    async def iteraudio():
+        try:
+            timer.mark("first_byte")
+            yield first_chunk
+            async for chunk in audio_chunks:
+                yield chunk
+        finally:
+            await audio_chunks.aclose()
+            record_turn(timer)
+            logger.debug("Turn timings", extra={"timings": timer.as_dict()})
+
+    headers = {"Server-Timing": timer.server_timing(), "Vary": "Accept, Save-Data"}
+    if stored_id:
+        # Where the same audio can be fetched again once this response has finished
+        headers["X-Audio-ID"] = stored_id
+    return StreamingResponse(iteraudio(), media_type=audio_format.content_type, headers=headers)
+
+
+async def stream_post_audio_response(message_decoded, timer, session_id, audio_format):
+    """Stream reply audio sentence by sentence while Groq is still generating"""
+
+    def on_complete(chat_response):
+        logger.debug("Chat response", extra={"reply": chat_response})
+        try:
+            store_messages(message_decoded, chat_response, session_id)
+            schedule_summary_update(session_id)
+        except Exception as e:
+            logger.exception("Error storing messages")
+
+    reply_audio = stream_reply_audio(message_decoded, timer, session_id, on_complete=on_complete, audio_format=audio_format)
+    return await audio_stream_response(reply_audio, timer, audio_format)
+
+
 #get audio endpoint for frontend testing
 @app.post("/post-audio/")
-async def post_audio(file: UploadFile = File(...)):
+async def post_audio(
+    request: Request,
+    file: UploadFile = File(...),
+    stream: bool = STREAM_RESPONSES,
+    session_id: str = DEFAULT_SESSION_ID,
+    requested_format: str = Query(None, alias="format"),
+):
     """Process audio file and return chat response"""
-    print("\n" + "="*50)
-    print("🎯 POST /post-audio/ endpoint accessed")
-    print(f"📎 File: {file.filename}, Content-Type: {file.content_type}")
-    print("="*50)
+    timer = TurnTimer(mode="stream" if stream else "buffered")
+    logger.info("Audio upload", extra={"upload_name": file.filename, "content_type": file.content_type})
+    check_session_id(session_id)
+    audio_format = reply_audio_format(request, requested_format)
+    check_stt_ready()
     
     try:
-        #Save file for frontend testing
-        print(f"💾 Saving uploaded file: {file.filename}")
-        with open(file.filename, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        print(f"✅ File saved: {len(content)} bytes")
-        
-        audio_input = open(file.filename, "rb")
-
-        # Decode audio using local Whisper (pass file object)
-        print("🎤 Transcribing audio with local Whisper...")
+        # Read the upload into memory (no temp files)
         try:
-            message_decoded = convert_audio_to_text(audio_input)
-            print(f"📝 Transcription result: '{message_decoded}'")
+            with timer.stage("upload"):
+                content = await read_upload(file)
+        except UploadTooLarge as e:
+            logger.warning("%s", e)
+            raise HTTPException(status_code=413, detail=f"Audio upload too large (max {MAX_UPLOAD_BYTES} bytes)")
+        UPLOAD_BYTES.observe(len(content))
+
+        # Decode and transcribe in memory using local Whisper
+        try:
+            with timer.stage("stt"):
+                message_decoded = await transcribe_audio_bytes(content)
+            logger.debug("Transcription result", extra={"transcript": message_decoded})
+        except PoolSaturated as e:
+            logger.warning("%s", e)
+            raise HTTPException(status_code=503, detail="Server busy, please retry shortly.")
         except Exception as e:
-            print(f"❌ Error in convert_audio_to_text: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error in convert_audio_to_text")
             raise HTTPException(status_code=400, detail=f"Audio transcription failed: {str(e)}")
-        finally:
-            audio_input.close()
         
-        if not message_decoded or message_decoded.strip() == "":
-            print("❌ Empty or None transcription result")
+        if message_decoded is None:
+            logger.warning("Empty or None transcription result")
             raise HTTPException(status_code=400, detail="Could not decode audio. Check if the file is a valid audio format.")
+
+        if message_decoded.strip() == "":
+            logger.info("No speech in recording")
+            raise HTTPException(status_code=400, detail="No speech detected in the recording.")
         
-        print(f"📝 Successfully transcribed: '{message_decoded}'")
+
+        if stream:
+            return await stream_post_audio_response(message_decoded, timer, session_id, audio_format)
         
         # Get chat response from Groq API
-        print("🚀 Getting response from Groq API...")
         try:
-            chat_response = get_chat_response(message_decoded)
-            print(f"💬 Chat response received: '{chat_response}'")
+            with timer.stage("llm"):
+                chat_response = await get_chat_response(message_decoded, session_id)
+            logger.debug("Chat response", extra={"reply": chat_response})
         except Exception as e:
-            print(f"❌ Error in get_chat_response: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error in get_chat_response")
             raise HTTPException(status_code=400, detail=f"Chat response failed: {str(e)}")
 
         if not chat_response or chat_response.strip() == "":
-            print("❌ Empty or None chat response")
+            logger.warning("Empty or None chat response")
             raise HTTPException(status_code=400, detail="Could not get chat response from API.")
         
-        print(f"✅ Successfully got chat response: '{chat_response}'")
 
-        # Store messages
-        try:
-            print("💾 Storing messages to database...")
-            store_messages(message_decoded, chat_response)
-            print("✅ Messages stored successfully")
-        except Exception as e:
-            print(f"❌ Error storing messages: {str(e)}")
-            print(traceback.format_exc())
-
-        #Convert chat response to audio 
-        print("🔊 Converting text to speech...")
-        try:
-            audio_output = convert_text_to_speech(chat_response)
-            print(f"🔊 TTS result: {audio_output}")
-        except Exception as e:
-            print(f"❌ Error in convert_text_to_speech: {str(e)}")
-            print(traceback.format_exc())
-            raise HTTPException(status_code=400, detail=f"Text-to-speech failed: {str(e)}")
-
-        if not audio_output:
-            print("❌ Failed to get audio output from TTS")
-            raise HTTPException(status_code=400, detail="Failed to get Eleven labs audio response.")
-
-        print("✅ Successfully generated audio response")
-
-        # Read the audio file
-        try:
-            with open(audio_output, "rb") as audio_file:
-                audio_content = audio_file.read()
-            print(f"🎵 Read audio file: {len(audio_content)} bytes")
-        except Exception as e:
-            print(f"❌ Error reading audio file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error reading audio file: {str(e)}")
-
-        #Create a generator that yields chunks of the data
-        def iterfile():
-            yield audio_content
-
-        print("🎵 Returning audio stream response")
-        print("="*50)
-
-        #Return audio file as streaming response
-        return StreamingResponse(iterfile(), media_type="application/octet-stream")
+        # Store messages (canned replies, sent when Groq can't answer, are not kept)
+        if is_model_reply(chat_response):
+            try:
+                store_messages(message_decoded, chat_response, session_id)
+                schedule_summary_update(session_id)
+            except Exception as e:
+                logger.exception("Error storing messages")
+
+        #Convert chat response to audio, forwarding it as ElevenLabs streams it
+        stored_id = audio_id(chat_response, audio_format) if tts_cache.serves_files else None
+        return await audio_stream_response(stream_speech(chat_response, timer, audio_format), timer, audio_format, stored_id)
         
     except HTTPException as e:
-        print(f"🚫 HTTP Exception: {e.detail}")
-        print("="*50)
+        logger.info("Request failed: %s", e.detail, extra={"status": e.status_code})
         # Re-raise HTTP exceptions
         raise e
     except Exception as e:
-        print(f"❌ Unexpected error in post_audio: {str(e)}")
-        print(traceback.format_exc())
-        print("="*50)
+        logger.exception("Unexpected error in post_audio")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-
-print("🎉 Server setup complete!")
\ No newline at end of file
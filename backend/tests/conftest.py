@@ -0,0 +1,115 @@
+# conftest.py - Shared test setup: the app pointed at the mock upstreams, with a stub speech model
+#
+# cd backend
+# python -m pytest
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pytest
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+MOCK_PORT = _free_port()
+TEST_DIR = tempfile.mkdtemp(prefix="voice-tests-")
+
+# Settings are read when the function modules are imported, so they are set
+# before any test module imports them
+os.environ.update({
+    "GROQ_API_KEY": "test",
+    "ELEVEN_LABS_API_KEY": "test",
+    "GROQ_BASE_URL": f"http://127.0.0.1:{MOCK_PORT}",
+    "ELEVEN_LABS_BASE_URL": f"http://127.0.0.1:{MOCK_PORT}",
+    "CONVERSATION_DB": os.path.join(TEST_DIR, "conversations.db"),
+    "CONVERSATION_LOG_DIR": os.path.join(TEST_DIR, "conversation_log"),
+    "TTS_CACHE_DIR": os.path.join(TEST_DIR, "tts_cache"),
+    "LOG_LEVEL": "WARNING",
+})
+
+from functions.audio_io import SAMPLE_RATE  # noqa: E402
+
+
+def speech_clip(seconds=1.5, pitch=180.0):
+    """Float32 PCM that the energy VAD treats as speech: a tone between short silences"""
+    silence = np.zeros(int(0.25 * SAMPLE_RATE), dtype=np.float32)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tone = (0.3 * np.sin(2 * np.pi * pitch * t)).astype(np.float32)
+    return np.concatenate([silence, tone, silence])
+
+
+class StubBackend:
+    """Stands in for Whisper: the transcript just reports how much audio the model was given"""
+
+    name = "stub"
+    thread_safe = True
+
+    def load(self):
+        return self
+
+    def transcribe(self, audio, options=None):
+        return f"I heard {len(audio) / SAMPLE_RATE:.1f} seconds of audio."
+
+    def capabilities(self):
+        return {"backend": self.name, "model": "stub", "compute_type": None, "thread_safe": True, "loaded": True}
+
+
+def fake_decode_audio(data, sr=SAMPLE_RATE):
+    """decode_audio without ffmpeg: every upload decodes to the same clip"""
+    return speech_clip()
+
+
+@pytest.fixture(scope="session")
+def mock_upstreams():
+    """benchmarks/mock_upstreams.py served on MOCK_PORT, without added latency"""
+    from benchmarks.mock_upstreams import Latency, create_app
+
+    no_delay = Latency(0, 0)
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(no_delay, no_delay, no_delay, no_delay), host="127.0.0.1", port=MOCK_PORT, log_level="warning",
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Mock upstreams did not start")
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{MOCK_PORT}"
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture(scope="session")
+def client(mock_upstreams):
+    """TestClient for main.app, started up, with the stub speech model warm"""
+    from fastapi.testclient import TestClient
+
+    with pytest.MonkeyPatch.context() as patch:
+        import functions.grouq_api as grouq_api
+
+        patch.setattr(grouq_api, "create_backend", lambda *args, **kwargs: StubBackend())
+        patch.setattr(grouq_api, "decode_audio", fake_decode_audio)
+
+        import main
+
+        with TestClient(main.app) as test_client:
+            deadline = time.monotonic() + 10
+            while test_client.get("/readyz").status_code != 200:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Speech model did not become ready")
+                time.sleep(0.05)
+            yield test_client
@@ -0,0 +1,52 @@
+# test_api.py - End-to-end turns through the FastAPI app against the mock Groq and ElevenLabs servers
+
+from benchmarks.mock_upstreams import MP3_FRAME
+from functions.database import get_recent_messages
+
+
+def test_buffered_turn_returns_audio_and_stores_the_turn(client):
+    response = client.post(
+        "/post-audio/?stream=false&session_id=buffered",
+        files={"file": ("clip.webm", b"encoded audio", "audio/webm")},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert response.content.startswith(MP3_FRAME[:4])
+
+    history = get_recent_messages("buffered")
+    assert history[-2]["role"] == "user"
+    assert history[-1]["role"] == "assistant"
+
+
+def test_reply_audio_can_be_fetched_again(client):
+    response = client.post(
+        "/post-audio/?stream=false&session_id=replay",
+        files={"file": ("clip.webm", b"encoded audio", "audio/webm")},
+    )
+    audio_id = response.headers["x-audio-id"]
+
+    stored = client.get(f"/audio/{audio_id}")
+    assert stored.status_code == 200
+    assert stored.content == response.content
+    assert stored.headers["accept-ranges"] == "bytes"
+
+    partial = client.get(f"/audio/{audio_id}", headers={"Range": "bytes=0-99"})
+    assert partial.status_code == 206
+    assert partial.content == response.content[:100]
+    assert partial.headers["content-range"] == f"bytes 0-99/{len(response.content)}"
+
+    cached = client.get(f"/audio/{audio_id}", headers={"If-None-Match": stored.headers["etag"]})
+    assert cached.status_code == 304
+
+    unsatisfiable = client.get(f"/audio/{audio_id}", headers={"Range": f"bytes={len(response.content)}-"})
+    assert unsatisfiable.status_code == 416
+
+
+def test_unknown_audio_id_is_not_found(client):
+    assert client.get("/audio/" + "0" * 64 + ".mp3").status_code == 404
+    assert client.get("/audio/not-an-id").status_code == 404
+
+
+def test_invalid_session_id_is_rejected(client):
+    response = client.post("/post-audio/?session_id=../etc", files={"file": ("clip.webm", b"encoded audio", "audio/webm")})
+    assert response.status_code == 400
@@ -0,0 +1,37 @@
+# test_audio_files.py - Range and If-None-Match parsing for stored reply audio
+
+import pytest
+
+from functions.audio_files import RangeNotSatisfiable, etag_matches, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=500-5000", (500, 999)),
+    ("BYTES = 1-2", (1, 2)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "items=0-1", "bytes=abc", "bytes=5-1", "bytes=x-"])
+def test_unsupported_or_malformed_ranges_send_the_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+def test_etag_matches():
+    etag = '"abc-1-2"'
+    assert etag_matches(etag, etag)
+    assert etag_matches('"other", W/"abc-1-2"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abc-1-3"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,58 @@
+# test_audio_formats.py - Reply format negotiation and formats made locally
+
+import pytest
+
+import functions.audio_formats as audio_formats
+from functions.audio_formats import AUDIO_FORMATS, SOURCE_FORMAT, UnknownFormat, needs_transcoding, negotiate_format
+
+
+@pytest.mark.parametrize("accept, save_data, expected", [
+    ("", "", "mp3"),
+    ("audio/ogg; codecs=opus", "", "opus"),
+    ("audio/ogg; codecs=vorbis", "", "mp3"),
+    ("audio/mpeg;q=0.5, audio/opus", "", "opus"),
+    ("audio/ogg;q=0, audio/mpeg", "", "mp3"),
+    ("audio/*, audio/ogg", "", "mp3"),
+    ("audio/wav", "", "mp3"),
+    ("", "on", "mp3_low"),
+    ("audio/ogg", "on", "opus"),
+])
+def test_negotiate_from_headers(accept, save_data, expected):
+    assert negotiate_format(None, accept, save_data) is AUDIO_FORMATS[expected]
+
+
+def test_explicit_format_wins_over_headers():
+    assert negotiate_format("mp3_low", "audio/ogg", "") is AUDIO_FORMATS["mp3_low"]
+
+
+def test_unknown_explicit_format():
+    with pytest.raises(UnknownFormat):
+        negotiate_format("wav")
+
+
+def test_rejected_formats_are_transcoded_from_then_on(monkeypatch):
+    monkeypatch.setattr(audio_formats, "_rejected", set())
+    opus = AUDIO_FORMATS["opus"]
+    assert not needs_transcoding(opus)
+    audio_formats.mark_rejected(opus, 403)
+    assert needs_transcoding(opus)
+    # MP3 is what everything else is made from
+    audio_formats.mark_rejected(SOURCE_FORMAT, 403)
+    assert not needs_transcoding(SOURCE_FORMAT)
+
+
+def test_reply_format_follows_accept(client):
+    response = client.post(
+        "/post-audio/?stream=false&session_id=formats",
+        files={"file": ("clip.webm", b"encoded audio", "audio/webm")},
+        headers={"Accept": "audio/ogg; codecs=opus"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/ogg; codecs=opus"
+    assert response.content.startswith(b"OggS")
+    assert "accept" in response.headers["vary"].lower()
+
+
+def test_requested_format_is_validated(client):
+    response = client.post("/post-audio/?format=wav", files={"file": ("clip.webm", b"encoded audio", "audio/webm")})
+    assert response.status_code == 400
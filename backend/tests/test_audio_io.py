@@ -0,0 +1,52 @@
+# test_audio_io.py - In-memory upload reading and ffmpeg decoding
+
+import asyncio
+import io
+import os
+import shutil
+
+import pytest
+from fastapi import UploadFile
+
+from benchmarks.stt_backends import FIXTURES_DIR
+from functions.audio_io import SAMPLE_RATE, AudioDecodeError, UploadTooLarge, decode_audio, read_upload
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+def upload(data):
+    return UploadFile(file=io.BytesIO(data), filename="clip.webm")
+
+
+def test_read_upload_returns_the_whole_body():
+    data = os.urandom(200 * 1024)
+    assert asyncio.run(read_upload(upload(data), max_bytes=len(data))) == data
+
+
+def test_read_upload_refuses_oversized_bodies():
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_upload(upload(bytes(1001)), max_bytes=1000))
+
+
+@needs_ffmpeg
+def test_decode_wav_from_memory():
+    with open(os.path.join(FIXTURES_DIR, "sense_and_sensibility_0880.wav"), "rb") as f:
+        data = f.read()
+    # Whole buffer and chunked input decode to the same PCM
+    pcm = decode_audio(data)
+    chunked = decode_audio(data[offset:offset + 4096] for offset in range(0, len(data), 4096))
+    assert pcm.dtype.name == "float32"
+    assert len(pcm) / SAMPLE_RATE == pytest.approx(2.99, abs=0.02)
+    assert (pcm == chunked).all()
+
+
+@needs_ffmpeg
+def test_undecodable_input_raises():
+    with pytest.raises(AudioDecodeError):
+        decode_audio(b"not audio at all")
+
+
+def test_missing_ffmpeg_raises(monkeypatch):
+    monkeypatch.setenv("PATH", "")
+    with pytest.raises(AudioDecodeError, match="ffmpeg not found"):
+        decode_audio(b"RIFF")
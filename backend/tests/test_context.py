@@ -0,0 +1,66 @@
+# test_context.py - Token-budgeted history window and rolling summaries
+
+from functions import database
+from functions.context import build_summary_prompt, count_tokens, select_window, summary_message
+
+
+def conversation(*sizes):
+    """Alternating user/assistant messages with the given token counts, numbered like the log"""
+    return [
+        {"role": "user" if index % 2 == 0 else "assistant", "content": f"m{index}", "turn": index + 1, "tokens": size}
+        for index, size in enumerate(sizes)
+    ]
+
+
+def test_keeps_the_newest_whole_turns_that_fit():
+    messages = conversation(10, 10, 10, 10, 10, 10)
+    kept, dropped = select_window(messages, budget=45)
+    assert [message["turn"] for message in kept] == [3, 4, 5, 6]
+    assert [message["turn"] for message in dropped] == [1, 2]
+
+
+def test_never_splits_a_turn():
+    messages = conversation(10, 10, 10, 30)
+    kept, dropped = select_window(messages, budget=35)
+    assert kept == []
+    assert dropped == messages
+
+
+def test_skips_messages_covered_by_the_summary():
+    messages = conversation(10, 10, 10, 10)
+    kept, dropped = select_window(messages, budget=100, summarized_through=2)
+    assert [message["turn"] for message in kept] == [3, 4]
+    assert dropped == []
+
+
+def test_leading_assistant_message_is_dropped_as_a_partial_turn():
+    messages = conversation(10, 10, 10)[1:]
+    kept, dropped = select_window(messages, budget=100)
+    assert [message["turn"] for message in kept] == [3]
+    assert [message["turn"] for message in dropped] == [2]
+
+
+def test_count_tokens_splits_long_words():
+    assert count_tokens("") == 0
+    assert count_tokens("Hi, there!") == 4
+    assert count_tokens("internationalization") == 5
+
+
+def test_summary_prompt_carries_the_old_summary_and_new_turns():
+    prompt = build_summary_prompt("They like red cars.", conversation(3, 4))
+    assert prompt[0]["role"] == "system"
+    assert "Current summary: They like red cars." in prompt[1]["content"]
+    assert prompt[1]["content"].endswith("User: m0\nAssistant: m1")
+    assert "(none)" in build_summary_prompt(None, [])[1]["content"]
+
+
+def test_history_is_the_summary_plus_the_turns_after_it():
+    session = "context-summary"
+    for index in range(4):
+        database.store_messages(f"question {index}", f"answer {index}", session)
+    database.message_store.save_summary(session, "They like red cars.", 4)
+
+    messages = database.get_recent_messages(session)
+    assert messages[0]["role"] == "system"
+    assert messages[1] == summary_message("They like red cars.")
+    assert [message["content"] for message in messages[2:]] == ["question 2", "answer 2", "question 3", "answer 3"]
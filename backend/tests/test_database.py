@@ -0,0 +1,50 @@
+# test_database.py - Append-only conversation log: replay and compaction
+
+import os
+
+from functions.database import ConversationLog
+
+
+def open_log(directory, window=4):
+    return ConversationLog(directory, segment_bytes=600, max_segments=3, fsync_policy="never", fsync_interval=1.0,
+                           window=window)
+
+
+def state(log):
+    return dict(log.counts), {session: list(tail) for session, tail in log.recent.items()}, dict(log.summaries)
+
+
+def test_compaction_keeps_each_session_tail_summary_and_turn_numbers(tmp_path):
+    log = open_log(str(tmp_path))
+    for index in range(60):
+        log.append_turns([("a", f"q{index}", f"r{index}", 1, 1), ("b", f"bq{index}", f"br{index}", 1, 1)])
+        if index == 20:
+            log.save_summary("a", "summary of a", 30)
+        if index == 40:
+            log.reset("b")
+    before = state(log)
+    log.close()
+
+    segments = sorted(os.listdir(tmp_path))
+    assert len(segments) <= 3
+    # The compacted segment holds two windows, not 120 turns of history
+    with open(tmp_path / segments[0], encoding="utf-8") as f:
+        assert sum(1 for _ in f) < 20
+
+    reopened = open_log(str(tmp_path))
+    assert state(reopened) == before
+    assert reopened.counts == {"a": 120, "b": 38}
+    assert reopened.summaries["a"] == ("summary of a", 30)
+    reopened.close()
+
+
+def test_reset_hides_earlier_messages_after_a_replay(tmp_path):
+    log = open_log(str(tmp_path), window=10)
+    log.append_turns([("a", "before", "reply", 1, 1)])
+    log.reset("a")
+    log.append_turns([("a", "after", "reply", 1, 1)])
+    log.close()
+
+    reopened = open_log(str(tmp_path), window=10)
+    assert [message["content"] for message in reopened.recent_messages("a", 10)] == ["after", "reply"]
+    reopened.close()
@@ -0,0 +1,54 @@
+# test_http_clients.py - Shared keep-alive clients for the upstreams
+
+import asyncio
+
+import pytest
+
+import functions.http_clients as http_clients
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """An empty client registry, so these tests don't close the app's clients"""
+    monkeypatch.setattr(http_clients, "_clients", {})
+    return http_clients._clients
+
+
+def test_one_client_per_upstream_is_reused(clients):
+    async def run():
+        await http_clients.startup_clients()
+        groq = http_clients.get_client("groq")
+        assert http_clients.get_client("groq") is groq
+        assert http_clients.get_client("elevenlabs") is not groq
+        assert http_clients.get_client_stats()["open_clients"] == ["elevenlabs", "groq"]
+        await http_clients.shutdown_clients()
+        return groq
+
+    groq = asyncio.run(run())
+    assert groq.is_closed
+    assert clients == {}
+
+
+def test_closed_client_is_replaced_on_use(clients):
+    async def run():
+        first = http_clients.get_client("groq")
+        await first.aclose()
+        second = http_clients.get_client("groq")
+        assert second is not first and not second.is_closed
+        await http_clients.shutdown_clients()
+
+    asyncio.run(run())
+
+
+def test_requests_keep_connections_alive(clients, mock_upstreams):
+    async def run():
+        client = http_clients.get_client("groq")
+        for _ in range(3):
+            response = await client.get(f"{mock_upstreams}/mock/stats")
+            assert response.status_code == 200
+        # All three requests went over one pooled connection
+        connections = len(client._transport._pool.connections)
+        await http_clients.shutdown_clients()
+        return connections
+
+    assert asyncio.run(run()) == 1
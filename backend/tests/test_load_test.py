@@ -0,0 +1,84 @@
+# test_load_test.py - Load-test harness helpers and the mock Groq/ElevenLabs servers
+
+import io
+import wave
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from benchmarks.load_test import (
+    compare,
+    histogram_quantile,
+    parse_histograms,
+    parse_server_timing,
+    percentile,
+    synthetic_fixture,
+)
+from benchmarks.mock_upstreams import Latency, create_app
+from functions.vad import trim_silence
+
+NO_DELAY = Latency(0, 0)
+
+
+def test_percentiles_interpolate_between_ranks():
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 99) == 5
+    assert percentile([], 90) is None
+
+
+def test_server_timing_header_is_parsed():
+    assert parse_server_timing("upload;dur=1.2, stt;dur=340.5, cache") == {"upload": 1.2, "stt": 340.5}
+    assert parse_server_timing(None) == {}
+
+
+def test_histogram_quantiles_from_metrics_text():
+    text = "\n".join([
+        'voice_stage_duration_seconds_bucket{mode="buffered",stage="stt",le="0.1"} 2',
+        'voice_stage_duration_seconds_bucket{mode="buffered",stage="stt",le="1.0"} 4',
+        'voice_stage_duration_seconds_bucket{mode="buffered",stage="stt",le="+Inf"} 4',
+        'voice_other_bucket{le="1.0"} 9',
+    ])
+    histograms = parse_histograms(text)
+    assert list(histograms) == [("voice_stage_duration_seconds", (("mode", "buffered"), ("stage", "stt")))]
+    buckets = next(iter(histograms.values()))
+    assert histogram_quantile(0.5, buckets) == 0.1
+    assert histogram_quantile(0.75, buckets) == 0.55
+
+
+def test_regressions_are_reported_beyond_the_tolerance():
+    def level(p90, rps):
+        return {"concurrency": 4, "total_ms": {"p90": p90}, "throughput_rps": rps}
+
+    baseline = {"levels": [level(1000, 2.0)]}
+    assert compare({"levels": [level(1100, 1.9)]}, baseline, tolerance=0.2) == []
+    assert len(compare({"levels": [level(1300, 1.5)]}, baseline, tolerance=0.2)) == 2
+
+
+def test_synthetic_fixture_is_deterministic_speech():
+    name, data = synthetic_fixture(seconds=2.0)
+    assert name == "synthetic-2s.wav"
+    assert synthetic_fixture(seconds=2.0)[1] == data
+    with wave.open(io.BytesIO(data)) as f:
+        pcm = np.frombuffer(f.readframes(f.getnframes()), "<i2").astype(np.float32) / 32768.0
+    trimmed, _ = trim_silence(pcm, record=False)
+    assert trimmed is not None
+
+
+def test_mock_groq_reports_and_enforces_rate_limits():
+    mock = TestClient(create_app(NO_DELAY, NO_DELAY, NO_DELAY, NO_DELAY, rpm_limit=1))
+    body = {"model": "test", "messages": [{"role": "user", "content": "hello"}]}
+    first = mock.post("/chat/completions", json=body)
+    assert first.status_code == 200
+    assert first.headers["x-ratelimit-limit-requests"] == "1"
+    second = mock.post("/chat/completions", json=body)
+    assert second.status_code == 429
+    assert int(second.headers["retry-after"]) >= 1
+
+
+def test_mock_elevenlabs_rejects_formats_like_the_real_api():
+    mock = TestClient(create_app(NO_DELAY, NO_DELAY, NO_DELAY, NO_DELAY, reject_formats=("opus_48000_32",)))
+    rejected = mock.post("/text-to-speech/voice/stream?output_format=opus_48000_32", json={"text": "Hi there."})
+    assert rejected.status_code == 403
+    assert "output_format_not_allowed" in rejected.text
+    accepted = mock.post("/text-to-speech/voice/stream?output_format=opus_48000_64", json={"text": "Hi there."})
+    assert accepted.content.startswith(b"OggS")
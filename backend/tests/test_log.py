@@ -0,0 +1,66 @@
+# test_log.py - Structured log records: JSON fields, request ids, truncation and the non-blocking queue
+
+import json
+import logging
+import pathlib
+import queue
+import re
+import sys
+
+from functions.log import DroppingQueueHandler, JsonFormatter, RequestIdFilter, request_id_var, truncate
+
+
+def record(msg, *args, exc_info=None, **extra):
+    entry = logging.LogRecord("voice.test", logging.INFO, __file__, 1, msg, args, exc_info)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_json_records_carry_the_request_id_and_extra_fields():
+    token = request_id_var.set("abc123")
+    try:
+        entry = record("Reply ready in %dms", 42, session_id="s1")
+        RequestIdFilter().filter(entry)
+    finally:
+        request_id_var.reset(token)
+
+    logged = json.loads(JsonFormatter().format(entry))
+    assert logged["msg"] == "Reply ready in 42ms"
+    assert logged["request_id"] == "abc123"
+    assert logged["session_id"] == "s1"
+    assert logged["level"] == "info"
+
+
+def test_long_fields_are_truncated():
+    assert truncate("x" * 10, limit=4) == "xxxx… (10 chars)"
+    assert truncate(12345, limit=2) == 12345
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(record("first"))
+    handler.handle(record("second"))
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == "first"
+
+
+def test_arguments_and_tracebacks_are_resolved_when_queued():
+    handler = DroppingQueueHandler(queue.Queue())
+    values = ["before"]
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        handler.handle(record("value is %s", values, exc_info=sys.exc_info()))
+    values[0] = "after"
+
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "value is ['before']"
+    assert queued.args is None and queued.exc_info is None
+    assert "ValueError: boom" in queued.exc_text
+
+
+def test_server_code_logs_instead_of_printing():
+    backend = pathlib.Path(__file__).resolve().parent.parent
+    sources = [backend / "main.py", *sorted((backend / "functions").glob("*.py"))]
+    printing = [path.name for path in sources if re.search(r"^\s*print\(", path.read_text(encoding="utf-8"), re.MULTILINE)]
+    assert printing == []
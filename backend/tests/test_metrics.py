@@ -0,0 +1,55 @@
+# test_metrics.py - Prometheus text rendering and per-stage turn timings
+
+from functions.metrics import Counter, Gauge, Histogram, Registry
+from functions.timings import TurnTimer
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("voice_test_seconds", "Test", buckets=(0.1, 1.0), labelnames=("stage",))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage="stt")
+    assert list(histogram.samples()) == [
+        'voice_test_seconds_bucket{stage="stt",le="0.1"} 1',
+        'voice_test_seconds_bucket{stage="stt",le="1.0"} 3',
+        'voice_test_seconds_bucket{stage="stt",le="+Inf"} 4',
+        'voice_test_seconds_sum{stage="stt"} 4.05',
+        'voice_test_seconds_count{stage="stt"} 4',
+    ]
+
+
+def test_registry_renders_help_type_and_escaped_labels():
+    registry = Registry()
+    counter = registry.register(Counter("voice_test_requests", "Requests", labelnames=("path",)))
+    gauge = registry.register(Gauge("voice_test_open", "Open sockets"))
+    counter.inc(path='/say "hi"')
+    counter.inc(2, path='/say "hi"')
+    gauge.set(3)
+    assert registry.render() == (
+        "# HELP voice_test_requests Requests\n"
+        "# TYPE voice_test_requests counter\n"
+        'voice_test_requests_total{path="/say \\"hi\\""} 3\n'
+        "# HELP voice_test_open Open sockets\n"
+        "# TYPE voice_test_open gauge\n"
+        "voice_test_open 3\n"
+    )
+
+
+def test_turn_timer_keeps_first_marks_and_sums_stages():
+    timer = TurnTimer("streamed")
+    timer.mark("first_byte")
+    first = timer.marks["first_byte"]
+    timer.mark("first_byte")
+    timer.add("tts", 10.0)
+    timer.add("tts", 5.0)
+    assert timer.marks["first_byte"] == first
+    assert timer.as_dict()["durations_ms"] == {"tts": 15.0}
+    assert timer.server_timing() == "tts;dur=15.0"
+
+
+def test_metrics_endpoint_reports_turn_stages(client):
+    client.post("/post-audio/?stream=false&session_id=metrics", files={"file": ("clip.webm", b"encoded audio", "audio/webm")})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'voice_stage_duration_seconds_count{mode="buffered",stage="stt"}' in response.text
+    assert 'voice_turns_total{mode="buffered"}' in response.text
@@ -0,0 +1,124 @@
+# test_persistence.py - Write-behind queue ordering and read-through
+
+import threading
+import time
+
+from functions.persistence import WriteBehindQueue
+
+
+class Store:
+    """In-memory stand-in for the message store, numbered like the real one"""
+
+    def __init__(self):
+        self.messages = {}
+        self.events = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write_batch(self, turns):
+        self.release.wait(5)
+        for session_id, request_message, response_message, _, _ in turns:
+            stored = self.messages.setdefault(session_id, [])
+            for role, content in (("user", request_message), ("assistant", response_message)):
+                stored.append({"role": role, "content": content, "turn": len(stored) + 1, "tokens": 1})
+            self.events.append(("write", session_id, request_message))
+        return {session_id: len(self.messages[session_id]) for session_id, *_ in turns}
+
+    def reset(self, session_id):
+        self.messages.pop(session_id, None)
+        self.events.append(("reset", session_id))
+
+    def read(self, session_id):
+        return lambda: list(self.messages.get(session_id, ()))
+
+
+def test_queued_turns_are_readable_before_they_are_written():
+    store = Store()
+    store.release.clear()
+    writer = WriteBehindQueue(store.write_batch, store.reset, flush_interval=0.01)
+    writer.enqueue("a", "one", "reply one", 1, 1)
+    writer.enqueue("a", "two", "reply two", 1, 1)
+
+    messages = writer.read_through("a", store.read("a"))
+    assert [message["content"] for message in messages] == ["one", "reply one", "two", "reply two"]
+    assert [message["turn"] for message in messages] == [1, 2, 3, 4]
+
+    store.release.set()
+    writer.drain()
+    assert writer.read_through("a", store.read("a")) == store.messages["a"]
+    assert writer.stats()["pending_turns"] == 0
+
+
+def test_reset_is_applied_after_the_writes_queued_before_it():
+    store = Store()
+    writer = WriteBehindQueue(store.write_batch, store.reset, flush_interval=0.01)
+    writer.enqueue("a", "before", "reply", 1, 1)
+    writer.reset("a")
+    writer.enqueue("a", "after", "reply", 1, 1)
+    writer.drain()
+
+    assert store.events == [("write", "a", "before"), ("reset", "a"), ("write", "a", "after")]
+    assert [message["content"] for message in store.messages["a"]] == ["after", "reply"]
+
+
+def test_failed_writes_are_retried():
+    store = Store()
+    failures = iter([RuntimeError("disk full")])
+
+    def flaky_write(turns):
+        error = next(failures, None)
+        if error:
+            raise error
+        return store.write_batch(turns)
+
+    writer = WriteBehindQueue(flaky_write, store.reset, flush_interval=0.01)
+    writer.enqueue("a", "one", "reply", 1, 1)
+    writer.drain()
+    assert writer.stats()["failures"] == 1
+    assert writer.stats()["turns_written"] == 1
+
+
+def test_turn_written_during_a_read_is_not_returned_twice():
+    store = Store()
+    store.release.clear()
+    writer = WriteBehindQueue(store.write_batch, store.reset, flush_interval=0.01)
+    writer.enqueue("a", "one", "reply one", 1, 1)
+
+    def read_after_the_write():
+        # The queued turn was snapshotted as pending; the write lands before the store is read
+        store.release.set()
+        while writer.stats()["pending_turns"]:
+            time.sleep(0.001)
+        return list(store.messages["a"])
+
+    messages = writer.read_through("a", read_after_the_write)
+    assert [message["turn"] for message in messages] == [1, 2]
+    writer.drain()
+
+
+def test_reads_are_not_blocked_by_a_slow_write():
+    store = Store()
+    store.release.clear()
+    writer = WriteBehindQueue(store.write_batch, store.reset, flush_interval=0.01)
+    writer.enqueue("a", "one", "reply", 1, 1)
+    queued = writer._pending["a"][0]
+    while not queued.writing:
+        time.sleep(0.001)
+
+    # Another session reads while the batch is still being written
+    assert writer.read_through("b", store.read("b")) == []
+    store.release.set()
+    writer.drain()
+
+
+def test_dropped_turns_leave_no_pending_entries():
+    store = Store()
+
+    def failing_write(turns):
+        raise RuntimeError("disk full")
+
+    writer = WriteBehindQueue(failing_write, store.reset, flush_interval=0.01, max_retries=1)
+    writer.enqueue("a", "one", "reply", 1, 1)
+    writer.drain()
+    assert writer.stats()["turns_dropped"] == 1
+    assert dict(writer._pending) == {}
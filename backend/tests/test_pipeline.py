@@ -0,0 +1,158 @@
+# test_pipeline.py - Streaming replies: sentences for TTS, lookahead, and which turns are stored
+
+import asyncio
+
+from benchmarks.mock_upstreams import MP3_FRAME
+from functions import pipeline
+from functions.audio_formats import SOURCE_FORMAT
+from functions.database import get_recent_messages
+from functions.grouq_api import CONNECTION_ERROR_REPLY
+from functions.pipeline import iter_sentences
+from functions.timings import TurnTimer
+
+SENTENCES = [f"This is sentence number {n} of the reply. " for n in range(6)]
+
+
+def sentences(deltas, min_chars=20):
+    async def stream():
+        for delta in deltas:
+            yield delta
+
+    async def collect():
+        return [sentence async for sentence in iter_sentences(stream(), min_chars)]
+
+    return asyncio.run(collect())
+
+
+def test_splits_on_sentence_ends_across_deltas():
+    deltas = ["That sounds gre", "at, Noufal. Are you looking", " for a family car? Or some", "thing sporty"]
+    assert sentences(deltas) == ["That sounds great, Noufal.", "Are you looking for a family car?", "Or something sporty"]
+
+
+def test_short_fragments_join_the_next_sentence():
+    assert sentences(["Sure. ", "I can book that test drive for you. ", "Ok."]) == [
+        "Sure. I can book that test drive for you.",
+        "Ok.",
+    ]
+
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert sentences(['He said "it is a lovely house." Then he left. '], min_chars=5) == [
+        'He said "it is a lovely house."',
+        "Then he left.",
+    ]
+
+
+def test_empty_stream():
+    assert sentences([]) == []
+    assert sentences(["  "]) == []
+
+
+class FakeSpeech:
+    """stream_text_to_speech stand-in that tracks how many sentences are synthesized at once"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, text, audio_format=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            if text == self.fail_on:
+                raise RuntimeError("TTS unavailable")
+            yield text.encode()
+        finally:
+            self.active -= 1
+
+
+def chat(*deltas, error=None):
+    async def stream_chat_response(message_input, session_id):
+        for delta in deltas:
+            yield delta
+        if error:
+            raise error
+
+    return stream_chat_response
+
+
+def reply_turn(monkeypatch, stream_chat_response, speech, keep=None):
+    """Run stream_reply_audio, reading `keep` chunks (all by default); returns (chunks, on_complete calls)"""
+    monkeypatch.setattr(pipeline, "stream_chat_response", stream_chat_response)
+    monkeypatch.setattr(pipeline, "stream_text_to_speech", speech)
+    completed = []
+
+    async def turn():
+        chunks = pipeline.stream_reply_audio(
+            "hello", TurnTimer("streamed"), "pipeline", on_complete=completed.append, audio_format=SOURCE_FORMAT
+        )
+        received = []
+        try:
+            async for chunk in chunks:
+                received.append(chunk)
+                if len(received) == keep:
+                    break
+        finally:
+            await chunks.aclose()
+        return received
+
+    return asyncio.run(turn()), completed
+
+
+def test_reply_is_spoken_in_order_with_bounded_lookahead(monkeypatch):
+    speech = FakeSpeech()
+    received, completed = reply_turn(monkeypatch, chat(*SENTENCES), speech)
+    assert received == [sentence.strip().encode() for sentence in SENTENCES]
+    assert speech.peak == pipeline.TTS_SENTENCES_IN_FLIGHT
+    assert completed == [" ".join(sentence.strip() for sentence in SENTENCES)]
+
+
+def test_canned_reply_is_spoken_but_not_completed(monkeypatch):
+    received, completed = reply_turn(monkeypatch, chat(CONNECTION_ERROR_REPLY), FakeSpeech())
+    assert received == [CONNECTION_ERROR_REPLY.encode()]
+    assert completed == []
+
+
+def test_reply_cut_off_by_an_error_is_not_completed(monkeypatch):
+    received, completed = reply_turn(monkeypatch, chat(*SENTENCES[:2], error=RuntimeError("stream reset")), FakeSpeech())
+    assert len(received) == 2
+    assert completed == []
+
+
+def test_failed_sentence_synthesis_is_not_completed(monkeypatch):
+    received, completed = reply_turn(monkeypatch, chat(*SENTENCES), FakeSpeech(fail_on=SENTENCES[1].strip()))
+    assert len(received) == len(SENTENCES) - 1
+    assert completed == []
+
+
+def test_client_that_goes_away_is_not_completed(monkeypatch):
+    received, completed = reply_turn(monkeypatch, chat(*SENTENCES), FakeSpeech(), keep=1)
+    assert len(received) == 1
+    assert completed == []
+
+
+def test_streamed_turn_returns_audio_and_stores_the_turn(client):
+    response = client.post(
+        "/post-audio/?stream=true&session_id=streamed",
+        files={"file": ("clip.webm", b"encoded audio", "audio/webm")},
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(MP3_FRAME[:4])
+    assert get_recent_messages("streamed")[-1]["role"] == "assistant"
+
+
+def test_canned_buffered_reply_is_not_stored(client, monkeypatch):
+    import main
+
+    async def unavailable(message_input, session_id):
+        return CONNECTION_ERROR_REPLY
+
+    monkeypatch.setattr(main, "get_chat_response", unavailable)
+    response = client.post(
+        "/post-audio/?stream=false&session_id=canned",
+        files={"file": ("clip.webm", b"encoded audio", "audio/webm")},
+    )
+    assert response.status_code == 200
+    assert [message["role"] for message in get_recent_messages("canned")] == ["system"]
@@ -0,0 +1,41 @@
+# test_post_audio_get.py - /post-audio-get/ answers each request from its own in-memory buffer
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_upstreams import _fake_audio
+from functions.audio_formats import SOURCE_FORMAT
+from functions.database import get_recent_messages
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stored_clip(client):
+    """Id of a reply recorded by an earlier turn, used as the input recording"""
+    response = client.post(
+        "/post-audio/?stream=false&session_id=get-source",
+        files={"file": ("clip.webm", b"encoded audio", "audio/webm")},
+    )
+    return response.headers["x-audio-id"]
+
+
+def test_concurrent_requests_get_their_own_reply(client):
+    source = stored_clip(client)
+    sessions = [f"get-{index}" for index in range(4)]
+
+    def turn(session_id):
+        return client.get(f"/post-audio-get/?audio_id={source}&session_id={session_id}")
+
+    with ThreadPoolExecutor(len(sessions)) as pool:
+        responses = list(pool.map(turn, sessions))
+
+    for session_id, response in zip(sessions, responses):
+        assert response.status_code == 200
+        reply = get_recent_messages(session_id)[-1]["content"]
+        assert response.content == _fake_audio(reply, SOURCE_FORMAT.elevenlabs)
+    # Nothing is written next to the server for others to pick up
+    assert not os.path.exists(os.path.join(BACKEND_DIR, "voice.mp3"))
+
+
+def test_unknown_source_audio_is_not_found(client):
+    assert client.get("/post-audio-get/?audio_id=" + "0" * 64 + ".mp3").status_code == 404
@@ -0,0 +1,57 @@
+# test_prompt.py - Byte-stable prompt prefix and prefix reuse statistics
+
+from functions import database
+from functions.prompt import STYLE_VARIANTS, PrefixStats, system_message
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+def test_system_prompt_is_pinned_per_session():
+    assert system_message("a") == system_message("a")
+    prompts = {system_message(f"session-{index}")["content"] for index in range(20)}
+    # Different sessions still get different styles
+    assert len(prompts) == len(STYLE_VARIANTS)
+
+
+def test_history_prefix_is_identical_across_turns():
+    session = "prompt-prefix"
+    database.store_messages("first question", "first answer", session)
+    before = database.get_recent_messages(session)
+    database.store_messages("second question", "second answer", session)
+    after = database.get_recent_messages(session)
+    assert after[:len(before)] == before
+
+
+def test_prefix_stats_count_reused_messages():
+    stats = PrefixStats()
+    system = system_message("s")
+    stats.observe_prompt("s", [system, user("hi")])
+    stats.observe_prompt("s", [system, user("hi"), assistant("hello"), user("cars?")])
+    stats.observe_prompt("s", [system, user("changed"), assistant("hello"), user("again")])
+    result = stats.stats()
+    assert result["requests"] == 3
+    # Second prompt reuses the whole first one; the third only the system prompt
+    assert result["full_prefix_hits"] == 1
+    assert result["reused_message_ratio"] == round((0 + 2 + 1) / (1 + 3 + 3), 3)
+
+
+def test_provider_cached_tokens_are_summed():
+    stats = PrefixStats()
+    stats.observe_usage({"prompt_tokens": 100, "prompt_tokens_details": {"cached_tokens": 80}})
+    stats.observe_usage({"prompt_tokens": 50})
+    result = stats.stats()
+    assert (result["provider_reports"], result["cached_tokens"], result["cached_token_ratio"]) == (1, 80, 0.533)
+
+
+def test_evicted_sessions_start_over():
+    stats = PrefixStats(max_sessions=1)
+    stats.observe_prompt("a", [system_message("a"), user("hi")])
+    stats.observe_prompt("b", [system_message("b"), user("hi")])
+    stats.observe_prompt("a", [system_message("a"), user("hi"), assistant("hello"), user("more")])
+    assert stats.stats()["full_prefix_hits"] == 0
@@ -0,0 +1,87 @@
+# test_rate_limit.py - Groq reset headers, the token bucket and the request scheduler
+
+import asyncio
+import time
+
+import pytest
+
+from functions.rate_limit import Bucket, RateLimited, RateLimiter, parse_duration
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("250ms", 0.25),
+    ("1h", 3600.0),
+    ("12", 12.0),
+])
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", ["", None, "soon"])
+def test_unparseable_durations(value):
+    assert parse_duration(value) is None
+
+
+def test_bucket_refills_over_time():
+    bucket = Bucket("requests", 60, window=60.0)
+    now = bucket.updated
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1.0) == 0.0
+
+
+def test_bucket_waits_for_a_full_bucket_at_most():
+    bucket = Bucket("tokens", 100, window=60.0)
+    now = bucket.updated
+    assert bucket.wait_time(500, now) == 0.0
+
+
+def test_headers_correct_the_budget_and_refill_rate():
+    bucket = Bucket("tokens", 6000)
+    now = bucket.updated
+    bucket.update(limit=6000, remaining=0, reset_seconds=10.0, now=now)
+    assert bucket.rate == pytest.approx(600.0)
+    assert bucket.wait_time(300, now) == pytest.approx(0.5)
+
+
+def test_block_holds_until_it_expires_and_ignores_stale_headers():
+    bucket = Bucket("requests", 30)
+    now = bucket.updated
+    bucket.block(5.0, now)
+    bucket.update(limit=30, remaining=30, reset_seconds=None, now=now + 1)
+    assert bucket.wait_time(1, now + 1) == pytest.approx(4.0)
+    assert bucket.wait_time(1, now + 5) == 0.0
+
+
+def test_calls_queue_for_budget_and_give_up_past_the_deadline():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=100000)
+    limiter.buckets["requests"].remaining = 1.0
+
+    async def run():
+        now = time.monotonic()
+        await limiter.acquire(10, now + 1)
+        # The next request slot is 0.1 s away at 600 rpm
+        await limiter.acquire(10, now + 1)
+        with pytest.raises(RateLimited):
+            await limiter.acquire(10, time.monotonic() + 0.01)
+
+    asyncio.run(run())
+    assert (limiter.requests, limiter.queued, limiter.gave_up) == (2, 1, 1)
+
+
+def test_background_work_only_takes_free_budget():
+    limiter = RateLimiter(requests_per_minute=30, tokens_per_minute=1000)
+    assert limiter.try_acquire(900)
+    assert not limiter.try_acquire(900)
+
+
+def test_429_blocks_the_exhausted_bucket():
+    limiter = RateLimiter(requests_per_minute=30, tokens_per_minute=6000)
+    delay = limiter.on_rate_limited({"retry-after": "2", "x-ratelimit-remaining-tokens": "0"}, attempt=0)
+    assert delay >= 2
+    stats = limiter.stats()
+    assert stats["status"] == "limited"
+    assert limiter.buckets["tokens"].blocked_until > time.monotonic()
+    assert limiter.buckets["requests"].blocked_until <= time.monotonic()
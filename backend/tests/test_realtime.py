@@ -0,0 +1,125 @@
+# test_realtime.py - WebSocket conversations: framing, endpointing and turn events
+
+import json
+
+import numpy as np
+import pytest
+
+import functions.realtime as realtime
+from benchmarks.mock_upstreams import MP3_FRAME
+from conftest import speech_clip
+from functions.audio_io import SAMPLE_RATE
+from functions.database import get_recent_messages
+from functions.realtime import Endpointer, LinearResampler, Utterance, speech_ended
+from functions.vad import EnergyVAD
+
+
+def pcm16(audio):
+    return (audio * 32767).astype("<i2").tobytes()
+
+
+def receive_turn(ws):
+    """Events (without partials) and reply audio up to the end of the turn"""
+    events, audio = [], b""
+    while not events or events[-1]["type"] not in ("reply_end", "error") and events[-1] != {"type": "final", "text": ""}:
+        message = ws.receive()
+        if message.get("text") is not None:
+            event = json.loads(message["text"])
+            if event["type"] != "partial":
+                events.append(event)
+        else:
+            audio += message["bytes"]
+    return events, audio
+
+
+@pytest.mark.parametrize("sample_rate", [8000, 22050, 44100, 48000])
+def test_resampling_in_frames_matches_the_whole_buffer(sample_rate):
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, sample_rate * 2).astype(np.float32)
+    whole = LinearResampler(sample_rate)(audio)
+
+    resample = LinearResampler(sample_rate)
+    framed = np.concatenate([resample(audio[start:start + 1103]) for start in range(0, len(audio), 1103)])
+    assert np.array_equal(framed, whole)
+    # No drift: two seconds in, two seconds out
+    assert abs(len(framed) - 2 * SAMPLE_RATE) <= 1
+
+
+def test_utterance_resamples_frames_to_16k():
+    utterance = Utterance("pcm16", 48000)
+    tone = speech_clip(1.0)
+    resampled_tone = np.interp(np.arange(len(tone) * 3) / 3, np.arange(len(tone)), tone).astype(np.float32)
+    data = pcm16(resampled_tone)
+    for start in range(0, len(data), 960):
+        utterance.add(data[start:start + 960])
+    assert utterance.seconds() == pytest.approx(1.5, abs=1 / SAMPLE_RATE)
+    assert np.allclose(utterance.pcm()[:-1], tone[:len(utterance.pcm()) - 1], atol=1e-3)
+
+
+def test_endpointer_agrees_with_speech_ended():
+    vad = EnergyVAD()
+    audio = np.concatenate([speech_clip(1.0), np.zeros(SAMPLE_RATE, dtype=np.float32)])
+    endpointer = Endpointer(vad)
+    for end in range(1600, len(audio) + 1, 1600):
+        ended = endpointer.add(audio[end - 1600:end])
+        assert ended == speech_ended(audio[:end], vad)
+    assert ended
+
+
+def test_websocket_turn(client):
+    with client.websocket_connect("/ws/converse?session_id=socket") as ws:
+        assert ws.receive_json()["type"] == "ready"
+
+        ws.send_text(json.dumps({"type": "start", "sample_rate": "fast"}))
+        assert ws.receive_json()["type"] == "error"
+
+        ws.send_text(json.dumps({"type": "start", "format": "pcm16", "sample_rate": 16000}))
+        data = pcm16(speech_clip())
+        for offset in range(0, len(data), 3200):
+            ws.send_bytes(data[offset:offset + 3200])
+        ws.send_text(json.dumps({"type": "end"}))
+        events, audio = receive_turn(ws)
+
+    assert [event["type"] for event in events] == ["final", "reply_start", "reply_end"]
+    assert events[0]["text"].startswith("I heard")
+    assert audio.startswith(MP3_FRAME[:4])
+    # The streamed reply is recorded for replay
+    assert client.get(f"/audio/{events[-1]['audio_id']}").content == audio
+
+
+def test_websocket_stays_open_for_the_next_turn(client):
+    data = pcm16(speech_clip(seconds=1.0))
+    with client.websocket_connect("/ws/converse?session_id=socket-2") as ws:
+        ws.receive_json()
+        # Both utterances are sent before the first reply is read; replies come back in order
+        for _ in range(2):
+            ws.send_bytes(data)
+            ws.send_text(json.dumps({"type": "end"}))
+        finals = []
+        while finals.count("reply_end") < 2:
+            message = ws.receive()
+            if message.get("text") is not None:
+                event = json.loads(message["text"])
+                if event["type"] in ("final", "reply_end"):
+                    finals.append(event["type"])
+    assert finals == ["final", "reply_end", "final", "reply_end"]
+    assert [message["role"] for message in get_recent_messages("socket-2")[1:]] == ["user", "assistant"] * 2
+
+
+def test_silence_gives_an_empty_final(client):
+    with client.websocket_connect("/ws/converse?session_id=socket-silence") as ws:
+        ws.receive_json()
+        ws.send_bytes(pcm16(np.zeros(SAMPLE_RATE, dtype=np.float32)))
+        ws.send_text(json.dumps({"type": "end"}))
+        events, _ = receive_turn(ws)
+    assert events == [{"type": "final", "text": ""}]
+
+
+def test_failed_transcription_is_reported_as_an_error(client, monkeypatch):
+    monkeypatch.setattr(realtime, "convert_audio_to_text", lambda audio: None)
+    with client.websocket_connect("/ws/converse?session_id=socket-failed") as ws:
+        ws.receive_json()
+        ws.send_bytes(pcm16(speech_clip(1.0)))
+        ws.send_text(json.dumps({"type": "end"}))
+        events, _ = receive_turn(ws)
+    assert [event["type"] for event in events] == ["error"]
+    assert [message["role"] for message in get_recent_messages("socket-failed")] == ["system"]
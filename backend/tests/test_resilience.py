@@ -0,0 +1,123 @@
+# test_resilience.py - Circuit breakers and hedged upstream calls
+
+import asyncio
+
+import pytest
+
+import functions.resilience as resilience
+from functions.resilience import CircuitBreaker, CircuitOpen, HedgedCall
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, open_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.short_circuited == 1
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def call(hedged, attempt, **kwargs):
+    return asyncio.run(hedged.call(attempt, **kwargs))
+
+
+def test_open_circuit_short_circuits_calls():
+    hedged = HedgedCall("test-open", "call", hedge=False)
+    hedged.breaker = CircuitBreaker("test-open", failure_threshold=1, open_seconds=60)
+
+    async def failing():
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        call(hedged, failing)
+    with pytest.raises(CircuitOpen):
+        call(hedged, failing)
+
+
+def test_passthrough_errors_do_not_count_as_failures():
+    hedged = HedgedCall("test-passthrough", "call", hedge=False)
+    hedged.breaker = CircuitBreaker("test-passthrough", failure_threshold=1, open_seconds=60)
+
+    async def rate_limited():
+        raise LookupError("429")
+
+    with pytest.raises(LookupError):
+        call(hedged, rate_limited, passthrough=(LookupError,))
+    assert hedged.breaker.state == "closed"
+
+
+def test_slow_call_is_hedged_and_the_faster_attempt_wins(monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY_MS", 10)
+    monkeypatch.setattr(resilience, "HEDGE_MAX_RATIO", 1.0)
+    hedged = HedgedCall("test-hedge", "call", hedge=True)
+    hedged.latencies.append(0.01)
+    delays = iter([1.0, 0.0])
+    cancelled = []
+
+    async def attempt():
+        delay = next(delays)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    assert call(hedged, attempt) == 0.0
+    assert (hedged.hedged, hedged.hedge_wins) == (1, 1)
+    assert cancelled == [1.0]
+
+
+def test_hedging_can_be_vetoed(monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY_MS", 10)
+    hedged = HedgedCall("test-veto", "call", hedge=True)
+    hedged.latencies.append(0.01)
+
+    async def attempt():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    assert call(hedged, attempt, may_hedge=lambda: False) == "done"
+    assert hedged.hedged == 0
+
+
+def test_stream_is_hedged_on_time_to_first_item(monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY_MS", 10)
+    monkeypatch.setattr(resilience, "HEDGE_MAX_RATIO", 1.0)
+    hedged = HedgedCall("test-stream", "stream", hedge=True)
+    hedged.latencies.append(0.01)
+    first_delays = iter([1.0, 0.0])
+
+    async def open_attempt():
+        delay = next(first_delays)
+        await asyncio.sleep(delay)
+        for index in range(3):
+            yield (delay, index)
+
+    async def collect():
+        return [item async for item in hedged.stream(open_attempt)]
+
+    # Every item comes from the attempt that answered first
+    assert asyncio.run(collect()) == [(0.0, 0), (0.0, 1), (0.0, 2)]
+    assert hedged.hedge_wins == 1
@@ -0,0 +1,52 @@
+# test_session_store.py - Per-session SQLite store: WAL mode, turn numbers, isolated sessions
+
+import threading
+
+from functions.database import is_valid_session_id
+from functions.session_store import SQLiteConversationStore
+
+
+def test_store_runs_in_wal_mode(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    assert store._writer.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.close()
+
+
+def test_turns_are_numbered_per_session(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    store.append_turns([("a", "hi", "hello", 1, 1), ("b", "hey", "hi there", 1, 2), ("a", "bye", "see you", 1, 2)])
+    assert [(m["turn"], m["role"], m["content"]) for m in store.recent_messages("a", 10)] == [
+        (1, "user", "hi"), (2, "assistant", "hello"), (3, "user", "bye"), (4, "assistant", "see you"),
+    ]
+    assert [m["turn"] for m in store.recent_messages("a", 2)] == [3, 4]
+    assert store.recent_messages("b", 10)[-1]["tokens"] == 2
+    store.close()
+
+
+def test_reset_only_clears_its_own_session(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    store.append_turns([("a", "hi", "hello", 1, 1), ("b", "hey", "hi there", 1, 2)])
+    store.save_summary("a", "greetings", 2)
+    store.reset("a")
+    assert store.recent_messages("a", 10) == []
+    assert store.get_summary("a") is None
+    assert len(store.recent_messages("b", 10)) == 2
+    store.close()
+
+
+def test_readers_on_other_threads_see_committed_turns(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    store.append_turns([("a", "hi", "hello", 1, 1)])
+    seen = []
+    reader = threading.Thread(target=lambda: seen.extend(store.recent_messages("a", 10)))
+    reader.start()
+    reader.join()
+    assert [m["content"] for m in seen] == ["hi", "hello"]
+    store.close()
+
+
+def test_session_ids_are_short_and_url_safe():
+    assert is_valid_session_id("tab-1_A")
+    assert not is_valid_session_id("../etc")
+    assert not is_valid_session_id("")
+    assert not is_valid_session_id("x" * 65)
@@ -0,0 +1,67 @@
+# test_startup.py - Background model warm-up: liveness, readiness and turning audio away until ready
+
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import functions.grouq_api as grouq_api
+
+UPLOAD = {"file": ("clip.webm", b"encoded audio", "audio/webm")}
+
+
+def test_liveness_does_not_wait_for_the_model(client, monkeypatch):
+    monkeypatch.setattr(grouq_api, "stt_state", "loading")
+    assert client.get("/healthz").json() == {"status": "ok"}
+
+
+def test_readyz_reports_the_loaded_backend(client):
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["stt"]["backend"] == "stub"
+
+
+def test_audio_waits_while_the_model_loads(client, monkeypatch):
+    monkeypatch.setattr(grouq_api, "stt_state", "warming")
+    assert client.get("/readyz").status_code == 503
+    assert client.get("/readyz").json()["status"] == "warming"
+
+    response = client.post("/post-audio/", files=UPLOAD)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws/converse") as ws:
+            ws.receive_json()
+    assert closed.value.code == 1013
+
+
+def test_failed_model_is_not_worth_retrying(client, monkeypatch):
+    monkeypatch.setattr(grouq_api, "stt_state", "failed")
+    response = client.post("/post-audio/", files=UPLOAD)
+    assert response.status_code == 503
+    assert "retry-after" not in response.headers
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws/converse") as ws:
+            ws.receive_json()
+    assert closed.value.code == 1011
+
+
+def test_load_is_retried_then_marked_failed(monkeypatch):
+    attempts = []
+
+    async def failing_load():
+        attempts.append(grouq_api.stt_load_attempts)
+        return False
+
+    monkeypatch.setattr(grouq_api, "_load_and_warm_up", failing_load)
+    monkeypatch.setattr(grouq_api, "STT_LOAD_RETRIES", 2)
+    monkeypatch.setattr(grouq_api, "STT_LOAD_RETRY_SECONDS", 0.001)
+    monkeypatch.setattr(grouq_api, "stt_load_attempts", 0)
+    monkeypatch.setattr(grouq_api, "stt_state", "cold")
+
+    assert asyncio.run(grouq_api.warm_up_stt()) is False
+    assert attempts == [1, 2, 3]
+    assert grouq_api.is_stt_failed()
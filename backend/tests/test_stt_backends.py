@@ -0,0 +1,78 @@
+# test_stt_backends.py - STT backend selection, option mapping and per-thread models
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import functions.grouq_api as grouq_api
+from functions.stt_backends import FasterWhisperBackend, OpenAIWhisperBackend, create_backend
+
+
+class Recorder:
+    """Stands in for a loaded model, remembering how it was called"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def transcribe(self, audio, **kwargs):
+        self.calls.append(kwargs)
+        return self.result
+
+
+def test_backends_are_created_by_name_without_loading():
+    backend = create_backend("faster-whisper", model_size="tiny", compute_type="int8")
+    assert isinstance(backend, FasterWhisperBackend)
+    assert backend.capabilities()["compute_type"] == "int8"
+    assert backend.capabilities()["loaded"] is False
+    assert isinstance(create_backend("openai-whisper"), OpenAIWhisperBackend)
+
+
+def test_unknown_backend_names_the_choices():
+    with pytest.raises(ValueError, match="openai-whisper, faster-whisper"):
+        create_backend("whisper.cpp")
+
+
+def test_faster_whisper_joins_lazy_segments():
+    backend = FasterWhisperBackend()
+    segments = iter([SimpleNamespace(text=" Hello"), SimpleNamespace(text=" there.")])
+    backend.model = Recorder((segments, None))
+    assert backend.transcribe(np.zeros(16000, dtype=np.float32), {"language": "en", "beam_size": 0}) == "Hello there."
+    assert backend.model.calls == [{"language": "en", "beam_size": 1, "initial_prompt": None}]
+
+
+def test_openai_whisper_only_passes_beam_size_for_beam_search():
+    backend = OpenAIWhisperBackend()
+    backend.model = Recorder({"text": " Hi. "})
+    assert backend.transcribe(np.zeros(16000, dtype=np.float32)) == "Hi."
+    backend.transcribe(np.zeros(16000, dtype=np.float32), {"beam_size": 5})
+    assert "beam_size" not in backend.model.calls[0]
+    assert backend.model.calls[1]["beam_size"] == 5
+    assert all(call["fp16"] is False for call in backend.model.calls)
+
+
+def test_thread_unsafe_backends_get_a_model_per_thread(monkeypatch):
+    loaded = OpenAIWhisperBackend()
+    monkeypatch.setattr(grouq_api, "stt_backend", loaded)
+    monkeypatch.setattr(grouq_api, "_model_claimed", False)
+    monkeypatch.setattr(grouq_api, "_thread_state", threading.local())
+    monkeypatch.setattr(grouq_api, "create_backend", lambda: SimpleNamespace(load=OpenAIWhisperBackend))
+
+    models = []
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: models.append((grouq_api._get_thread_model(), grouq_api._get_thread_model())))
+        thread.start()
+        thread.join()
+
+    # The first thread reuses the model loaded at startup; each thread keeps its own
+    assert models[0] == (loaded, loaded)
+    assert models[1][0] is models[1][1]
+    assert models[1][0] is not loaded
+
+
+def test_thread_safe_backends_are_shared(monkeypatch):
+    shared = FasterWhisperBackend()
+    monkeypatch.setattr(grouq_api, "stt_backend", shared)
+    assert grouq_api._get_thread_model() is shared
@@ -0,0 +1,53 @@
+# test_stt_benchmark.py - STT benchmark scoring and the shared fixture corpus
+
+import glob
+import os
+
+import numpy as np
+
+from benchmarks.stt_backends import (
+    AUDIO_EXTENSIONS,
+    FIXTURES_DIR,
+    LONG_CLIP_GAP_SECONDS,
+    build_long_fixture,
+    compare,
+    normalize,
+    word_errors,
+)
+from functions.audio_io import SAMPLE_RATE
+
+
+def test_word_errors_count_edits_after_normalizing():
+    assert normalize("Hello, World!  It's me.") == "hello world its me"
+    assert word_errors("Hello world", "hello, world.") == (0, 2)
+    # One substitution, one deletion, one insertion
+    assert word_errors("the quick red fox jumps", "the quick brown fox") == (2, 4)
+    assert word_errors("a b c", "a x b c") == (1, 4)
+
+
+def test_every_fixture_has_a_transcript():
+    clips = [path for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*"))) if path.endswith(AUDIO_EXTENSIONS)]
+    assert clips
+    for path in clips:
+        with open(os.path.splitext(path)[0] + ".txt", encoding="utf-8") as f:
+            transcript = f.read().strip()
+        assert transcript and transcript == normalize(transcript), path
+
+
+def test_long_fixture_joins_clips_and_transcripts():
+    fixtures = [
+        {"pcm": np.zeros(SAMPLE_RATE, dtype=np.float32), "reference": "one"},
+        {"pcm": np.zeros(2 * SAMPLE_RATE, dtype=np.float32), "reference": "two"},
+    ]
+    long = build_long_fixture(fixtures, min_seconds=5)
+    assert long["category"] == "long"
+    assert long["reference"] == "one two one"
+    assert len(long["pcm"]) == int((4 + 3 * LONG_CLIP_GAP_SECONDS) * SAMPLE_RATE)
+
+
+def test_regressions_cover_speed_memory_and_accuracy():
+    baseline = {"results": [{"backend": "faster-whisper", "rtf": 0.1, "load_s": 2.0, "peak_rss_mb": 500, "wer": 0.05}]}
+    same = {"results": [{"backend": "faster-whisper", "rtf": 0.105, "load_s": 2.0, "peak_rss_mb": 510, "wer": 0.06}]}
+    worse = {"results": [{"backend": "faster-whisper", "rtf": 0.2, "load_s": 2.0, "peak_rss_mb": 900, "wer": 0.2}]}
+    assert compare(same, baseline, tolerance=0.2, wer_tolerance=0.02) == []
+    assert len(compare(worse, baseline, tolerance=0.2, wer_tolerance=0.02)) == 3
@@ -0,0 +1,73 @@
+# test_stt_cache.py - Transcript cache with single-flight deduplication
+
+import asyncio
+
+from functions.stt_cache import TranscriptionCache, transcription_key
+
+
+def test_key_covers_the_audio_engine_and_options():
+    key = transcription_key(b"audio", "faster-whisper:base", {"language": None, "beam_size": 1})
+    assert transcription_key(b"audio", "faster-whisper:base", {"beam_size": 1, "language": None}) == key
+    assert transcription_key(b"audio!", "faster-whisper:base", {"language": None, "beam_size": 1}) != key
+    assert transcription_key(b"audio", "openai-whisper:base", {"language": None, "beam_size": 1}) != key
+    assert transcription_key(b"audio", "faster-whisper:base", {"language": "en", "beam_size": 1}) != key
+
+
+def test_concurrent_requests_share_one_transcription():
+    cache = TranscriptionCache(max_entries=4)
+    calls = []
+
+    async def transcribe():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "hello"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_transcribe("key", transcribe) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["hello"] * 5
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced) == (1, 4)
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    cache = TranscriptionCache(max_entries=4)
+
+    async def transcribe():
+        await asyncio.sleep(0.02)
+        return "hello"
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_transcribe("key", transcribe))
+        second = asyncio.ensure_future(cache.get_or_transcribe("key", transcribe))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "hello"
+
+
+def test_failures_are_not_cached():
+    cache = TranscriptionCache(max_entries=4)
+    results = iter([None, "hello"])
+
+    async def transcribe():
+        return next(results)
+
+    async def run():
+        return [await cache.get_or_transcribe("key", transcribe) for _ in range(3)]
+
+    assert asyncio.run(run()) == [None, "hello", "hello"]
+    assert cache.hits == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TranscriptionCache(max_entries=2)
+
+    async def run():
+        for key in ("a", "b", "a", "c"):
+            await cache.get_or_transcribe(key, lambda key=key: asyncio.sleep(0, result=key))
+
+    asyncio.run(run())
+    assert list(cache._items) == ["a", "c"]
+    assert cache.evictions == 1
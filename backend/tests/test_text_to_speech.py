@@ -0,0 +1,39 @@
+# test_text_to_speech.py - ElevenLabs audio forwarded chunk by chunk as it streams in
+
+import asyncio
+
+import pytest
+
+import functions.http_clients as http_clients
+import functions.text_to_speech as text_to_speech
+from benchmarks.mock_upstreams import _fake_audio
+from functions.audio_formats import SOURCE_FORMAT
+
+
+@pytest.fixture
+def clients(monkeypatch, mock_upstreams):
+    """Fresh upstream clients for this test's event loop"""
+    monkeypatch.setattr(http_clients, "_clients", {})
+
+
+def stream(message):
+    async def collect():
+        try:
+            return [chunk async for chunk in text_to_speech.stream_text_to_speech(message, SOURCE_FORMAT)]
+        finally:
+            await http_clients.shutdown_clients()
+
+    return asyncio.run(collect())
+
+
+def test_audio_is_forwarded_in_chunks(clients):
+    message = "Streaming this sentence should take several chunks to deliver."
+    chunks = stream(message)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= text_to_speech.STREAM_CHUNK_SIZE for chunk in chunks)
+    assert b"".join(chunks) == _fake_audio(message, SOURCE_FORMAT.elevenlabs)
+
+
+def test_missing_api_key_gives_an_empty_stream(clients, monkeypatch):
+    monkeypatch.setattr(text_to_speech, "ELEVEN_LABS_API_KEY", None)
+    assert stream("Nothing will be synthesized for this one.") == []
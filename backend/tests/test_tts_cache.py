@@ -0,0 +1,67 @@
+# test_tts_cache.py - Content-addressed speech cache: keys, size-bounded eviction, the disk tier
+
+import os
+import time
+
+from functions.tts_cache import TTSCache, MemoryTier, cache_key
+
+SETTINGS = {"stability": 0, "similarity_boost": 0}
+
+
+def test_key_covers_everything_that_changes_the_audio():
+    key = cache_key("Hello there.", "voice", SETTINGS, "mp3_44100_128")
+    assert cache_key(" Hello there. ", "voice", SETTINGS, "mp3_44100_128") == key
+    assert cache_key("Hello there!", "voice", SETTINGS, "mp3_44100_128") != key
+    assert cache_key("Hello there.", "other", SETTINGS, "mp3_44100_128") != key
+    assert cache_key("Hello there.", "voice", {**SETTINGS, "stability": 1}, "mp3_44100_128") != key
+    assert cache_key("Hello there.", "voice", SETTINGS, "opus_48000_64") != key
+
+
+def test_memory_tier_evicts_least_recently_used():
+    memory = MemoryTier(max_bytes=10)
+    memory.put("a", b"aaaa")
+    memory.put("b", b"bbbb")
+    memory.get("a")
+    memory.put("c", b"cccc")
+    assert memory.get("b") is None
+    assert memory.get("a") == b"aaaa"
+    assert memory.bytes == 8
+    assert memory.evictions == 1
+
+    memory.put("huge", bytes(11))
+    assert memory.get("huge") is None
+
+
+def test_disk_tier_survives_a_restart_and_refills_memory(tmp_path):
+    cache = TTSCache(1024, str(tmp_path), 1024, ttl_seconds=3600)
+    cache.put("k" * 64, b"audio", "ogg")
+    assert os.path.exists(tmp_path / f"{'k' * 64}.ogg")
+
+    reopened = TTSCache(1024, str(tmp_path), 1024, ttl_seconds=3600)
+    assert reopened.get("k" * 64) == b"audio"
+    assert reopened.get("k" * 64) == b"audio"
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_disk_tier_evicts_over_budget_and_expired_entries(tmp_path):
+    cache = TTSCache(0, str(tmp_path), 10, ttl_seconds=3600)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.put("c", b"cccc")
+    assert cache.get("a") is None
+    assert cache.get("c") == b"cccc"
+    assert cache.stats()["disk_bytes"] == 8
+
+    expiring = TTSCache(0, str(tmp_path / "ttl"), 1024, ttl_seconds=1)
+    expiring.put("old", b"data")
+    expiring.disk._index["old"] = (4, time.time() - 2, "mp3")
+    assert expiring.get("old") is None
+    assert not os.path.exists(tmp_path / "ttl" / "old.mp3")
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = TTSCache(1024, str(tmp_path), 1024, ttl_seconds=3600, enabled=False)
+    cache.put("a", b"audio")
+    assert cache.get("a") is None
+    assert not cache.serves_files
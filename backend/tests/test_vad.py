@@ -0,0 +1,46 @@
+# test_vad.py - Energy VAD: silence trimming and rejecting clips without speech
+
+import numpy as np
+import pytest
+
+from conftest import speech_clip
+from functions.audio_io import SAMPLE_RATE
+from functions.vad import VAD_PADDING_MS, EnergyVAD, trim_silence, vad_stats
+
+
+def test_leading_and_trailing_silence_is_trimmed_to_the_padding():
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    clip = np.concatenate([silence, speech_clip(1.0), silence])
+    trimmed, saved = trim_silence(clip, record=False)
+    # The tone plus at most a frame and the padding on each side
+    assert 1.0 <= len(trimmed) / SAMPLE_RATE <= 1.0 + 2 * (VAD_PADDING_MS + 30) / 1000
+    assert saved == len(clip) / SAMPLE_RATE - len(trimmed) / SAMPLE_RATE
+
+
+def test_clip_without_speech_is_rejected():
+    rng = np.random.default_rng(0)
+    hiss = (0.001 * rng.standard_normal(2 * SAMPLE_RATE)).astype(np.float32)
+    trimmed, saved = trim_silence(hiss, record=False)
+    assert trimmed is None
+    assert saved == 2.0
+
+
+def test_quiet_fricatives_count_as_speech():
+    rng = np.random.default_rng(0)
+    frames = 50
+    clip = np.zeros(frames * 480, dtype=np.float32)
+    clip[:480 * 10] = 0.3 * np.sin(2 * np.pi * 180 * np.arange(480 * 10) / SAMPLE_RATE)
+    # A noisy "s": well under the voiced threshold, but with a high zero-crossing rate
+    clip[480 * 10:480 * 20] = 0.02 * rng.standard_normal(480 * 10)
+    _, speech = EnergyVAD(frame_ms=30).speech_frames(clip)
+    assert speech[:20].all()
+    assert not speech[20:].any()
+
+
+def test_stats_record_the_seconds_saved():
+    before = vad_stats.as_dict()
+    trim_silence(speech_clip(1.0))
+    after = vad_stats.as_dict()
+    assert after["clips"] == before["clips"] + 1
+    assert after["seconds_in"] - before["seconds_in"] == pytest.approx(1.5)
+    assert after["seconds_saved"] >= before["seconds_saved"]
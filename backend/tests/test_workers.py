@@ -0,0 +1,50 @@
+# test_workers.py - Per-stage worker pools and their counters
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from functions.log import request_id_var
+from functions.workers import PoolSaturated, StagePool
+
+
+@pytest.fixture
+def pool():
+    pool = StagePool("test", max_workers=1, queue_limit=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_failed_jobs_are_not_counted_as_completed(pool):
+    assert pool.submit(sum, [1, 2]).result() == 3
+    with pytest.raises(ZeroDivisionError):
+        pool.submit(lambda: 1 / 0).result()
+    stats = pool.stats()
+    assert (stats["completed"], stats["failed"], stats["active"], stats["queued"]) == (1, 1, 0, 0)
+
+
+def test_full_queue_rejects_new_jobs(pool):
+    release = threading.Event()
+    running = pool.submit(release.wait, 5)
+    while pool.stats()["active"] == 0:
+        time.sleep(0.001)
+    # One job running and one waiting: the queue limit of 1 is reached
+    waiting = pool.submit(lambda: None)
+    with pytest.raises(PoolSaturated):
+        pool.submit(lambda: None)
+    release.set()
+    running.result()
+    waiting.result()
+    assert pool.stats()["rejected"] == 1
+
+
+def test_run_in_stage_carries_the_request_id():
+    from functions.workers import run_in_stage
+
+    async def run():
+        request_id_var.set("abc123")
+        return await run_in_stage("io", request_id_var.get)
+
+    assert asyncio.run(run()) == "abc123"
@@ -8,6 +8,8 @@ function Controller() {
 
   const [isLoading, setIsLoading] = useState(false);
   const [messages, setMessages] = useState<any[]>([]);
+  // One conversation per browser tab
+  const [sessionId] = useState(() => crypto.randomUUID());
 
   const createBlobUrl = (data: any) => {
     const blob = new Blob([data], { type: 'audio/mpeg' });
@@ -35,6 +37,7 @@ function Controller() {
         //send from data to API endpoint
         await axios.post("http://localhost:8000/post-audio", formData, {
           headers: { "Content-Type": "audio/mpeg" }, 
+          params: { session_id: sessionId },
           responseType: "arraybuffer"
         })
         .then((res: any) => {
@@ -63,7 +66,7 @@ function Controller() {
   
   return (
     <div className="h-screen overflow-y-hidden">
-      <Title setMessages={setMessages} />
+      <Title setMessages={setMessages} sessionId={sessionId} />
       <div className="flex flex-col justify-between h-full overflow-scroll pb-96">
 
         {/*Conversation */}
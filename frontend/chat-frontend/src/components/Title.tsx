@@ -3,10 +3,11 @@ import axios from "axios"
 
 type Props = {
     setMessages: any;
+    sessionId: string;
 }
 
 
-function Title({setMessages}: Props) {
+function Title({setMessages, sessionId}: Props) {
     const [isResetting, setResetting] = useState(false);
 
     // Reset the conversation 
@@ -14,7 +15,7 @@ function Title({setMessages}: Props) {
         setResetting(true);
 
         await axios
-            .get("http://localhost:8000/reset")
+            .get("http://localhost:8000/reset", { params: { session_id: sessionId } })
             .then ((res) => {
                 if (res.status === 200) {  
                     alert(res.data);       